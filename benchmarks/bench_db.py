@@ -0,0 +1,300 @@
+# benchmarks/bench_db.py
+"""
+Suite de microbenchmarks de tgdl.core.db a escala realista.
+
+Por cada escala siembra N filas de queue y events (más N/20 de progress y N/2 de
+queue_history) y mide las rutas calientes: db_add, db_get_due, db_update_progress
+(+ volcado), db_get_queue, db_list, /retry y /purge. Después lanza procesos
+lectores y escritores en paralelo contra la misma DB (WAL) durante unos segundos.
+El resultado sale en JSON para comparar entre versiones.
+
+Uso:
+    python -m benchmarks.bench_db [--rows 10000,100000,1000000] [--out res.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from tgdl.core import db as dbmod
+
+_CHUNK = 50_000
+
+
+# ---------- Siembra ----------
+def _seed(path: Path, n: int) -> float:
+    """Inserta en bloque (SQL directo, transacciones de _CHUNK filas) y devuelve segundos."""
+    t0 = time.perf_counter()
+    now = datetime.now().astimezone()
+    now_iso = now.isoformat()
+    past, future = now - timedelta(hours=1), now + timedelta(hours=8)
+    running = n // 20
+    due = n // 10  # el resto de 'queued' está programado para la ventana nocturna
+    base = n // 2  # ids 1..base: trabajos ya archivados en queue_history
+
+    def queue_rows(lo: int, hi: int):
+        for i in range(lo, hi):
+            url = f"https://h{i % 97}.example.com/seed/{i}.bin"
+            status = "running" if i < running else "queued"
+            when = past if i < running + due else future
+            yield (
+                base + i + 1,
+                "url",
+                json.dumps({"url": url}),
+                status,
+                when.isoformat(),
+                dbmod._sched_ms(when),
+                now_iso,
+                now_iso,
+                url,
+                i % 3,
+            )
+
+    def history_rows(lo: int, hi: int):
+        for i in range(lo, hi):
+            url = f"https://h{i % 97}.example.com/old/{i}.bin"
+            status = "error" if i % 10 == 0 else "done"
+            yield (i + 1, "url", json.dumps({"url": url}), status, now_iso, now_iso, now_iso, url)
+
+    def event_rows(lo: int, hi: int):
+        for i in range(lo, hi):
+            payload = {"kind": "url", "outcome": "done", "bytes": 1 << 20, "duration_ms": 900}
+            yield (1 + i % max(1, n), now_iso, "job_end", json.dumps(payload))
+
+    def progress_rows(lo: int, hi: int):
+        for i in range(lo, hi):
+            yield (base + i + 1, 1 << 30, (i * 4096) % (1 << 30), now_iso, 2e6, 60)
+
+    plan: list[tuple[str, Callable[[int, int], Any], int]] = [
+        (
+            "INSERT INTO queue(id, kind, payload, status, scheduled_at, scheduled_ms, "
+            "created_at, updated_at, canon_key, priority) VALUES (?,?,?,?,?,?,?,?,?,?)",
+            queue_rows,
+            n,
+        ),
+        (
+            "INSERT INTO progress(qid, total, downloaded, updated_at, speed, eta_sec) "
+            "VALUES (?,?,?,?,?,?)",
+            progress_rows,
+            running,
+        ),
+        (
+            "INSERT INTO queue_history(id, kind, payload, status, scheduled_at, created_at, "
+            "finished_at, canon_key) VALUES (?,?,?,?,?,?,?,?)",
+            history_rows,
+            base,
+        ),
+        ("INSERT INTO events(qid, ts, type, payload) VALUES (?,?,?,?)", event_rows, n),
+    ]
+    with dbmod._writer(path) as conn:
+        for sql, rows, total in plan:
+            for lo in range(0, total, _CHUNK):
+                conn.execute("BEGIN")
+                conn.executemany(sql, rows(lo, min(total, lo + _CHUNK)))
+                conn.execute("COMMIT")
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    return time.perf_counter() - t0
+
+
+# ---------- Medición ----------
+def _stats(samples_ns: list[int]) -> dict[str, float]:
+    if not samples_ns:
+        return {"n": 0}
+    s = sorted(samples_ns)
+
+    def pct(p: float) -> float:
+        return s[min(len(s) - 1, int(len(s) * p))] / 1000
+
+    return {
+        "n": len(s),
+        "mean_us": sum(s) / len(s) / 1000,
+        "p50_us": pct(0.50),
+        "p95_us": pct(0.95),
+        "p99_us": pct(0.99),
+        "max_us": s[-1] / 1000,
+    }
+
+
+def _measure(fn: Callable[[int], object], calls: int, budget_sec: float) -> dict[str, float]:
+    """Hasta `calls` llamadas o `budget_sec` segundos, lo que llegue antes."""
+    samples = []
+    deadline = time.perf_counter() + budget_sec
+    for i in range(calls):
+        t0 = time.perf_counter_ns()
+        fn(i)
+        samples.append(time.perf_counter_ns() - t0)
+        if time.perf_counter() > deadline:
+            break
+    return _stats(samples)
+
+
+def _once(fn: Callable[[], int]) -> dict[str, float]:
+    t0 = time.perf_counter_ns()
+    affected = fn()
+    return {**_stats([time.perf_counter_ns() - t0]), "rows": affected}
+
+
+def _single_process(n: int, calls: int, budget: float) -> dict[str, dict[str, float]]:
+    now = datetime.now().astimezone()
+    base, running = n // 2, max(1, n // 20)
+    ops: dict[str, dict[str, float]] = {}
+    ops["db_add"] = _measure(
+        lambda i: dbmod.db_add("url", {"url": f"https://bench.example.com/add/{i}"}, now),
+        calls,
+        budget,
+    )
+    ops["db_get_due"] = _measure(lambda i: dbmod.db_get_due(now), calls, budget)
+    ops["db_update_progress"] = _measure(
+        lambda i: dbmod.db_update_progress(base + 1 + i % running, 1 << 30, i * 65536),
+        calls,
+        budget,
+    )
+
+    def flush(i: int) -> None:
+        for k in range(100):
+            dbmod.db_update_progress(base + 1 + (i * 100 + k) % running, 1 << 30, i * 65536 + k)
+        dbmod.db_flush_progress()
+
+    ops["db_flush_progress[100]"] = _measure(flush, calls, budget)
+    ops["db_get_queue"] = _measure(lambda i: dbmod.db_get_queue(200), calls, budget)
+    ops["db_list"] = _measure(lambda i: dbmod.db_list(50), calls, budget)
+    # Destructivas: una sola pasada, al final
+    ops["db_retry_errors"] = _once(dbmod.db_retry_errors)
+    ops["db_purge_finished"] = _once(dbmod.db_purge_finished)
+    return ops
+
+
+# ---------- Concurrencia entre procesos ----------
+def _proc(role: str, path: str, idx: int, start, duration: float, out) -> None:
+    dbmod.settings.DB_PATH = Path(path)
+    now = datetime.now().astimezone()
+    samples: list[int] = []
+    errors = 0
+    start.wait()
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter_ns()
+        try:
+            if role == "reader":
+                if i % 2:
+                    dbmod.db_get_queue(50)
+                else:
+                    dbmod.db_get_progress_rows(100)
+            else:
+                qid = dbmod.db_add("url", {"url": f"https://bench.example.com/w{idx}/{i}"}, now)
+                dbmod.db_update_progress(qid, 1 << 20, i)
+                dbmod.db_flush_progress()
+        except sqlite3.OperationalError:
+            errors += 1
+        samples.append(time.perf_counter_ns() - t0)
+        i += 1
+    dbmod.db_close()
+    out.put((role, samples, errors))
+
+
+def _concurrent(path: Path, readers: int, writers: int, duration: float) -> dict[str, Any]:
+    ctx = mp.get_context("spawn")
+    start, out = ctx.Event(), ctx.Queue()
+    roles = ["reader"] * readers + ["writer"] * writers
+    procs = [
+        ctx.Process(target=_proc, args=(r, str(path), i, start, duration, out))
+        for i, r in enumerate(roles)
+    ]
+    for p in procs:
+        p.start()
+    time.sleep(0.5)  # arranque de los intérpretes hijos
+    start.set()
+    got = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    res: dict[str, Any] = {"readers": readers, "writers": writers, "duration_sec": duration}
+    for role in ("reader", "writer"):
+        samples = [s for r, ss, _ in got if r == role for s in ss]
+        res[role] = {
+            **_stats(samples),
+            "ops_per_sec": len(samples) / duration,
+            "errors": sum(e for r, _, e in got if r == role),
+        }
+    return res
+
+
+def _run_scale(n: int, args: argparse.Namespace) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as td:
+        path = Path(td) / "bench.db"
+        dbmod.settings.DB_PATH = path
+        dbmod.db_init(path)
+        seed_sec = _seed(path, n)
+        res: dict[str, Any] = {
+            "rows": n,
+            "seed_sec": seed_sec,
+            "db_bytes": path.stat().st_size,
+            "ops": _single_process(n, args.calls, args.budget),
+        }
+        dbmod.db_close()
+        if args.readers or args.writers:
+            res["concurrent"] = _concurrent(path, args.readers, args.writers, args.duration)
+        return res
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser("bench_db")
+    ap.add_argument("--rows", default="10000,100000,1000000", help="escalas separadas por comas")
+    ap.add_argument("--calls", type=int, default=200, help="llamadas por operación")
+    ap.add_argument("--budget", type=float, default=5.0, help="segundos máx. por operación")
+    ap.add_argument("--readers", type=int, default=4)
+    ap.add_argument("--writers", type=int, default=2)
+    ap.add_argument("--duration", type=float, default=5.0, help="segundos de la fase concurrente")
+    ap.add_argument("--out", type=Path, default=None, help="fichero JSON (por defecto stdout)")
+    args = ap.parse_args()
+
+    report: dict[str, Any] = {
+        "meta": {
+            "time": datetime.now().astimezone().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "calls": args.calls,
+        },
+        "scales": [],
+    }
+    for n in (int(x) for x in args.rows.split(",") if x.strip()):
+        r = _run_scale(n, args)
+        report["scales"].append(r)
+        print(f"rows={n}: seed {r['seed_sec']:.1f}s", file=sys.stderr)
+        for name, s in r["ops"].items():
+            print(
+                f"  {name:<24}{s['p50_us']:>12.1f} us p50{s['p99_us']:>12.1f} us p99",
+                file=sys.stderr,
+            )
+        for role in ("reader", "writer"):
+            c = r.get("concurrent", {}).get(role)
+            if c and c["n"]:
+                print(
+                    f"  {role + ' x' + str(r['concurrent'][role + 's']):<24}"
+                    f"{c['ops_per_sec']:>12.0f} op/s{c['p99_us']:>12.1f} us p99",
+                    file=sys.stderr,
+                )
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+# benchmarks/bench_db_pool.py
+"""
+Microbenchmark: latencia por llamada de los helpers de DB
+con conexión nueva por llamada (modelo anterior) vs pool persistente.
+
+Uso:
+    python -m benchmarks.bench_db_pool [--calls 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+
+from tgdl.core import db as dbmod
+
+
+def _legacy_update_progress(path: Path, qid: int, total: int, downloaded: int) -> None:
+    # Réplica del patrón anterior: connect + 3 PRAGMAs + query + close
+    conn = dbmod._connect(path)
+    try:
+        conn.execute(
+            "INSERT INTO progress(qid,total,downloaded,updated_at) VALUES (?,?,?,?) "
+            "ON CONFLICT(qid) DO UPDATE SET total=excluded.total, "
+            "downloaded=excluded.downloaded, updated_at=excluded.updated_at",
+            (qid, total, downloaded, dbmod._iso_now()),
+        )
+    finally:
+        conn.close()
+
+
+def _legacy_get_flag(path: Path, key: str) -> str | None:
+    conn = dbmod._connect(path)
+    try:
+        row = conn.execute("SELECT v FROM kv WHERE k=?", (key,)).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def _pooled_update_progress(path: Path, qid: int, total: int, downloaded: int) -> None:
+    with dbmod._writer(path) as conn:
+        conn.execute(
+            "INSERT INTO progress(qid,total,downloaded,updated_at) VALUES (?,?,?,?) "
+            "ON CONFLICT(qid) DO UPDATE SET total=excluded.total, "
+            "downloaded=excluded.downloaded, updated_at=excluded.updated_at",
+            (qid, total, downloaded, dbmod._iso_now()),
+        )
+
+
+def _pooled_get_flag(path: Path, key: str) -> str | None:
+    with dbmod._reader(path) as conn:
+        row = conn.execute("SELECT v FROM kv WHERE k=?", (key,)).fetchone()
+        return row[0] if row else None
+
+
+def _measure(fn: Callable[[int], object], calls: int) -> dict[str, float]:
+    samples = []
+    for i in range(calls):
+        t0 = time.perf_counter_ns()
+        fn(i)
+        samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    return {
+        "mean_us": statistics.fmean(samples) / 1000,
+        "p50_us": samples[len(samples) // 2] / 1000,
+        "p99_us": samples[int(len(samples) * 0.99) - 1] / 1000,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser("bench_db_pool")
+    ap.add_argument("--calls", type=int, default=2000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as td:
+        path = Path(td) / "bench.db"
+        dbmod.db_init(path)
+        with dbmod._writer(path) as conn:
+            conn.execute(
+                "INSERT INTO queue(kind,payload,status,scheduled_at,created_at,updated_at) "
+                "VALUES ('url','{}','running',?,?,?)",
+                (datetime.now().isoformat(),) * 3,
+            )
+            conn.execute("INSERT INTO kv(k,v) VALUES ('PAUSED','0')")
+
+        cases = {
+            "update_progress/legacy": lambda i: _legacy_update_progress(path, 1, 10**9, i),
+            "update_progress/pooled": lambda i: _pooled_update_progress(path, 1, 10**9, i),
+            "get_flag/legacy": lambda i: _legacy_get_flag(path, "PAUSED"),
+            "get_flag/pooled": lambda i: _pooled_get_flag(path, "PAUSED"),
+        }
+        print(f"{'case':<26}{'mean(us)':>12}{'p50(us)':>12}{'p99(us)':>12}")
+        for name, fn in cases.items():
+            r = _measure(fn, args.calls)
+            print(f"{name:<26}{r['mean_us']:>12.1f}{r['p50_us']:>12.1f}{r['p99_us']:>12.1f}")
+        dbmod.db_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,57 @@
+# benchmarks/bench_enqueue.py
+"""
+Benchmark de encolado: N llamadas a db_add (una transacción cada una)
+frente a un único db_add_many (todos los INSERT en una transacción).
+
+Uso:
+    python -m benchmarks.bench_enqueue [--items 10000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from tgdl.core import db as dbmod
+
+
+def _items(n: int, tag: str) -> list[dbmod.EnqueueItem]:
+    now = datetime.now().astimezone()
+    return [("url", {"url": f"https://example.com/{tag}/{i}.bin"}, now) for i in range(n)]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser("bench_enqueue")
+    ap.add_argument("--items", type=int, default=10_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as td:
+        path = Path(td) / "bench.db"
+        dbmod.settings.DB_PATH = path
+        dbmod.db_init(path)
+
+        t0 = time.perf_counter()
+        for kind, payload, sched in _items(args.items, "single"):
+            dbmod.db_add(kind, payload, sched)
+        single = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        res = dbmod.db_add_many(_items(args.items, "bulk"))
+        bulk = time.perf_counter() - t0
+        assert len(res) == args.items and all(created for _, created in res)
+
+        print(f"{'case':<16}{'total(s)':>12}{'per item(us)':>16}{'items/s':>12}")
+        for name, secs in (("db_add x N", single), ("db_add_many", bulk)):
+            print(
+                f"{name:<16}{secs:>12.3f}{secs / args.items * 1e6:>16.1f}{args.items / secs:>12.0f}"
+            )
+        print(f"speedup: {single / bulk:.1f}x")
+        dbmod.db_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,14 @@
+# tests/conftest.py
+import pytest
+
+from tgdl.core import db as dbmod
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """DB SQLite aislada por test (pool incluido)."""
+    path = tmp_path / "queue.db"
+    monkeypatch.setattr(dbmod.settings, "DB_PATH", path, raising=False)
+    dbmod.db_init(path)
+    yield path
+    dbmod.db_close()
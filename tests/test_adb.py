@@ -0,0 +1,44 @@
+# tests/test_adb.py
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from tgdl.core import adb
+from tgdl.core import db as dbmod
+
+
+@pytest.mark.asyncio
+async def test_writes_run_off_loop_in_order(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    ids = await asyncio.gather(
+        *(adb.db_add("url", {"url": f"https://e.x/{i}"}, past) for i in range(10))
+    )
+    assert ids == sorted(ids)
+    rows, _ = await adb.db_list_page(limit=50)
+    assert {r["id"] for r in rows} == set(ids)
+
+    seen: list[str] = []
+    await adb.write(lambda: seen.append(threading.current_thread().name))
+    assert seen[0].startswith("tgdl-db-write")
+
+
+@pytest.mark.asyncio
+async def test_loop_stays_responsive_while_db_is_locked(tmp_db):
+    # Otro proceso (simulado con una conexión aparte) retiene el lock de escritura
+    other = sqlite3.connect(tmp_db, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        task = asyncio.create_task(adb.db_set_flag("PAUSED", "1"))
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert ticks == 5 and not task.done()
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    await task
+    assert dbmod.db_get_flag("PAUSED") == "1"
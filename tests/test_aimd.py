@@ -0,0 +1,69 @@
+# tests/test_aimd.py
+from datetime import datetime
+
+from tgdl.core import db as dbmod
+from tgdl.core.aimd import AimdController, Sample, is_throttle
+
+
+def _step(ctl, limits, **samples):
+    out = ctl.step(limits, samples)
+    for d in out:
+        limits[d.backend] = d.new
+    return [(d.backend, d.old, d.new) for d in out]
+
+
+def test_additive_increase_while_it_pays_off():
+    ctl = AimdController({"aria2": (1, 4)}, hold=2)
+    limits = {"aria2": 2}
+    assert _step(ctl, limits, aria2=Sample(throughput=100, running=2)) == [("aria2", 2, 3)]
+    assert _step(ctl, limits, aria2=Sample(throughput=150, running=3)) == [("aria2", 3, 4)]
+    # Sin mejora tras la subida: se deshace y se espera antes de volver a probar
+    assert _step(ctl, limits, aria2=Sample(throughput=151, running=4)) == [("aria2", 4, 3)]
+    assert _step(ctl, limits, aria2=Sample(throughput=150, running=3)) == []
+    assert _step(ctl, limits, aria2=Sample(throughput=150, running=3)) == []
+    assert _step(ctl, limits, aria2=Sample(throughput=150, running=3)) == [("aria2", 3, 4)]
+    # Con huecos libres no tiene sentido subir
+    ctl2 = AimdController({"aria2": (1, 4)})
+    assert _step(ctl2, {"aria2": 2}, aria2=Sample(throughput=100, running=1)) == []
+
+
+def test_multiplicative_decrease_on_throttling_and_errors():
+    ctl = AimdController({"ytdlp": (1, 8), "aria2": (2, 8)}, error_rate=0.25)
+    limits = {"ytdlp": 6, "aria2": 8}
+    out = _step(
+        ctl,
+        limits,
+        ytdlp=Sample(running=6, failed=1, throttled=1),
+        aria2=Sample(running=8, done=2, failed=3),
+    )
+    assert out == [("ytdlp", 6, 3), ("aria2", 8, 4)]
+    assert [d.reason for d in ctl.history] == ["429/flood", "fallos 3/5"]
+    # Nunca por debajo del mínimo; un cupo fuera de límites se recoloca
+    assert _step(ctl, {"aria2": 3}, aria2=Sample(failed=4)) == [("aria2", 3, 2)]
+    assert _step(ctl, {"ytdlp": 20}) == [("ytdlp", 20, 8)]
+    m = ctl.metrics(limits)
+    assert m["backends"]["ytdlp"]["limit"] == 3 and m["backends"]["aria2"]["min"] == 2
+    assert len(m["decisions"]) == 4
+
+
+def test_throttle_markers():
+    assert is_throttle("ERROR: HTTP Error 429: Too Many Requests")
+    assert is_throttle("FloodWaitError: A wait of 30 seconds is required")
+    assert not is_throttle("HTTP Error 404: Not Found") and not is_throttle(None)
+
+
+def test_outcomes_by_backend_since_last_seen(tmp_db):
+    now = datetime.now()
+    _, head = dbmod.db_job_outcomes()
+    yt = dbmod.db_add("url", {"url": "https://youtu.be/dQw4w9WgXcQ"}, now)
+    f = dbmod.db_add("url", {"url": "https://e.x/f.bin"}, now)
+    dbmod.db_claim_due()
+    dbmod.db_update_status(yt, "error", error="HTTP Error 429: Too Many Requests")
+    dbmod.db_update_status(f, "error", error="aria2: timeout", retry=False)
+    ok = dbmod.db_add("url", {"url": "https://e.x/ok.bin"}, now)
+    dbmod.db_update_status(ok, "done")
+
+    out, seen = dbmod.db_job_outcomes(head)
+    assert out["ytdlp"] == {"done": 0, "failed": 1, "throttled": 1}
+    assert out["aria2"] == {"done": 1, "failed": 1, "throttled": 0}
+    assert dbmod.db_job_outcomes(seen)[0]["aria2"]["failed"] == 0
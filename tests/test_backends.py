@@ -0,0 +1,66 @@
+# tests/test_backends.py
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+from tgdl.utils.backends import backend_for
+
+_CASES = [
+    ("tg_link", {"url": "https://t.me/c/1/2"}),
+    ("self_ref", {"chat_id": 1, "message_id": 2}),
+    ("url", {"url": "https://YOUTU.BE/dQw4w9WgXcQ"}),
+    ("url", {"url": "https://www.mediafire.com/file/abc/x.zip/file"}),
+    ("url", {"url": "https://sourceforge.net/projects/x/files/latest/download"}),
+    ("url", {"url": "https://www.youtube.com/watch?v=x&f=y.torrent"}),
+    ("url", {"url": "magnet:?xt=urn:btih:" + "a" * 40}),
+    ("url", {"url": "https://e.x/file.bin"}),
+]
+
+
+def test_backend_column_matches_backend_for(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    ids = [dbmod.db_add(kind, payload, past) for kind, payload in _CASES]
+    with dbmod._reader() as conn:
+        got = dict(conn.execute("SELECT id, backend FROM queue").fetchall())
+    expected = [backend_for(kind, payload) for kind, payload in _CASES]
+    assert [got[i] for i in ids] == expected
+    assert expected == [
+        "telegram",
+        "telegram",
+        "ytdlp",
+        "resolver",
+        "resolver",
+        "aria2",
+        "aria2",
+        "aria2",
+    ]
+
+
+def test_claim_with_slots_per_backend(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    big = [dbmod.db_add("url", {"url": f"https://e.x/{i}.iso"}, past) for i in range(3)]
+    video = dbmod.db_add("url", {"url": "https://youtu.be/abc"}, past)
+    rows = dbmod.db_claim_due(slots={"aria2": 2, "ytdlp": 1, "telegram": 0})
+    assert [r[0] for r in rows] == [*big[:2], video]
+    assert dbmod.db_running_by_backend() == {"telegram": 0, "ytdlp": 1, "aria2": 2, "resolver": 0}
+
+    with dbmod._reader() as conn:
+        plan = " ".join(
+            r[3]
+            for r in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM queue WHERE status='queued' AND backend=? "
+                "ORDER BY priority DESC, id ASC LIMIT 1",
+                ("aria2",),
+            )
+        )
+    assert "idx_queue_backend" in plan and "TEMP B-TREE" not in plan
+
+
+def test_limits_from_settings_and_runtime_overrides(tmp_db, monkeypatch):
+    monkeypatch.setattr(dbmod.settings, "BACKEND_LIMITS", {"aria2": 4, "ytdlp": 2})
+    limits = dbmod.db_backend_limits()
+    assert limits["aria2"] == 4 and limits["ytdlp"] == 2 and limits["resolver"] == 1
+
+    dbmod.db_set_backend_limit("aria2", 0)
+    assert dbmod.db_backend_limits()["aria2"] == 0
+    dbmod.db_set_backend_limit("aria2", None)
+    assert dbmod.db_backend_limits()["aria2"] == 4
@@ -0,0 +1,60 @@
+# tests/test_bandwidth.py
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+from tgdl.adapters.downloaders import ytdlp
+from tgdl.core.bandwidth import BandwidthBudget, TokenBucket, budget_for
+
+MIB = 1024 * 1024
+
+
+def test_budget_follows_time_windows():
+    windows = {"08:00-23:00": 2.5, "23-08": 0}
+    assert budget_for(datetime(2025, 1, 1, 8, 0), windows) == int(2.5 * MIB)
+    assert budget_for(datetime(2025, 1, 1, 22, 59), windows) == int(2.5 * MIB)
+    # Franja que cruza la medianoche con 0: sin límite
+    assert budget_for(datetime(2025, 1, 1, 23, 30), windows) is None
+    assert budget_for(datetime(2025, 1, 1, 3, 0), {"09-17": 1}) is None
+
+
+def test_split_between_backends_and_ytdlp_reservations():
+    bw = BandwidthBudget(floor=100)
+    assert bw.plan(2, 1) == {"aria2": None, "telegram": None}
+    assert bw.reserve_ytdlp(1, 2, 1) is None
+
+    bw.total = 1200
+    assert bw.plan(2, 1) == {"aria2": 800, "telegram": 400}
+    # Un yt-dlp se lleva su parte al arrancar; aria2/Telethon se reparten el resto
+    assert bw.reserve_ytdlp(7, 2, 1) == 300
+    assert bw.plan(2, 1) == {"aria2": 600, "telegram": 300}
+    assert bw.plan(0, 1) == {"aria2": 900, "telegram": 900}
+    bw.release(7)
+    assert bw.plan(3, 0)["aria2"] == 1200
+    # Nunca por debajo del suelo
+    bw.total = 150
+    assert bw.plan(2, 1) == {"aria2": 100, "telegram": 100}
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_consumers():
+    bucket = TokenBucket(10_000)
+    t0 = time.monotonic()
+    # 1 s de ráfaga + 2 KB a 10 KB/s ≈ 0.2 s
+    await asyncio.gather(bucket.consume(6_000), bucket.consume(6_000))
+    assert 0.15 <= time.monotonic() - t0 < 1.0
+    bucket.set_rate(None)
+    t0 = time.monotonic()
+    await bucket.consume(10**9)
+    assert time.monotonic() - t0 < 0.05
+
+
+def test_ytdlp_gets_limit_rate_only_when_budgeted():
+    args = ytdlp._common_args("https://youtu.be/x", "%(title)s.%(ext)s", False, False)
+    assert "--limit-rate" not in args
+    args = ytdlp._common_args(
+        "https://youtu.be/x", "%(title)s.%(ext)s", False, False, limit_rate=524288
+    )
+    assert args[args.index("--limit-rate") + 1] == "524288"
@@ -0,0 +1,59 @@
+# tests/test_canonical.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from tgdl.core import db as dbmod
+from tgdl.utils.canonical import canonical_key, canonical_url
+
+HASH = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+
+
+@pytest.mark.parametrize(
+    "a,b",
+    [
+        ("https://youtu.be/dQw4w9WgXcQ", "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=3"),
+        ("https://youtube.com/shorts/dQw4w9WgXcQ", "https://m.youtube.com/watch?v=dQw4w9WgXcQ"),
+        (
+            f"magnet:?xt=urn:btih:{HASH.upper()}&tr=udp://a",
+            f"magnet:?dn=x&xt=urn:btih:{HASH}&tr=udp://b&tr=udp://c",
+        ),
+        ("https://WWW.Example.com:443/a/b/?x=1&utm_source=t", "https://example.com/a/b?x=1"),
+        ("https://example.com/f?b=2&a=1#frag", "https://example.com/f?a=1&b=2"),
+        ("https://t.me/c/123/45", "https://t.me/c/123/45?single"),
+    ],
+)
+def test_equivalent_urls_share_key(a, b):
+    assert canonical_url(a) == canonical_url(b) is not None
+
+
+def test_keys_distinguish_what_matters():
+    u = "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123"
+    assert canonical_url(u) == "yt:dQw4w9WgXcQ"
+    assert canonical_url(u, allow_playlist=True) == "ytpl:PL123"
+    assert canonical_url("https://example.com/a?x=1") != canonical_url("https://example.com/a?x=2")
+    assert canonical_key("tg_link", {"url": "https://t.me/c/123/45"}) == canonical_key(
+        "tg_ref", {"chat_id": -100123, "message_id": 45}
+    )
+    assert canonical_key("self_ref", {"chat_id": 1, "message_id": 2}) is None
+
+
+def test_enqueue_returns_existing_job_unless_forced(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    a, created = dbmod.db_enqueue("url", {"url": "https://youtu.be/dQw4w9WgXcQ"}, past)
+    assert created
+    b, created = dbmod.db_enqueue(
+        "url", {"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ"}, past
+    )
+    assert (b, created) == (a, False)
+
+    # Un error no bloquea reintentar enviando el enlace de nuevo
+    dbmod.db_claim_due()
+    dbmod.db_update_status(a, "error", retry=False)
+    c, created = dbmod.db_enqueue("url", {"url": "https://youtu.be/dQw4w9WgXcQ"}, past)
+    assert created and c != a
+    # Un 'done' (ya en queue_history) sí cuenta como duplicado
+    dbmod.db_update_status(c, "done")
+    assert dbmod.db_add("url", {"url": "https://youtu.be/dQw4w9WgXcQ"}, past) == c
+    d, created = dbmod.db_enqueue("url", {"url": "https://youtu.be/dQw4w9WgXcQ"}, past, force=True)
+    assert created and d not in (a, c)
@@ -0,0 +1,37 @@
+# tests/test_db_bulk.py
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+
+
+def test_add_many_single_tx_ids_and_dedup(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    first = dbmod.db_add("url", {"url": "https://example.com/a"}, past)
+    items = [
+        ("url", {"url": "https://example.com/a/"}, past),  # ya existe
+        ("url", {"url": "https://example.com/b"}, past),
+        ("self_ref", {"chat_id": 1, "message_id": 2}, past),  # sin clave
+        ("url", {"url": "https://www.example.com/b"}, past),  # repetido en el lote
+    ]
+    res = dbmod.db_add_many(items)
+    assert res[0] == (first, False)
+    assert res[1][1] and res[2][1]
+    assert res[3] == (res[1][0], False)
+    rows, _ = dbmod.db_list_page(limit=10)
+    assert sorted(r["id"] for r in rows) == sorted({first, res[1][0], res[2][0]})
+    assert dbmod.db_add_many([]) == []
+    forced = dbmod.db_add_many(items, force=True)
+    assert all(created for _, created in forced)
+    assert len({qid for qid, _ in forced}) == 4
+
+
+def test_add_many_ids_point_at_their_own_rows(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    urls = [f"https://example.com/{i}.bin" for i in range(5)]
+    res = dbmod.db_add_many([("url", {"url": u}, past) for u in urls])
+    with dbmod._reader() as conn:
+        got = {
+            qid: conn.execute("SELECT url FROM queue WHERE id=?", (qid,)).fetchone()[0]
+            for qid, _ in res
+        }
+    assert [got[qid] for qid, _ in res] == urls
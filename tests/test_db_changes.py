@@ -0,0 +1,58 @@
+# tests/test_db_changes.py
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+
+
+def _add(n: int) -> list[int]:
+    past = datetime.now() - timedelta(minutes=1)
+    return [dbmod.db_add("url", {"url": f"https://e.x/{i}"}, past) for i in range(n)]
+
+
+def test_changes_follow_queue_and_progress_mutations(tmp_db):
+    head0 = dbmod.db_changes_head()
+    a, b = _add(2)
+    changes, seq, reset = dbmod.db_changes_since(head0)
+    assert not reset
+    assert [(t, op, q) for _, t, op, q in changes] == [("queue", "I", a), ("queue", "I", b)]
+    assert seq == dbmod.db_changes_head() > head0
+
+    # Sin mutaciones no hay nada nuevo
+    assert dbmod.db_changes_since(seq) == ([], seq, False)
+
+    # Renovar leases no es un cambio visible; reclamar (status) sí
+    dbmod.db_claim_due()
+    dbmod.db_renew_leases()
+    dbmod.db_update_progress(a, 100, 10)
+    dbmod.db_flush_progress()
+    changes, seq2, _ = dbmod.db_changes_since(seq)
+    assert {(t, op, q) for _, t, op, q in changes} == {
+        ("queue", "U", a),
+        ("queue", "U", b),
+        ("progress", "I", a),
+    }
+
+    # Solo progress, y una fila por qid aunque cambie varias veces
+    for done in (20, 30):
+        dbmod.db_update_progress(a, 100, done)
+        dbmod.db_flush_progress()
+    changes, _, _ = dbmod.db_changes_since(seq2, tbl="progress")
+    assert [(t, op, q) for _, t, op, q in changes] == [("progress", "U", a)]
+
+    dbmod.db_update_status(a, "done")
+    changes, _, _ = dbmod.db_changes_since(seq2)
+    assert {(t, op, q) for _, t, op, q in changes} == {("queue", "D", a), ("progress", "D", a)}
+
+
+def test_changes_since_limit_and_prune_reset(tmp_db):
+    _add(5)
+    changes, seq, reset = dbmod.db_changes_since(0, limit=2)
+    assert len(changes) == 2 and seq == changes[-1][0] and not reset
+    rest, _, _ = dbmod.db_changes_since(seq)
+    assert len(rest) == 3
+
+    assert dbmod.db_prune_changes(keep=2) == 3
+    # Un consumidor anterior al corte debe releer todo
+    assert dbmod.db_changes_since(seq)[2] is True
+    head = dbmod.db_changes_head()
+    assert dbmod.db_changes_since(head) == ([], head, False)
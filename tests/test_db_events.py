@@ -0,0 +1,46 @@
+# tests/test_db_events.py
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+
+
+def _q(sql, *args):
+    with dbmod._reader() as conn:
+        return conn.execute(sql, args).fetchall()
+
+
+def test_terminal_status_feeds_rollup(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    a = dbmod.db_add("url", {"url": "https://Files.Example.com/a.iso"}, past)
+    b = dbmod.db_add("url", {"url": "https://files.example.com/b.iso"}, past)
+    dbmod.db_claim_due(owner="h:1")
+    dbmod.db_update_progress(a, 100, 100)
+    dbmod.db_update_status(a, "done")
+    dbmod.db_update_status(b, "error", retry=False)
+    # Repetir el mismo estado final no duplica el evento
+    dbmod.db_update_status(a, "done")
+
+    today = dbmod.db_rollup("d")
+    assert today["done"]["n"] == 1 and today["done"]["bytes"] == 100
+    assert today["error"]["n"] == 1
+    hosts = _q("SELECT DISTINCT host FROM events_rollup WHERE bucket='h'")
+    assert hosts == [("files.example.com",)]
+    assert len(_q("SELECT id FROM events WHERE type='job_end'")) == 2
+
+
+def test_prune_by_row_cap_and_age(tmp_db):
+    for i in range(25):
+        dbmod.db_add_event(None, "tick", {"i": i})
+    old = (datetime.now().astimezone() - timedelta(days=90)).isoformat()
+    with dbmod._tx() as conn:
+        conn.execute("UPDATE events SET ts=? WHERE id<=3", (old,))
+
+    # Edad: caen los 3 antiguos (lotes de 2 => varias transacciones)
+    assert dbmod.db_prune_events(max_age_days=30, max_rows=0, batch=2) == 3
+    # Tope: se conservan los 10 más recientes
+    assert dbmod.db_prune_events(max_age_days=0, max_rows=10, batch=4) == 12
+    ids = [r[0] for r in _q("SELECT id FROM events ORDER BY id")]
+    assert ids == list(range(16, 26))
+    # Los rollups no se tocan al podar events
+    assert dbmod.db_rollup("d") == {}
+    assert _q("SELECT SUM(n) FROM events_rollup WHERE bucket='d' AND type='tick'") == [(25,)]
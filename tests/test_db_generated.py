@@ -0,0 +1,36 @@
+# tests/test_db_generated.py
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+
+
+def test_generated_columns_expose_payload_fields(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    a = dbmod.db_add(
+        "url", {"url": "https://Cdn.Example.com:8080/x/a.iso?y=1", "notify_chat_id": 42}, past
+    )
+    b = dbmod.db_add("self_ref", {"chat_id": 1, "message_id": 2, "suggested_name": "v.mp4"}, past)
+    c = dbmod.db_add("url", {"url": "magnet:?xt=urn:btih:" + "a" * 40}, past)
+
+    rows = {r["id"]: r for r in dbmod.db_list_page(limit=10)[0]}
+    assert rows[a]["url"].startswith("https://Cdn.Example.com")
+    assert rows[a]["host"] == "cdn.example.com:8080"
+    assert rows[a]["notify_chat_id"] == 42
+    assert rows[b]["suggested_name"] == "v.mp4" and rows[b]["url"] is None
+    assert rows[c]["host"] is None
+
+    by_host, _ = dbmod.db_list_page(host="CDN.example.com:8080")
+    assert [r["id"] for r in by_host] == [a]
+    by_chat, _ = dbmod.db_list_page(chat_id=42)
+    assert [r["id"] for r in by_chat] == [a]
+
+
+def test_host_filter_uses_index(tmp_db):
+    with dbmod._reader() as conn:
+        plan = " ".join(
+            r[3]
+            for r in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM queue WHERE host=? AND status=?", ("x", "queued")
+            )
+        )
+    assert "idx_queue_host" in plan
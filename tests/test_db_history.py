@@ -0,0 +1,82 @@
+# tests/test_db_history.py
+import sqlite3
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+
+
+def _one(sql, *args):
+    with dbmod._reader() as conn:
+        return conn.execute(sql, args).fetchone()
+
+
+def test_finish_moves_job_to_history(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    qid = dbmod.db_add("url", {"url": "https://dl.example.com/a.iso"}, past)
+    dbmod.db_claim_due(owner="h:1")
+    dbmod.db_update_progress(qid, 4096, 4096)
+    dbmod.db_update_status(qid, "done", final_path="/d/a.iso")
+
+    assert _one("SELECT COUNT(*) FROM queue")[0] == 0
+    assert _one("SELECT COUNT(*) FROM progress")[0] == 0
+    row = _one(
+        "SELECT status, url, host, final_path, size_bytes, duration_ms FROM queue_history WHERE id=?",
+        qid,
+    )
+    assert row[:5] == ("done", "https://dl.example.com/a.iso", "dl.example.com", "/d/a.iso", 4096)
+    assert row[5] is not None
+    # El evento conserva el qid (events ya no tiene FK a queue)
+    assert _one("SELECT qid FROM events WHERE type='job_end'") == (qid,)
+    rows, _ = dbmod.db_history_page(search="a.iso")
+    assert [r["id"] for r in rows] == [qid]
+
+
+def test_retry_restores_errors_with_same_id(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    a = dbmod.db_add("url", {"url": "https://e.x/a"}, past)
+    b = dbmod.db_add("url", {"url": "https://e.x/b"}, past)
+    dbmod.db_claim_due(1)
+    dbmod.db_update_status(a, "error", retry=False)
+    dbmod.db_update_status(b, "canceled")
+    assert dbmod.db_retry_errors() == 1
+    rows, _ = dbmod.db_list_page()
+    assert [(r["id"], r["status"]) for r in rows] == [(a, "queued")]
+    assert dbmod.db_count_by_status() == {"queued": 1, "canceled": 1}
+
+
+def test_clear_all_empties_history_too(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    a = dbmod.db_add("url", {"url": "https://e.x/a"}, past)
+    dbmod.db_add("url", {"url": "https://e.x/b"}, past)
+    dbmod.db_update_status(a, "done")
+    dbmod.db_clear_all()
+    assert _one("SELECT COUNT(*) FROM queue")[0] == 0
+    assert _one("SELECT COUNT(*) FROM queue_history")[0] == 0
+
+
+def test_migration_archives_legacy_rows_and_drops_events_fk(tmp_path):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE queue (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL,
+          payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued',
+          scheduled_at TEXT NOT NULL, created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+        CREATE TABLE events (id INTEGER PRIMARY KEY AUTOINCREMENT, qid INTEGER, ts TEXT NOT NULL,
+          type TEXT NOT NULL, payload TEXT NOT NULL,
+          FOREIGN KEY(qid) REFERENCES queue(id) ON DELETE SET NULL);
+        INSERT INTO queue VALUES (1,'url','{"url":"https://e.x/1"}','done','t','t','t');
+        INSERT INTO queue VALUES (2,'url','{"url":"https://e.x/2"}','queued','t','t','t');
+        INSERT INTO events VALUES (1, 1, 't', 'x', '{}');
+        """
+    )
+    conn.close()
+    try:
+        dbmod.db_init(path)
+        with dbmod._reader(path) as c:
+            assert c.execute("SELECT id FROM queue").fetchall() == [(2,)]
+            assert c.execute("SELECT id, status FROM queue_history").fetchall() == [(1, "done")]
+            assert c.execute("PRAGMA foreign_key_list(events)").fetchall() == []
+            assert c.execute("SELECT qid FROM events").fetchall() == [(1,)]
+    finally:
+        dbmod.db_close()
@@ -0,0 +1,90 @@
+# tests/test_db_leases.py
+import threading
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+
+
+def _status(qid):
+    with dbmod._reader() as conn:
+        return conn.execute(
+            "SELECT status, lease_owner, lease_expires_at FROM queue WHERE id=?", (qid,)
+        ).fetchone()
+
+
+def test_claim_is_atomic_across_threads(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    ids = [dbmod.db_add("url", {"url": f"https://e.x/{i}"}, past) for i in range(40)]
+    claimed: list[int] = []
+    lock = threading.Lock()
+
+    def _worker(n):
+        while True:
+            rows = dbmod.db_claim_due(3, owner=f"h:{n}")
+            if not rows:
+                return
+            with lock:
+                claimed.extend(r[0] for r in rows)
+
+    threads = [threading.Thread(target=_worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == ids
+    assert all(_status(q)[0] == "running" for q in ids)
+
+
+def test_claim_respects_schedule_unless_forced(tmp_db):
+    future = datetime.now() + timedelta(hours=2)
+    qid = dbmod.db_add("url", {"url": "https://e.x/f"}, future)
+    assert dbmod.db_claim_due() == []
+    assert [r[0] for r in dbmod.db_claim_due(ignore_schedule=True)] == [qid]
+
+
+def test_expired_and_stale_leases_are_recovered(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    a = dbmod.db_add("url", {"url": "https://e.x/a"}, past)
+    b = dbmod.db_add("url", {"url": "https://e.x/b"}, past)
+    dbmod.db_claim_due(1, owner="other:1", lease_sec=-1)  # ya vencido
+    dbmod.db_claim_due(1, owner="myhost:100")
+    assert dbmod.db_sweep_expired_leases() == 1
+    assert _status(a)[0] == "queued"
+
+    # mismo host, pid nuevo → el anterior ya no existe
+    assert dbmod.db_release_stale_leases(owner="myhost:200") == 1
+    assert _status(b)[:2] == ("queued", None)
+
+
+def test_status_change_clears_lease_and_renew_extends(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    a = dbmod.db_add("url", {"url": "https://e.x/a"}, past)
+    dbmod.db_claim_due(owner="me:1", lease_sec=10)
+    before = _status(a)[2]
+    assert dbmod.db_renew_leases(owner="me:1", lease_sec=600) == 1
+    assert _status(a)[2] > before
+    dbmod.db_update_status(a, "paused")
+    assert _status(a) == ("paused", None, None)
+
+
+def test_handed_off_jobs_are_adopted_and_free_their_slot(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    a = dbmod.db_add("url", {"url": "https://e.x/a.bin"}, past)
+    b = dbmod.db_add("url", {"url": "https://e.x/b.bin"}, past)
+    dbmod.db_claim_due(owner="myhost:100")
+    dbmod.db_set_ext_id(a, "gid-a")
+    assert dbmod.db_running_by_backend()["aria2"] == 1
+    assert dbmod.db_count_handed_off() == 1
+
+    # Reinicio: la entregada a aria2 se adopta, la otra vuelve a la cola
+    assert dbmod.db_adopt_handoffs(owner="myhost:200") == [(a, "gid-a", None)]
+    assert dbmod.db_release_stale_leases(owner="myhost:200") == 1
+    assert _status(a)[:2] == ("running", "myhost:200")
+    assert _status(b)[0] == "queued"
+
+    # Un reintento no arrastra el GID del intento anterior
+    dbmod.db_update_status(a, "error", error="aria2: x")
+    with dbmod._writer() as conn:
+        conn.execute("UPDATE queue SET next_attempt_at=NULL WHERE id=?", (a,))  # sin backoff
+    assert [r[0] for r in dbmod.db_claim_due(ignore_schedule=True, owner="myhost:200")] == [a, b]
+    assert dbmod.db_count_handed_off() == 0
@@ -0,0 +1,48 @@
+# tests/test_db_maintenance.py
+import sqlite3
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+
+
+def test_vacuum_reclaims_pages_after_purge(tmp_db):
+    with dbmod._reader() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    past = datetime.now() - timedelta(minutes=1)
+    blob = "x" * 4000
+    items = [("url", {"url": f"https://e.x/{i}", "pad": blob}, past) for i in range(200)]
+    for qid, _ in dbmod.db_add_many(items):
+        dbmod.db_update_status(qid, "done")
+    dbmod.db_purge_finished()
+
+    m = dbmod.db_maintenance(truncate=True, vacuum=True, vacuum_pages=0)
+    assert m["mode"] == "truncate" and not m["busy"] and not m["converted"]
+    assert m["pages_freed"] > 100
+    assert m["wal_bytes"] == 0
+    with dbmod._reader() as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+    last = dbmod.db_maintenance_last()
+    assert last["pages_freed"] == m["pages_freed"] and "at" in last
+
+
+def test_passive_pass_and_legacy_conversion(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    monkeypatch.setattr(dbmod.settings, "DB_PATH", path, raising=False)
+    # DB previa a auto_vacuum=INCREMENTAL
+    with sqlite3.connect(path) as c:
+        c.execute("CREATE TABLE t(x)")
+    dbmod.db_init(path)
+    try:
+        m = dbmod.db_maintenance()
+        assert m["mode"] == "passive" and m["pages_freed"] == 0
+        # La pasada programada nunca reescribe la DB entera
+        m = dbmod.db_maintenance(truncate=True, vacuum=True)
+        assert not m["converted"] and not m["incremental"]
+        m = dbmod.db_maintenance(convert=True)
+        assert m["converted"] and m["incremental"]
+        # Conexión nueva: las del pool guardan el auto_vacuum con el que se abrieron
+        with sqlite3.connect(path) as c:
+            assert c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    finally:
+        dbmod.db_close()
@@ -0,0 +1,91 @@
+# tests/test_db_migrate.py
+import sqlite3
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+
+# Esquema de partida del proyecto (antes de columnas generadas, leases, historial...)
+BASELINE_SQL = """
+CREATE TABLE queue (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL,
+  payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued',
+  scheduled_at TEXT NOT NULL, created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+CREATE INDEX idx_queue_status ON queue(status);
+CREATE INDEX idx_queue_scheduled ON queue(scheduled_at);
+CREATE INDEX idx_queue_created ON queue(created_at);
+CREATE TABLE progress (qid INTEGER PRIMARY KEY, total INTEGER,
+  downloaded INTEGER NOT NULL DEFAULT 0, updated_at TEXT NOT NULL,
+  FOREIGN KEY(qid) REFERENCES queue(id) ON DELETE CASCADE);
+CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT);
+CREATE TABLE events (id INTEGER PRIMARY KEY AUTOINCREMENT, qid INTEGER, ts TEXT NOT NULL,
+  type TEXT NOT NULL, payload TEXT NOT NULL,
+  FOREIGN KEY(qid) REFERENCES queue(id) ON DELETE SET NULL);
+CREATE TABLE schedules (id INTEGER PRIMARY KEY AUTOINCREMENT, rule TEXT NOT NULL,
+  enabled INTEGER NOT NULL DEFAULT 1, created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+INSERT INTO queue VALUES (1, 'url', '{"url":"https://dl.e.x/a.bin"}', 'queued',
+  '2025-01-02T03:04:05+00:00', 't', 't');
+"""
+
+
+def _restart(path):
+    """Cierra el pool y vuelve a abrir la DB como al arrancar el bot o el panel."""
+    dbmod.db_close()
+    dbmod.db_init(path)
+
+
+def test_init_twice_on_a_fresh_file(tmp_path, monkeypatch):
+    path = tmp_path / "queue.db"
+    monkeypatch.setattr(dbmod.settings, "DB_PATH", path, raising=False)
+    try:
+        dbmod.db_init(path)
+        qid = dbmod.db_add("url", {"url": "https://dl.e.x/b.bin"}, datetime.now())
+        _restart(path)
+        _restart(path)
+        with dbmod._reader(path) as c:
+            assert c.execute("SELECT url, host FROM queue WHERE id=?", (qid,)).fetchone() == (
+                "https://dl.e.x/b.bin",
+                "dl.e.x",
+            )
+    finally:
+        dbmod.db_close()
+
+
+def test_init_twice_on_a_baseline_db(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    monkeypatch.setattr(dbmod.settings, "DB_PATH", path, raising=False)
+    with sqlite3.connect(path) as c:
+        c.executescript(BASELINE_SQL)
+    try:
+        dbmod.db_init(path)
+        _restart(path)
+        with dbmod._reader(path) as c:
+            cols = {r[1] for r in c.execute("PRAGMA table_xinfo(queue)")}
+            row = c.execute("SELECT url, host, scheduled_ms FROM queue WHERE id=1").fetchone()
+        assert {"url", "host", "canon_key", "scheduled_ms", "priority"} <= cols
+        assert tuple(row) == ("https://dl.e.x/a.bin", "dl.e.x", 1735787045000)
+        # Y sigue aceptando trabajo tras el segundo arranque
+        assert dbmod.db_add("url", {"url": "https://dl.e.x/c.bin"}, datetime.now()) == 2
+    finally:
+        dbmod.db_close()
+
+
+def test_backend_slots_survive_a_restart(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    monkeypatch.setattr(dbmod.settings, "DB_PATH", path, raising=False)
+    with sqlite3.connect(path) as c:
+        c.executescript(BASELINE_SQL)  # el id 1 es un fichero directo (aria2)
+    try:
+        dbmod.db_init(path)
+        past = datetime.now() - timedelta(minutes=1)
+        video = dbmod.db_add("url", {"url": "https://youtu.be/abc"}, past)
+        dbmod.db_set_backend_limit("ytdlp", 1)
+        _restart(path)
+        # La columna generada y los cupos fijados en marcha siguen ahí tras rearrancar
+        with dbmod._reader(path) as c:
+            rows = c.execute("SELECT id, backend FROM queue ORDER BY id").fetchall()
+        assert [tuple(r) for r in rows] == [(1, "aria2"), (video, "ytdlp")]
+        assert dbmod.db_backend_limits()["ytdlp"] == 1
+        claimed = dbmod.db_claim_due(slots={"aria2": 0, "ytdlp": 1}, ignore_schedule=True)
+        assert [r[0] for r in claimed] == [video]
+        assert dbmod.db_running_by_backend()["ytdlp"] == 1
+    finally:
+        dbmod.db_close()
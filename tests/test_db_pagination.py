@@ -0,0 +1,40 @@
+# tests/test_db_pagination.py
+from datetime import datetime
+
+from tgdl.core import db as dbmod
+
+
+def test_keyset_pages_cover_queue_without_overlap(tmp_db):
+    ids = [dbmod.db_add("url", {"url": f"https://e.x/{i}"}, datetime.now()) for i in range(23)]
+    seen, cursor = [], None
+    while True:
+        rows, cursor = dbmod.db_list_page(limit=10, before_id=cursor)
+        seen += [r["id"] for r in rows]
+        if cursor is None:
+            break
+    assert seen == sorted(ids, reverse=True)
+
+
+def test_status_filter_and_counts(tmp_db):
+    ids = [dbmod.db_add("url", {"url": f"https://e.x/{i}"}, datetime.now()) for i in range(6)]
+    for qid in ids[:2]:
+        dbmod.db_update_status(qid, "done")
+    dbmod.db_update_status(ids[2], "paused")
+    rows, nxt = dbmod.db_list_page(limit=10, status="paused")
+    assert [r["id"] for r in rows] == [ids[2]] and nxt is None
+    # Los terminados viven en queue_history pero siguen contando
+    rows, nxt = dbmod.db_history_page(limit=1, status="done")
+    assert [r["id"] for r in rows] == [ids[1]] and nxt == ids[1]
+    assert dbmod.db_count_by_status() == {"done": 2, "paused": 1, "queued": 3}
+    assert dbmod.db_count_pending() == 4
+
+
+def test_progress_cursor(tmp_db):
+    ids = [dbmod.db_add("url", {"url": f"https://e.x/{i}"}, datetime.now()) for i in range(5)]
+    for qid in ids:
+        dbmod.db_update_progress(qid, 100, qid)
+    dbmod.db_flush_progress()
+    page1, cur = dbmod.db_get_progress_page(limit=3)
+    page2, cur2 = dbmod.db_get_progress_page(limit=3, cursor=cur)
+    assert len(page1) == 3 and len(page2) == 2 and cur2 is None
+    assert {r["qid"] for r in page1 + page2} == set(ids)
@@ -0,0 +1,72 @@
+# tests/test_db_pool.py
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+
+from tgdl.core import db as dbmod
+
+
+def test_pool_reuses_connections(tmp_db):
+    pool = dbmod._pool()
+    with pool.writer() as w1:
+        pass
+    with pool.writer() as w2:
+        pass
+    assert w1 is w2
+    with pool.reader() as r1:
+        pass
+    with pool.reader() as r2:
+        pass
+    assert r1 is r2
+    assert dbmod._pool() is pool
+
+
+def test_readers_are_query_only(tmp_db):
+    with dbmod._reader() as conn, pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO kv(k,v) VALUES('x','1')")
+
+
+def _kv(key):
+    with dbmod._reader() as conn:
+        row = conn.execute("SELECT v FROM kv WHERE k=?", (key,)).fetchone()
+        return row[0] if row else None
+
+
+def test_transaction_rolls_back_and_nests(tmp_db):
+    with pytest.raises(RuntimeError), dbmod._tx() as conn:
+        conn.execute("INSERT INTO kv(k,v) VALUES('a','1')")
+        raise RuntimeError("boom")
+    assert _kv("a") is None
+
+    with dbmod._tx() as conn:
+        conn.execute("INSERT INTO kv(k,v) VALUES('b','1')")
+        with pytest.raises(ValueError), dbmod._tx() as inner:
+            inner.execute("INSERT INTO kv(k,v) VALUES('c','1')")
+            raise ValueError
+    assert _kv("b") == "1"
+    assert _kv("c") is None
+
+
+def test_concurrent_threads_share_pool(tmp_db):
+    errors = []
+
+    def _work(n):
+        try:
+            for i in range(50):
+                qid = dbmod.db_add("url", {"url": f"https://e.x/{n}/{i}"}, datetime.now())
+                dbmod.db_update_status(qid, "done")
+                dbmod.db_list(5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=_work, args=(n,)) for n in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert not dbmod.db_list(1000)
+    assert dbmod.db_count_by_status() == {"done": 300}
+    assert dbmod._pool()._created <= dbmod.settings.DB_READERS
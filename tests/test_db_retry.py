@@ -0,0 +1,57 @@
+# tests/test_db_retry.py
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+from tgdl.utils.backends import RetryPolicy, backend_for, retry_policy
+
+
+def _row(qid):
+    with dbmod._reader() as conn:
+        return conn.execute(
+            "SELECT status, attempts, next_attempt_at, last_error FROM queue WHERE id=?", (qid,)
+        ).fetchone()
+
+
+def test_backend_and_policy_overrides(monkeypatch):
+    assert backend_for("tg_link", {"url": "https://t.me/x/1"}) == "telegram"
+    assert backend_for("url", {"url": "https://youtu.be/dQw4w9WgXcQ"}) == "ytdlp"
+    assert backend_for("url", {"url": "magnet:?xt=urn:btih:abc"}) == "aria2"
+
+    monkeypatch.setattr(dbmod.settings, "RETRY_BACKENDS", {"ytdlp": {"max_attempts": 2}})
+    assert retry_policy("ytdlp").max_attempts == 2
+    assert retry_policy("aria2").max_attempts == dbmod.settings.RETRY_MAX_ATTEMPTS
+
+    p = RetryPolicy(max_attempts=5, base_sec=10, max_sec=60, jitter=0.5)
+    assert [p.delay_sec(n, rnd=0.5) for n in (1, 2, 3, 4)] == [10, 20, 40, 60]
+    assert p.delay_sec(1, rnd=0.0) == 5 and p.delay_sec(1, rnd=1.0) == 15
+
+
+def test_failures_back_off_then_go_dead(tmp_db, monkeypatch):
+    monkeypatch.setattr(dbmod.settings, "RETRY_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(dbmod.settings, "RETRY_JITTER", 0.0)
+    past = datetime.now() - timedelta(minutes=1)
+    qid = dbmod.db_add("url", {"url": "https://flaky.example/f.bin"}, past)
+
+    assert [r[0] for r in dbmod.db_claim_due()] == [qid]
+    dbmod.db_update_status(qid, "error", error="HTTP 503")
+    status, attempts, next_at, last_error = _row(qid)
+    assert (status, attempts, last_error) == ("queued", 1, "HTTP 503")
+    assert next_at > dbmod._now_ms() + 25_000
+
+    # En backoff no se despacha, ni siquiera ignorando la programación
+    assert dbmod.db_claim_due(ignore_schedule=True) == []
+    later = datetime.now() + timedelta(hours=1)
+    assert [r[0] for r in dbmod.db_claim_due(now=later)] == [qid]
+
+    assert dbmod.db_fail_job(qid, "HTTP 503") == "queued"
+    # Solo falla lo que está en curso: un 'queued' no gasta intento
+    assert dbmod.db_fail_job(qid, "HTTP 500") is None
+    assert [r[0] for r in dbmod.db_claim_due(now=later)] == [qid]
+    assert dbmod.db_fail_job(qid, "HTTP 500") == "dead"
+    assert _row(qid) is None
+    rows, _ = dbmod.db_history_page(status="dead")
+    assert [r["id"] for r in rows] == [qid]
+
+    # /retry devuelve los 'dead' a la cola con los intentos a cero
+    assert dbmod.db_retry_errors() == 1
+    assert _row(qid) == ("queued", 0, None, "HTTP 500")
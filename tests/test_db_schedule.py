@@ -0,0 +1,88 @@
+# tests/test_db_schedule.py
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from tgdl.core import db as dbmod
+
+
+def test_due_compares_instants_not_strings(tmp_db):
+    now = datetime.now().astimezone()
+    # Misma hora en otra zona: como texto ISO ordenaría mal respecto a `now`
+    far_tz = timezone(timedelta(hours=-11))
+    due = dbmod.db_add(
+        "url", {"url": "https://e.x/due"}, (now - timedelta(minutes=5)).astimezone(far_tz)
+    )
+    later = dbmod.db_add("url", {"url": "https://e.x/later"}, now + timedelta(hours=1))
+    assert [r[0] for r in dbmod.db_get_due(now)] == [due]
+
+    assert dbmod.db_pull_forward_queued(now) == 1
+    assert [r[0] for r in dbmod.db_claim_due(now=now)] == [due, later]
+
+
+def test_due_query_uses_covering_index(tmp_db):
+    with dbmod._reader() as conn:
+        plan = " ".join(
+            r[3]
+            for r in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM queue "
+                "WHERE status='queued' AND scheduled_ms<=? ORDER BY id",
+                (0,),
+            )
+        )
+    assert "COVERING INDEX idx_queue_due" in plan
+
+
+def test_migration_backfills_mixed_formats(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    local = datetime(2025, 1, 2, 3, 4, 5).astimezone()
+    # El modo 24/7 escribía hora naive en TIMEZONE, no en la zona del sistema
+    tz = "Pacific/Kiritimati" if local.utcoffset() != timedelta(hours=14) else "Etc/GMT+12"
+    monkeypatch.setattr(dbmod.settings, "TIMEZONE", tz)
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE queue (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL,
+          payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued',
+          scheduled_at TEXT NOT NULL, created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+        """
+    )
+    conn.executemany(
+        "INSERT INTO queue VALUES (?, 'url', '{}', 'queued', ?, 't', 't')",
+        [(1, local.isoformat()), (2, "2025-01-02 03:04:05"), (3, "basura")],
+    )
+    conn.commit()
+    conn.close()
+    try:
+        dbmod.db_init(path)
+        with dbmod._reader(path) as c:
+            rows = c.execute("SELECT id, scheduled_ms FROM queue ORDER BY id").fetchall()
+        naive = datetime(2025, 1, 2, 3, 4, 5, tzinfo=ZoneInfo(tz))
+        assert rows == [
+            (1, int(local.timestamp() * 1000)),
+            (2, int(naive.timestamp() * 1000)),
+            (3, 0),
+        ]
+    finally:
+        dbmod.db_close()
+
+
+def test_claim_follows_priority_then_id(tmp_db):
+    past = datetime.now() - timedelta(minutes=1)
+    big = dbmod.db_add("url", {"url": "magnet:?xt=urn:btih:" + "a" * 40}, past)
+    small = dbmod.db_add("url", {"url": "https://e.x/small.bin"}, past, priority=5)
+    other = dbmod.db_add("url", {"url": "https://e.x/other.bin"}, past)
+    # /bump: por delante de todo lo pendiente
+    assert dbmod.db_bump([other]) == 6
+    assert dbmod.db_bump([]) is None
+    assert [r[0] for r in dbmod.db_claim_due()] == [other, small, big]
+
+    with dbmod._reader() as conn:
+        plan = " ".join(
+            r[3]
+            for r in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM queue WHERE status='queued' "
+                "ORDER BY priority DESC, id ASC LIMIT 5"
+            )
+        )
+    assert "idx_queue_prio" in plan and "TEMP B-TREE" not in plan
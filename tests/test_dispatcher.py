@@ -0,0 +1,248 @@
+# tests/test_dispatcher.py
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from tgdl.adapters.telegram import bot_app
+from tgdl.core import adb
+from tgdl.core import db as dbmod
+
+
+async def _until(cond, within: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + within
+    while not cond():
+        assert asyncio.get_running_loop().time() < deadline, "timeout"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+async def jobs(tmp_db, monkeypatch):
+    """_run_job falso: cada trabajo espera a que el test lo suelte y acaba en 'done'."""
+    started: list[int] = []
+    gates: dict[int, asyncio.Event] = {}
+
+    async def _run_job(app, qid, kind, payload_json, notify_chat_id):
+        gates[qid] = asyncio.Event()
+        started.append(qid)
+        await gates[qid].wait()
+        await adb.db_update_status(qid, "done")
+
+    monkeypatch.setattr(bot_app, "_run_job", _run_job)
+    monkeypatch.setattr(bot_app, "ACTIVE", {})
+    monkeypatch.setattr(bot_app, "DISPATCH_EVT", asyncio.Event())
+    monkeypatch.setattr(bot_app, "DISPATCH", {"task": None, "force": False, "notify_chat_id": None})
+    # Sin sondeo efectivo: solo avanza si alguien lo despierta
+    monkeypatch.setattr(bot_app.settings, "DISPATCH_POLL_SEC", 60.0)
+    monkeypatch.setattr(bot_app, "JOB_BACKEND", {})
+    monkeypatch.setattr(
+        bot_app.settings,
+        "BACKEND_LIMITS",
+        {"aria2": 2, "ytdlp": 1, "telegram": 1, "resolver": 1},
+    )
+    yield started, gates
+    bot_app.DISPATCH["task"].cancel()
+    for g in gates.values():
+        g.set()
+    await asyncio.gather(*bot_app.ACTIVE.values(), return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_slots_refill_without_waiting_for_the_batch(jobs):
+    started, gates = jobs
+    past = datetime.now() - timedelta(minutes=1)
+    a, b, c = [await adb.db_add("url", {"url": f"https://e.x/{i}"}, past) for i in range(3)]
+    bot_app.wake_dispatcher(app=object())
+    await _until(lambda: started == [a, b])
+
+    # Llega algo urgente con los dos huecos ocupados: entra en cuanto se libera uno
+    urgent = await adb.db_add("url", {"url": "https://e.x/urgent"}, past, priority=5)
+    bot_app.wake_dispatcher()
+    await asyncio.sleep(0.05)
+    assert started == [a, b]
+    gates[a].set()
+    await _until(lambda: started == [a, b, urgent])
+
+    gates[b].set()
+    await _until(lambda: started == [a, b, urgent, c])
+
+
+@pytest.mark.asyncio
+async def test_busy_backend_does_not_starve_the_others(jobs):
+    started, _ = jobs
+    past = datetime.now() - timedelta(minutes=1)
+    torrents = [
+        await adb.db_add("url", {"url": f"magnet:?xt=urn:btih:{i:040d}"}, past) for i in range(3)
+    ]
+    video = await adb.db_add("url", {"url": "https://youtu.be/dQw4w9WgXcQ"}, past)
+    bot_app.wake_dispatcher(app=object())
+    await _until(lambda: sorted(started) == sorted([*torrents[:2], video]))
+
+    # Cupo ampliado en caliente (/limits aria2 3): entra el tercer torrent
+    await adb.db_set_backend_limit("aria2", 3)
+    bot_app.wake_dispatcher()
+    await _until(lambda: torrents[2] in started)
+
+
+@pytest.mark.asyncio
+async def test_pause_and_schedule_are_respected(jobs):
+    started, _ = jobs
+    later = datetime.now() + timedelta(hours=1)
+    await adb.db_set_flag("PAUSED", "1")
+    qid = await adb.db_add("url", {"url": "https://e.x/later"}, later)
+    bot_app.wake_dispatcher(app=object(), force_all=True)
+    await asyncio.sleep(0.05)
+    assert started == [] and not bot_app.DISPATCH["force"]
+
+    await adb.db_set_flag("PAUSED", "0")
+    bot_app.wake_dispatcher()
+    await asyncio.sleep(0.05)
+    assert started == []  # programado para más tarde
+
+    bot_app.wake_dispatcher(force_all=True)  # /now
+    await _until(lambda: started == [qid])
+
+
+def _state(qid):
+    with dbmod._reader() as conn:
+        row = conn.execute("SELECT status FROM queue WHERE id=?", (qid,)).fetchone()
+        row = (
+            row
+            or conn.execute(
+                "SELECT status, final_path FROM queue_history WHERE id=?", (qid,)
+            ).fetchone()
+        )
+    return tuple(row)
+
+
+@pytest.mark.asyncio
+async def test_aria2_handoffs_are_settled_by_the_watcher(tmp_db, monkeypatch):
+    states: dict[str, dict] = {}
+    calls: list[list[str]] = []
+
+    def tell_many(gids):
+        calls.append(list(gids))
+        return {g: states[g] for g in gids if g in states}
+
+    monkeypatch.setattr(bot_app, "aria2_tell_many", tell_many)
+    monkeypatch.setattr(bot_app, "HANDOFFS", {})
+    monkeypatch.setattr(bot_app, "WATCHER", {"task": None})
+    monkeypatch.setattr(bot_app, "DISPATCH_EVT", asyncio.Event())
+    monkeypatch.setattr(bot_app.settings, "ARIA2_WATCH_SEC", 0.01)
+    past = datetime.now() - timedelta(minutes=1)
+    a, b, c = [await adb.db_add("url", {"url": f"https://e.x/{i}.bin"}, past) for i in range(3)]
+    await adb.db_claim_due()
+    for qid, gid in ((a, "ga"), (b, "gb"), (c, "gc")):
+        states[gid] = {"status": "active", "totalLength": "100", "completedLength": "10"}
+        await bot_app._hand_off_aria2(object(), qid, gid, None)
+    # Ya no ocupan cupo: el worker terminó en cuanto aria2 aceptó la descarga
+    assert (await adb.db_running_by_backend())["aria2"] == 0
+    assert await adb.db_count_handed_off() == 3
+
+    states["ga"] = {
+        "status": "complete",
+        "totalLength": "100",
+        "completedLength": "100",
+        "files": [{"path": "/dl/a.bin"}],
+    }
+    del states["gc"]  # quitada de aria2 por fuera
+    await _until(lambda: _state(c)[0] != "running")
+    assert set(bot_app.HANDOFFS) == {b}
+    assert _state(a) == ("done", "/dl/a.bin")
+    assert _state(c) == ("error", None)
+    assert all(len(gids) <= 3 for gids in calls)  # una RPC por vuelta para todas
+
+    states["gb"] = {"status": "error", "errorMessage": "boom"}
+    await asyncio.wait_for(bot_app.WATCHER["task"], 2.0)  # acaba al no quedar ninguna
+    assert _state(b) == ("queued",)  # error de aria2: se reintenta con backoff
+
+
+@pytest.mark.asyncio
+async def test_paused_telethon_job_keeps_its_attempts(tmp_db, monkeypatch, tmp_path):
+    async def _paused(*args, **kwargs):
+        raise bot_app.PauseSignal("Paused by user")
+
+    monkeypatch.setattr(bot_app, "telethon_download_by_ref", _paused)
+    monkeypatch.setattr(bot_app.settings, "DOWNLOAD_DIR", tmp_path)
+    past = datetime.now() - timedelta(minutes=1)
+    qid = await adb.db_add("tg_ref", {"chat_id": 1, "message_id": 2}, past)
+    [(_, kind, payload_json)] = await adb.db_claim_due()
+    dbmod.db_update_progress(qid, 100, 40)
+    await bot_app._run_job(None, qid, kind, payload_json, None)
+    with dbmod._reader() as conn:
+        row = conn.execute(
+            "SELECT q.status, q.attempts, p.downloaded FROM queue q "
+            "LEFT JOIN progress p ON p.qid=q.id WHERE q.id=?",
+            (qid,),
+        ).fetchone()
+    # Sigue pausado, sin gastar intento ni perder lo descargado
+    assert tuple(row) == ("paused", 0, 40)
+
+
+@pytest.mark.asyncio
+async def test_telethon_flood_wait_counts_as_throttled(tmp_db, monkeypatch, tmp_path):
+    from types import SimpleNamespace
+
+    from telethon.errors import FloodWaitError
+
+    class _Client:
+        async def get_entity(self, chat_id):
+            return SimpleNamespace(title="Canal")
+
+        async def get_messages(self, entity, ids):
+            return SimpleNamespace(media=True, document=None, video=None, audio=None)
+
+        async def download_media(self, *args, **kwargs):
+            raise FloodWaitError(request=None, capture=30)
+
+    monkeypatch.setattr(bot_app.BOT, "tclient", _Client())
+    monkeypatch.setattr(bot_app.settings, "DOWNLOAD_DIR", tmp_path)
+    _, head = dbmod.db_job_outcomes()
+    past = datetime.now() - timedelta(minutes=1)
+    qid = await adb.db_add("tg_ref", {"chat_id": 1, "message_id": 2}, past)
+    [(_, kind, payload_json)] = await adb.db_claim_due()
+    await bot_app._run_job(None, qid, kind, payload_json, None)
+    out, _ = dbmod.db_job_outcomes(head)
+    assert out["telegram"] == {"done": 0, "failed": 1, "throttled": 1}
+
+
+def test_ytdlp_processes_are_tracked_per_job(monkeypatch):
+    class _Proc:
+        def __init__(self):
+            self.returncode = None
+
+        def terminate(self):
+            self.returncode = -15
+
+    a, b = _Proc(), _Proc()
+    monkeypatch.setattr(bot_app, "RUNNING_PROCS", {1: a, 2: b})
+    # Cancelar un trabajo no toca el yt-dlp de otro
+    bot_app._terminate_ytdlp(2)
+    assert (a.returncode, b.returncode) == (None, -15)
+    bot_app._terminate_ytdlp(3)
+    # Pausar los detiene todos
+    bot_app._terminate_ytdlp()
+    assert a.returncode == -15
+
+
+@pytest.mark.asyncio
+async def test_cancelled_handoff_is_not_archived_as_error(tmp_db, monkeypatch):
+    states = {"g": {"status": "active", "totalLength": "100", "completedLength": "10"}}
+    monkeypatch.setattr(
+        bot_app, "aria2_tell_many", lambda gids: {g: states[g] for g in gids if g in states}
+    )
+    monkeypatch.setattr(bot_app, "HANDOFFS", {})
+    monkeypatch.setattr(bot_app, "WATCHER", {"task": None})
+    monkeypatch.setattr(bot_app.settings, "ARIA2_WATCH_SEC", 0.01)
+    past = datetime.now() - timedelta(minutes=1)
+    qid = await adb.db_add("url", {"url": "https://e.x/a.bin"}, past)
+    await adb.db_claim_due()
+    await bot_app._hand_off_aria2(object(), qid, "g", None)
+
+    # Lo que hacen /cancel y POST /cancel/{qid}, en ese orden
+    await bot_app._drop_handoff(qid)
+    del states["g"]  # aria2_remove
+    await asyncio.sleep(0.05)  # el watcher ya no la ve
+    await adb.db_update_status(qid, "canceled")
+    await asyncio.wait_for(bot_app.WATCHER["task"], 2.0)
+    assert _state(qid)[0] == "canceled"
@@ -0,0 +1,25 @@
+# tests/test_flag_cache.py
+from tgdl.core import db as dbmod
+
+
+def test_flag_roundtrip_and_local_writes_are_immediate(tmp_db):
+    assert dbmod.is_paused() is False
+    dbmod.db_set_flag("PAUSED", "1")
+    assert dbmod.is_paused() is True
+    assert dbmod.db_get_flag("missing", "x") == "x"
+
+
+def test_cross_process_change_is_detected(tmp_db, monkeypatch):
+    flags = dbmod._pool().flags
+    monkeypatch.setattr(flags, "ttl", 3600)
+    assert dbmod.db_get_flag("PAUSED", "0") == "0"
+
+    # Otro proceso escribe por su cuenta (conexión independiente)
+    other = dbmod._connect(tmp_db)
+    other.execute("INSERT INTO kv(k,v) VALUES('PAUSED','1')")
+    other.close()
+
+    # Dentro del TTL seguimos sirviendo la copia en memoria
+    assert dbmod.db_get_flag("PAUSED", "0") == "0"
+    monkeypatch.setattr(flags, "ttl", 0)
+    assert dbmod.db_get_flag("PAUSED", "0") == "1"
@@ -0,0 +1,49 @@
+# tests/test_hosts.py
+from datetime import datetime, timedelta
+
+from tgdl.core import db as dbmod
+from tgdl.utils.hosts import host_limit, site_of
+
+
+def test_site_is_the_registrable_domain():
+    assert site_of("download1234.mediafire.com") == "mediafire.com"
+    assert site_of("user@Downloads.SourceForge.net:443") == "sourceforge.net"
+    assert site_of("files.example.co.uk") == "example.co.uk"
+    assert site_of("youtu.be") == "youtube.com"
+    assert site_of("192.168.1.10:6800") == "192.168.1.10"
+    assert site_of("[::1]:8080") == "::1"
+    assert site_of(None) == site_of("") == ""
+
+
+def test_limit_defaults_and_overrides(monkeypatch):
+    monkeypatch.setattr(dbmod.settings, "HOST_LIMIT", 3)
+    monkeypatch.setattr(dbmod.settings, "HOST_LIMITS", {"mediafire.com": 1})
+    assert host_limit("mediafire.com") == 1
+    assert host_limit("example.com") == 3
+
+
+def test_claim_caps_each_site_and_prefers_idle_ones(tmp_db, monkeypatch):
+    monkeypatch.setattr(dbmod.settings, "HOST_LIMIT", 2)
+    monkeypatch.setattr(dbmod.settings, "HOST_LIMITS", {"mediafire.com": 1})
+    past = datetime.now() - timedelta(minutes=1)
+
+    def add(url, **kw):
+        return dbmod.db_add("url", {"url": url}, past, **kw)
+
+    mf = [add(f"https://www.mediafire.com/file/{i}/f.zip") for i in range(3)]
+    a = [add(f"https://a.example.com/{i}.bin") for i in range(3)]
+    b = add("https://cdn.b.org/x.bin")
+    # Un solo MediaFire; b.org (ocioso) pasa por delante del segundo de a.example.com
+    claimed = [r[0] for r in dbmod.db_claim_due(slots={"aria2": 2, "resolver": 3})]
+    assert claimed == [mf[0], a[0], b]
+    # De a.example.com caben dos; lo ya en curso cuenta (también de otros procesos)
+    assert [r[0] for r in dbmod.db_claim_due(slots={"aria2": 4, "resolver": 3})] == [a[1]]
+    assert dbmod.db_claim_due(slots={"aria2": 4, "resolver": 3}) == []
+
+    # Con prioridad mayor, un sitio ya ocupado sigue pasando por delante
+    dbmod.db_update_status(a[0], "done")
+    dbmod.db_update_status(b, "done")
+    late = add("https://new.example.net/x.bin")
+    dbmod.db_set_priority(a[2], 5)
+    assert [r[0] for r in dbmod.db_claim_due(slots={"aria2": 1})] == [a[2]]
+    assert [r[0] for r in dbmod.db_claim_due(slots={"aria2": 1})] == [late]
@@ -0,0 +1,88 @@
+# tests/test_progress_buffer.py
+from datetime import datetime
+
+from tgdl.core import db as dbmod
+from tgdl.core.progress import ProgressBuffer
+
+
+def test_buffer_keeps_latest_and_flushes_in_one_batch():
+    batches = []
+    buf = ProgressBuffer(batches.append, interval=3600)
+    for i in range(100):
+        buf.update(1, 1000, i)
+    buf.update(2, None, 5)
+    assert buf.pending() == 2
+    assert buf.flush() == 2
+    assert len(batches) == 1
+    rows = {r[0]: r for r in batches[0]}
+    assert rows[1][2] == 99 and rows[2][1] is None
+    assert buf.flush() == 0
+    buf.close()
+
+
+def test_failed_flush_keeps_rows_without_overwriting_newer():
+    calls = []
+
+    def _boom(rows):
+        calls.append(rows)
+        raise RuntimeError("disk")
+
+    buf = ProgressBuffer(_boom, interval=3600)
+    buf.update(1, 10, 3)
+    assert buf.flush() == 0
+    assert buf.pending() == 1
+
+
+def test_db_progress_is_write_behind(tmp_db, monkeypatch):
+    monkeypatch.setattr(dbmod.PROGRESS, "interval", 3600)
+    qid = dbmod.db_add("url", {"url": "https://e.x/a"}, datetime.now())
+    dbmod.db_update_progress(qid, 100, 10)
+    dbmod.db_update_progress(qid, 100, 40)
+    assert dbmod.db_get_progress_rows() == []
+
+    # fin del trabajo → volcado inmediato
+    dbmod.db_update_status(qid, "paused")
+    rows = dbmod.db_get_progress_rows()
+    assert [(r["qid"], r["downloaded"]) for r in rows] == [(qid, 40)]
+
+    # progreso de un qid borrado no rompe el lote
+    dbmod.db_update_progress(qid, 100, 50)
+    dbmod.db_update_progress(9999, 100, 50)
+    assert dbmod.db_flush_progress() == 2
+    assert [r["downloaded"] for r in dbmod.db_get_progress_rows()] == [50]
+
+
+def test_ewma_speed_and_eta_from_consecutive_samples():
+    batches = []
+    buf = ProgressBuffer(batches.append, interval=3600, ewma_sec=10.0)
+    buf.update(1, 1000, 0, now=0.0)
+    assert buf.rate(1) == (None, None)
+    buf.update(1, 1000, 100, now=1.0)
+    assert buf.rate(1) == (100.0, 9)
+    # Ráfagas más juntas que el mínimo no mueven la media
+    buf.update(1, 1000, 150, now=1.1)
+    assert buf.rate(1)[0] == 100.0
+    # Una muestra más rápida acerca la media sin saltar a ella
+    buf.update(1, 1000, 500, now=2.0)
+    speed, eta = buf.rate(1)
+    assert 100.0 < speed < 400.0 and eta == int(500 / speed)
+    # Reinicio (menos bytes que antes): la velocidad se recalcula desde cero
+    buf.update(1, 1000, 10, now=3.0)
+    assert buf.rate(1) == (None, None)
+
+    buf.flush()
+    assert batches[-1][0][4:] == (None, None)
+    buf.discard(1)
+    assert buf.rate(1) == (None, None)
+    buf.close()
+
+
+def test_speed_and_eta_are_persisted(tmp_db, monkeypatch):
+    monkeypatch.setattr(dbmod.PROGRESS, "interval", 3600)
+    qid = dbmod.db_add("url", {"url": "https://e.x/a"}, datetime.now())
+    dbmod.PROGRESS.update(qid, 1000, 0, now=0.0)
+    dbmod.PROGRESS.update(qid, 1000, 200, now=2.0)
+    assert dbmod.db_progress_rate(qid) == (100.0, 8)
+    dbmod.db_flush_progress()
+    [row] = dbmod.db_get_progress_rows()
+    assert (row["speed"], row["eta_sec"]) == (100.0, 8)
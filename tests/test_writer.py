@@ -0,0 +1,71 @@
+# tests/test_writer.py
+import threading
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from tgdl.core import db as dbmod
+from tgdl.core import writer as wmod
+
+
+def _count(sql, *args):
+    with dbmod._reader() as conn:
+        return conn.execute(sql, args).fetchone()[0]
+
+
+def test_batch_isolates_failing_op(tmp_db):
+    svc = wmod.WriterService(max_batch=16)
+    gate = threading.Event()
+    # Retiene el hilo para que lo siguiente se agrupe en un único lote
+    first = svc.submit(gate.wait, 5)
+    past = datetime.now() - timedelta(minutes=1)
+    futs = [svc.submit(dbmod.db_add, "url", {"url": f"https://e.x/{i}"}, past) for i in range(5)]
+
+    def _boom():
+        with dbmod._writer() as conn:
+            conn.execute("INSERT INTO kv(k,v) VALUES ('X','1')")
+        raise ValueError("boom")
+
+    bad = svc.submit(_boom)
+    gate.set()
+    first.result(timeout=5)
+    ids = [f.result(timeout=5) for f in futs]
+    with pytest.raises(ValueError):
+        bad.result(timeout=5)
+    svc.close()
+
+    assert ids == sorted(ids)
+    assert _count("SELECT COUNT(*) FROM queue") == 5
+    # El SAVEPOINT de la operación fallida deshizo su escritura parcial
+    assert _count("SELECT COUNT(*) FROM kv WHERE k='X'") == 0
+
+
+@pytest.mark.asyncio
+async def test_remote_write_falls_back_to_local(tmp_db):
+    sched = datetime.now().astimezone()
+    qid = await wmod.remote_write(
+        "db_add", "url", {"url": "https://e.x/a"}, sched, base_url="http://127.0.0.1:9"
+    )
+    assert _count("SELECT COUNT(*) FROM queue WHERE id=?", qid) == 1
+    await wmod.remote_write("db_delete_item", qid, base_url="http://127.0.0.1:9")
+    assert _count("SELECT COUNT(*) FROM queue") == 0
+
+
+@pytest.mark.asyncio
+async def test_remote_write_sends_panel_token(monkeypatch):
+    seen = {}
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        seen["token"] = request.headers.get("x-panel-token")
+        return httpx.Response(200, json={"ok": True, "result": 7})
+
+    real = httpx.AsyncClient
+    monkeypatch.setattr(
+        wmod.httpx,
+        "AsyncClient",
+        lambda **kw: real(transport=httpx.MockTransport(_handler), **kw),
+    )
+    monkeypatch.setattr(wmod.settings, "PANEL_TOKEN", "s3cret")
+    assert await wmod.remote_write("db_set_priority", 1, 2) == 7
+    assert seen["token"] == "s3cret"
@@ -68,3 +68,26 @@ async def test_403_then_429_subs_then_ok_without_subs(monkeypatch, tmp_path):
         allow_playlist=False,
     )
     assert ok is True
+
+
+@pytest.mark.asyncio
+async def test_failure_reports_error_lines(monkeypatch, tmp_path):
+    scenarios = [
+        (["[youtube] x: Downloading webpage", "ERROR: HTTP Error 429: Too Many Requests"], 1),
+        (["ERROR: unable to download video data: HTTP Error 429: Too Many Requests"], 1),
+    ]
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", _runner(scenarios))
+    monkeypatch.setattr(mod.shutil, "which", lambda _: "yt-dlp")
+    errors = []
+
+    ok = await mod.download_proc(
+        url="https://youtu.be/FtIOg3MFHAg",
+        outdir=tmp_path,
+        on_error=errors.append,
+    )
+    assert ok is False
+    # Los errores de todos los intentos, sin el ruido de progreso
+    assert errors == [
+        "ERROR: HTTP Error 429: Too Many Requests\n"
+        "ERROR: unable to download video data: HTTP Error 429: Too Many Requests"
+    ]
@@ -27,10 +27,10 @@ class Aria2Client:
 
     # ====== núcleo JSON-RPC ======
     @retry("aria2-rpc", tries=4, base_delay=0.4, jitter=True)
-    def _call(self, method: str, params: list[Any] | None = None) -> Any:
+    def _call(self, method: str, params: list[Any] | None = None, *, token: bool = True) -> Any:
         payload = {"jsonrpc": "2.0", "id": "tgdl", "method": method}
         p = list(params) if params else []
-        if self.secret:
+        if self.secret and token:
             p = [f"token:{self.secret}", *p]
         payload["params"] = p
 
@@ -55,10 +55,36 @@ class Aria2Client:
     def tell_active(self) -> Any:
         return self._call("aria2.tellActive", [])
 
+    _STATUS_KEYS = (
+        "status",
+        "totalLength",
+        "completedLength",
+        "files",
+        "errorCode",
+        "errorMessage",
+    )
+
     def tell_status(self, gid: str) -> dict:
         # Campos habituales para limpieza/estado
-        keys = ["status", "totalLength", "completedLength", "files", "errorCode", "errorMessage"]
-        return self._call("aria2.tellStatus", [gid, keys])
+        return self._call("aria2.tellStatus", [gid, list(self._STATUS_KEYS)])
+
+    def tell_status_many(self, gids: list[str]) -> dict[str, dict]:
+        """
+        tellStatus de varios GID en una sola petición (system.multicall).
+        Un GID que aria2 ya no conoce no aparece en el resultado.
+        """
+        if not gids:
+            return {}
+        calls = []
+        for gid in gids:
+            p: list[Any] = [gid, list(self._STATUS_KEYS)]
+            if self.secret:
+                # En multicall el token va en cada llamada, no en la externa
+                p = [f"token:{self.secret}", *p]
+            calls.append({"methodName": "aria2.tellStatus", "params": p})
+        res = self._call("system.multicall", [calls], token=False) or []
+        # Cada elemento es [resultado] o un fault {"code", "message"}
+        return {g: r[0] for g, r in zip(gids, res, strict=False) if isinstance(r, list) and r}
 
     def pause_all(self) -> Any:
         return self._call("aria2.pauseAll", [])
@@ -66,6 +92,9 @@ class Aria2Client:
     def unpause_all(self) -> Any:
         return self._call("aria2.unpauseAll", [])
 
+    def change_global_option(self, options: dict[str, str]) -> Any:
+        return self._call("aria2.changeGlobalOption", [options])
+
     def remove(self, gid: str) -> Any:
         try:
             return self._call("aria2.remove", [gid])
@@ -157,9 +186,18 @@ def unpause_all() -> Any:
     return ARIA2.unpause_all()
 
 
+def set_download_limit(bps: int | None) -> Any:
+    """Límite global de bajada de aria2 en B/s (None/0 = sin límite)."""
+    return ARIA2.change_global_option({"max-overall-download-limit": str(int(bps or 0))})
+
+
 def remove(gid: str) -> Any:
     return ARIA2.remove(gid)
 
 
 def tell_status(gid: str) -> dict:
     return ARIA2.tell_status(gid)
+
+
+def tell_status_many(gids: list[str]) -> dict[str, dict]:
+    return ARIA2.tell_status_many(gids)
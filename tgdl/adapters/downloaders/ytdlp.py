@@ -93,6 +93,7 @@ def _common_args(
     with_subs: bool = True,
     fmt_override: str | None = None,
     extractor_override: str | None = None,
+    limit_rate: int | None = None,
 ) -> list[str]:
     fmt = fmt_override or getattr(settings, "YTDLP_FORMAT", "bv*+ba/b")
     mrg = getattr(settings, "YTDLP_MERGE_FORMAT", "mp4")
@@ -191,6 +192,10 @@ def _common_args(
     if getattr(settings, "YTDLP_FORCE_IPV4", False):
         args += ["--force-ipv4"]
 
+    # Parte del presupuesto de ancho de banda (B/s) asignada a este proceso
+    if limit_rate:
+        args += ["--limit-rate", str(int(limit_rate))]
+
     # Permitir sobreescribir extractor-args (p.ej. 403 → usar sólo 'web')
     if extractor_override:
         args += ["--extractor-args", extractor_override]
@@ -225,6 +230,13 @@ def _looks_signin_bot(lines: list[str]) -> bool:
     return any(_RE_SIGNIN_BOT.search(ln or "") for ln in (lines or []))
 
 
+def _error_tail(lines: list[str], n: int = 5) -> str:
+    """Últimas líneas ERROR de todos los intentos (o la última línea) para registrar el fallo."""
+    errs = [ln for ln in (lines or []) if ln.lstrip().upper().startswith("ERROR")]
+    tail = errs[-n:] or [ln for ln in (lines or []) if ln.strip()][-1:]
+    return "\n".join(tail) or "yt-dlp: fallo sin salida"
+
+
 # ================= outtmpl helper =================
 def _default_outtmpl(outdir: Path) -> str:
     """
@@ -415,6 +427,8 @@ async def download_proc(
     allow_playlist: bool = False,
     progress_cb: Callable[[dict[str, Any]], None] | None = None,
     max_items: int | None = None,
+    limit_rate: int | None = None,
+    on_error: Callable[[str], None] | None = None,
 ) -> bool:
     logger.info(
         "[YTDLP][guard] playlistish=%s allow_playlist=%s", _url_has_playlistish(url), allow_playlist
@@ -459,6 +473,7 @@ async def download_proc(
                 with_subs=with_subs,
                 fmt_override=fmt_override,
                 extractor_override=extractor_override,
+                limit_rate=limit_rate,
             ),
         ]
 
@@ -664,6 +679,9 @@ async def download_proc(
     tail = lines2 or lines
     tail = tail[-40:] if len(tail) > 40 else tail
     logger.error("[YTDLP][fail] sin cookies también falló. Tail=%s", "\n".join(tail))
+    if on_error:
+        with contextlib.suppress(Exception):
+            on_error(_error_tail((lines or []) + (lines2 or [])))
     return False
 
 
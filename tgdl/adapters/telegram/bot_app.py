@@ -8,15 +8,16 @@ import os
 import re
 import secrets
 import time
+from collections import Counter
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any
+from typing import Annotated, Any
 from urllib.parse import parse_qs, urlparse
 from zoneinfo import ZoneInfo
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
 from telegram.error import BadRequest
@@ -38,31 +39,34 @@ from tgdl.adapters.downloaders.aria2 import (
     pause_all as aria2_pause_all,
 )
 from tgdl.adapters.downloaders.aria2 import remove as aria2_remove
+from tgdl.adapters.downloaders.aria2 import set_download_limit as aria2_set_download_limit
 from tgdl.adapters.downloaders.aria2 import tell_status as aria2_tell
+from tgdl.adapters.downloaders.aria2 import tell_status_many as aria2_tell_many
 from tgdl.adapters.downloaders.aria2 import (
     unpause_all as aria2_unpause_all,
 )
 from tgdl.config.settings import settings
+from tgdl.core import adb
+from tgdl.core.aimd import AimdController, Sample
+from tgdl.core.bandwidth import BandwidthBudget, budget_for
 from tgdl.core.db import (
-    _connect,
-    db_add,
-    db_clear_all,  # <- NUEVO
-    db_clear_progress,
-    db_get_all_queued,
-    db_get_due,
+    db_adopt_handoffs,
+    db_backend_limits,
+    db_count_by_status,
+    db_flush_progress,
+    db_get_ext_id_kind,
     db_get_flag,
-    db_get_progress_rows,  # <— NUEVO (para notificaciones)
     db_init,
-    db_list,
-    db_purge_finished,
+    db_progress_rate,
+    db_release_stale_leases,
     db_requeue_paused_reschedule_now,
-    db_retry_errors,
-    db_set_ext_id,
     db_set_flag,
     db_update_progress,
     db_update_status,
     is_paused,
 )
+from tgdl.core.writer import WRITE_OPS, WRITER, apply_op
+from tgdl.utils.backends import BACKENDS, backend_for
 from tgdl.utils.resolvers import resolve_mediafire_direct, resolve_sourceforge_direct
 
 # Logger del módulo (evita F821 y nos da trazas controladas)
@@ -93,8 +97,13 @@ PLAYLIST_CHOICES: dict[str, str] = {}
 
 # ========= Estado/Flags globales =========
 PAUSE_EVT: asyncio.Event = asyncio.Event()
-RUN_TASK: asyncio.Task | None = None
-RUNNING: dict[str, any] = {"ytdlp_proc": None}  # guardamos el subproceso activo de yt-dlp si lo hay
+# Dispatcher continuo: trabajos en curso por qid (y su backend) y evento para despertarlo
+ACTIVE: dict[int, asyncio.Task] = {}
+JOB_BACKEND: dict[int, str] = {}
+DISPATCH_EVT: asyncio.Event = asyncio.Event()
+DISPATCH: dict[str, Any] = {"task": None, "force": False, "notify_chat_id": None}
+# Subprocesos de yt-dlp en curso por qid (el backend puede llevar varios a la vez)
+RUNNING_PROCS: dict[int, asyncio.subprocess.Process] = {}
 
 # ========= Constantes y utilidades =========
 TZ = ZoneInfo(settings.TIMEZONE)
@@ -102,9 +111,6 @@ URL_RE = re.compile(r"(https?://\S+|magnet:\?xt=urn:btih:[A-Za-z0-9]+[^ \n]*)",
 TG_LINK_RE = re.compile(r"https?://t\.me/(c/)?([^/]+)/(\d+)", re.IGNORECASE)
 LINK_RE = re.compile(r"(?i)\b((?:magnet:\?xt=urn:[a-z0-9:]+)|(?:https?://[^\s]+))")
 
-MAX_WORKERS = 2
-WORK_SEM = asyncio.Semaphore(MAX_WORKERS)
-
 
 def extract_urls(text: str) -> list[str]:
     if not text:
@@ -132,12 +138,17 @@ class PauseSignal(RuntimeError):
 
 
 def _progress_cb_factory(qid: int):
-    def _cb(downloaded: int, total: int):
+    seen = {"bytes": 0}
+
+    async def _cb(downloaded: int, total: int):
         if is_paused():
             raise PauseSignal("Paused by user")
         # Normalizamos progreso y persistimos
         t = total if total and total >= downloaded else (downloaded if downloaded else 0)
         db_update_progress(qid, (t if t > 0 else None), downloaded)
+        # Telethon espera al callback: aquí se aplica su parte del ancho de banda
+        await BW.telegram.consume(downloaded - seen["bytes"])
+        seen["bytes"] = downloaded
 
     return _cb
 
@@ -156,6 +167,16 @@ def _fmt_size(n: int) -> str:
     return f"{x:.1f} {units[i]}"
 
 
+def _fmt_rate(speed: float | None, eta: int | None) -> str:
+    """' — 1.2 MiB/s · ETA 0:03:12' a partir de la EWMA del progreso ('' si no hay datos)."""
+    parts = []
+    if speed:
+        parts.append(f"{_fmt_size(int(speed))}/s")
+    if eta is not None and speed:
+        parts.append(f"ETA {timedelta(seconds=int(eta))}" if eta < 86400 else "ETA >1d")
+    return (" — " + " · ".join(parts)) if parts else ""
+
+
 async def _track_aria2_progress(
     gid: str,
     chat_id: int,
@@ -163,9 +184,11 @@ async def _track_aria2_progress(
     *,
     every_sec: int | None = None,
     min_pct_step: int | None = None,
+    qid: int | None = None,
 ) -> None:
     """
     Hace polling a aria2.tellStatus(gid) y envía mensajes al chat con progreso y resultado.
+    - Con `qid`, añade velocidad y ETA (EWMA del ProgressBuffer).
     - Envía update cada `min_pct_step`% o cada 60s si no hubo cambio suficiente.
     - Finaliza al llegar a status 'complete' o 'error' o si el GID desaparece.
     No lanza excepciones; registra y sale silenciosamente ante errores persistentes.
@@ -230,9 +253,10 @@ async def _track_aria2_progress(
                 now - last_ts >= keepalive and status == "active"
             ):
                 # Mensaje único editable para anti-spam
+                rate = _fmt_rate(*db_progress_rate(qid)) if qid is not None else ""
                 txt = (
                     f"⬇️ Descargando: *{(name or gid)}*\n"
-                    f"{pct}%  ({_fmt_size(done)} / {_fmt_size(total)})"
+                    f"{pct}%  ({_fmt_size(done)} / {_fmt_size(total)}){rate}"
                 )
                 with contextlib.suppress(Exception):
                     if progress_msg is None:
@@ -291,73 +315,117 @@ async def _track_aria2_progress(
         logger.error("progress tracker crashed gid=%s err=%r", gid, e)
 
 
-async def _await_aria2_and_notify(
-    qid: int, gid: str, notify_chat_id: int | None, bot
-) -> tuple[str, str]:
+@dataclass
+class Aria2Handoff:
+    """Descarga entregada a aria2: ya no ocupa cupo, la sigue _aria2_watcher."""
+
+    gid: str
+    chat_id: int | None
+    tracker: asyncio.Task | None = None
+
+
+# qid -> descarga en aria2 pendiente de terminar; un único bucle las consulta todas
+HANDOFFS: dict[int, Aria2Handoff] = {}
+WATCHER: dict[str, asyncio.Task | None] = {"task": None}
+
+
+async def _hand_off_aria2(app, qid: int, gid: str, notify_chat_id: int | None) -> None:
+    """Registra el GID y suelta el trabajo: el worker (y su cupo) queda libre ya."""
+    await adb.db_set_ext_id(qid, gid)
+    _watch_aria2(app, qid, gid, notify_chat_id)
+
+
+def _watch_aria2(app, qid: int, gid: str, notify_chat_id: int | None) -> None:
+    tracker = None
+    if notify_chat_id:
+        # Mensaje editable de progreso (lee su cadencia de .env)
+        tracker = asyncio.create_task(_track_aria2_progress(gid, notify_chat_id, app.bot, qid=qid))
+    HANDOFFS[qid] = Aria2Handoff(gid, notify_chat_id, tracker)
+    _kick_bw()
+    task = WATCHER["task"]
+    if task is None or task.done():
+        WATCHER["task"] = asyncio.create_task(_aria2_watcher(app))
+
+
+def _aria2_files(st: dict) -> tuple[str, str, int, int]:
+    """(ruta del primer fichero, nombre, total, descargado) de un tellStatus."""
+    files = st.get("files") or []
+    path = (files[0].get("path") or "").strip() if files else ""
+    total = int(st.get("totalLength") or 0)
+    done = int(st.get("completedLength") or 0)
+    return path, (Path(path).name if path else ""), total, done
+
+
+async def _drop_handoff(qid: int) -> None:
     """
-    Espera cooperativamente a que aria2 complete/erroree/sea removido.
-    Actualiza progreso en DB y usa _track_aria2_progress para UX.
-    Retorna (status_final, filename_resuelto).
+    Deja de vigilar la entrega a aria2 de `qid`. Va antes de quitarla de aria2: si
+    no, el watcher vería el GID eliminado y archivaría el trabajo como error.
+    Corre en el loop del bot, dueño de HANDOFFS y de los trackers.
     """
-    status = "unknown"
-    filename = ""
-    # Lanzar tracker de mensaje editable (sin bloquear) si hay chat
-    tracker = None
-    try:
-        if notify_chat_id:
-            # Dejamos que _track_aria2_progress lea los valores desde .env
-            tracker = asyncio.create_task(
-                _track_aria2_progress(gid, notify_chat_id, bot, every_sec=None, min_pct_step=None)
-            )
-        while True:
-            await asyncio.sleep(2)
-            st = {}
-            try:
-                st = aria2_tell(gid) or {}
-            except Exception:
-                st = {}
-            status = (st.get("status") or "").lower()
-            # Derivar nombre, total y done para progreso/retorno
-            files = st.get("files") or []
-            if files:
-                p0 = (files[0].get("path") or "").strip()
-                if p0:
-                    try:
-                        filename = Path(p0).name or filename
-                    except Exception:
-                        pass
+    h = HANDOFFS.pop(qid, None)
+    if h and h.tracker:
+        h.tracker.cancel()
 
-            total = int(st.get("totalLength") or 0)
-            done = int(st.get("completedLength") or 0)
-            # Persistimos progreso para el panel
-            try:
-                t = total if total and total >= done else (done or 0)
+
+async def _aria2_watcher(app):
+    """
+    Sigue todas las descargas entregadas a aria2 con una sola RPC por vuelta
+    (system.multicall): vuelca su progreso y, al terminar, deja el estado final y
+    avisa. Si aria2 no responde se reintenta en la vuelta siguiente sin tocar nada.
+    """
+    while HANDOFFS:
+        await asyncio.sleep(settings.ARIA2_WATCH_SEC)
+        watching = dict(HANDOFFS)
+        try:
+            states = await asyncio.to_thread(aria2_tell_many, [h.gid for h in watching.values()])
+        except Exception as e:
+            logger.warning("aria2 watcher: tellStatus falló: %r", e)
+            continue
+        for qid, h in watching.items():
+            st = states.get(h.gid)
+            # GID desconocido para aria2: lo quitaron (o aria2 se reinició sin sesión)
+            status = (st or {}).get("status", "removed").lower()
+            path, name, total, done = _aria2_files(st or {})
+            if st is not None:
+                t = total if total and total >= done else done
                 db_update_progress(qid, (t if t > 0 else None), done)
-            except Exception:
-                pass
-            if status in {"complete", "error", "removed"}:
-                break
-            # Cortesía: si no hay status, asumimos removido/cancelado
-            if not status:
-                status = "removed"
-                break
-    finally:
-        if tracker:
-            with contextlib.suppress(Exception):
-                tracker.cancel()
+            if status in {"complete", "error", "removed"} and HANDOFFS.pop(qid, None):
+                try:
+                    await _finish_aria2(app, qid, h, status, st or {}, path, name, total)
+                except Exception as e:
+                    print(f"[DBG] aria2 finish id={qid}: {e!r}")
+                DISPATCH_EVT.set()  # por si el tope de entregas frenaba al dispatcher
+                _kick_bw()
+
+
+async def _finish_aria2(
+    app, qid: int, h: Aria2Handoff, status: str, st: dict, path: str, name: str, total: int
+) -> None:
+    if h.tracker:
+        h.tracker.cancel()
+    ok = status == "complete"
+    if ok:
+        await adb.db_update_status(qid, "done", final_path=path or None, size_bytes=total or None)
+    elif PAUSE_EVT.is_set():
+        await adb.db_update_status(qid, "paused")
+    elif status == "removed":
+        # Alguien la quitó de aria2 a propósito: reintentar no tiene sentido
+        await adb.db_update_status(qid, "error", error="aria2: descarga eliminada", retry=False)
+    else:
+        detail = st.get("errorMessage") or st.get("errorCode") or "error"
+        await adb.db_update_status(qid, "error", error=f"aria2: {detail}")
+    if ok or not PAUSE_EVT.is_set():
+        await adb.db_clear_progress(qid)
     # Mensaje final explícito (además del tracker editable), para garantizar visibilidad
-    try:
-        if notify_chat_id:
-            ico = "✅" if status == "complete" else ("⛔" if status == "removed" else "❌")
-            name = filename or gid
-            await bot.send_message(
-                chat_id=notify_chat_id,
-                text=f"{ico} Descarga {'completada' if status == 'complete' else 'cancelada' if status == 'removed' else 'con error'}: {name}",
+    if h.chat_id:
+        ico = "✅" if ok else ("⛔" if status == "removed" else "❌")
+        what = "completada" if ok else "cancelada" if status == "removed" else "con error"
+        with contextlib.suppress(Exception):
+            await app.bot.send_message(
+                chat_id=h.chat_id,
+                text=f"{ico} Descarga {what}: {name or h.gid}",
                 disable_web_page_preview=True,
             )
-    except Exception:
-        pass
-    return status, (filename or "")
 
 
 def _slugify(name: str) -> str:
@@ -423,8 +491,9 @@ async def telethon_download_core(
     except PauseSignal:
         raise
     except Exception as e:
+        # El fallo (FloodWait incluido) sube hasta _run_job, que lo registra con el trabajo
         print(f"[DBG] Error descarga: {e!r}")
-        return None
+        raise
 
 
 async def telethon_download_by_link(client: TelegramClient, url: str, dest_dir: Path, qid: int):
@@ -560,15 +629,87 @@ def fmt_start_message_html() -> str:
     )
 
 
-def fmt_status_message_html() -> str:
+def fmt_today_line(rollup: dict[str, dict[str, int]]) -> str:
+    """Resumen del día a partir de events_rollup (sin recorrer events)."""
+    done = rollup.get("done", {})
+    err = sum(rollup.get(k, {}).get("n", 0) for k in ("error", "dead"))
+    return (
+        f"Hoy: {done.get('n', 0)} completada(s), {err} con error · "
+        f"{_fmt_size(sum(r.get('bytes', 0) for r in rollup.values()))}"
+    )
+
+
+def fmt_limits_line(limits: dict[str, int], running: dict[str, int], handed_off: int = 0) -> str:
+    """
+    Cupos por backend como 'aria2 1/2 · ytdlp 0/1 · …' (en curso/máximo), más las
+    descargas ya entregadas a aria2, que no ocupan cupo.
+    """
+    line = " · ".join(f"{b} {running.get(b, 0)}/{limits.get(b, 0)}" for b in BACKENDS)
+    return f"{line} · en aria2: {handed_off}" if handed_off else line
+
+
+async def _limits_line() -> str:
+    return fmt_limits_line(
+        db_backend_limits(),
+        await adb.db_running_by_backend(),
+        await adb.db_count_handed_off(),
+    )
+
+
+def fmt_bw_line() -> str:
+    """'Ancho de banda: 2.5 MiB/s (aria2 … · Telethon … · yt-dlp 1x…)' o '' sin límite."""
+    if BW.total is None:
+        return ""
+    plan = BW.plan(*_bw_counts())
+    parts = [
+        f"{b} {_fmt_size(plan[k] or 0)}/s"
+        for k, b in (("aria2", "aria2"), ("telegram", "Telethon"))
+    ]
+    if BW.ytdlp:
+        parts.append(f"yt-dlp {len(BW.ytdlp)}×{_fmt_size(max(BW.ytdlp.values()))}/s")
+    return f"Ancho de banda: {_fmt_size(BW.total)}/s ({' · '.join(parts)})"
+
+
+async def fmt_status_message_html() -> str:
     p = is_paused()
+    today = fmt_today_line(await adb.db_rollup("d"))
+    limits = await _limits_line()
+    bw = fmt_bw_line()
     return (
         "📊 <b>Estado actual</b>\n"
         f"• Modo: {'<b>PAUSADO</b> ⏸️' if p else '<b>ACTIVO</b> ▶️'}\n"
         f"• Hora programada: <b>{settings.SCHEDULE_HOUR:02d}:00</b> (<code>{settings.TIMEZONE}</code>)\n"
+        f"• {today}\n"
+        f"• Cupos: {limits}\n" + (f"• {bw}\n" if bw else "")
     )
 
 
+async def fmt_queue_page_html(limit: int = 20, before_id: int | None = None):
+    """(texto HTML, cursor siguiente) de una página de la cola; texto None si vacía."""
+    rows, nxt = await adb.db_list_page(limit=limit, before_id=before_id)
+    if not rows:
+        return None, None
+    lines = ["📋 <b>Cola reciente</b>\n"]
+    for r in rows:
+        # url/suggested_name vienen de columnas generadas: sin json.loads por fila
+        title = r["suggested_name"] or r["url"] or f"{(r['payload'] or '')[:60]}…"
+        retry = f" (intento {r['attempts'] + 1})" if r["attempts"] else ""
+        lines.append(
+            f"• #{r['id']} [{r['kind']}] {r['status']}{retry} — {r['scheduled_at']}\n"
+            f"  <code>{title}</code>"
+        )
+    return "\n".join(lines), nxt
+
+
+def mk_list_menu(next_cursor: int | None, with_main: bool = False) -> InlineKeyboardMarkup | None:
+    rows = []
+    if next_cursor is not None:
+        rows.append([InlineKeyboardButton("Más ▶️", callback_data=f"act:list:{next_cursor}")])
+    if with_main:
+        rows.append([InlineKeyboardButton("⬅️ Volver", callback_data="act:back")])
+    return InlineKeyboardMarkup(rows) if rows else None
+
+
 # ========= Handlers auxiliares (playlists, etc) =========
 def _is_youtube(u: str) -> bool:
     low = u.lower()
@@ -667,42 +808,215 @@ def reconfigure_scheduler(app):
     cfg = load_sched_config()
     from apscheduler.triggers.cron import CronTrigger
 
-    SCHEDULER.remove_all_jobs()
+    # Solo los trabajos de la ventana; el resto (p. ej. mantenimiento) se conserva
+    for job_id in ("window_start", "window_stop"):
+        if SCHEDULER.get_job(job_id):
+            SCHEDULER.remove_job(job_id)
 
     if cfg["enabled"]:
-        SCHEDULER.add_job(run_cycle, CronTrigger(hour=cfg["win_start"], minute=0), args=[app])
+
+        async def _window_start():
+            # Reabre solo la pausa puesta por la ventana; una pausa manual se respeta
+            if db_get_flag("AUTO_PAUSED", "0") == "1":
+                await adb.db_set_flag("AUTO_PAUSED", "0")
+                await adb.db_set_flag("PAUSED", "0")
+            wake_dispatcher(app)
+
+        SCHEDULER.add_job(
+            _window_start,
+            CronTrigger(hour=cfg["win_start"], minute=0),
+            id="window_start",
+            replace_existing=True,
+        )
 
         def _auto_pause():
+            if not is_paused():
+                db_set_flag("AUTO_PAUSED", "1")
             db_set_flag("PAUSED", "1")
 
-        SCHEDULER.add_job(_auto_pause, CronTrigger(hour=cfg["win_stop"], minute=0))
+        SCHEDULER.add_job(
+            _auto_pause,
+            CronTrigger(hour=cfg["win_stop"], minute=0),
+            id="window_stop",
+            replace_existing=True,
+        )
     # Si no hay ventana (24/7), no programamos nada periódico aquí.
 
 
-async def launch_cycle_background(app, force_all: bool = False, notify_chat_id: int | None = None):
-    global RUN_TASK
-    if RUN_TASK and not RUN_TASK.done():
-        # Ya hay un ciclo corriendo; no lances otro
-        return False
-    # Programa el ciclo como tarea background y devuelve inmediatamente
-    RUN_TASK = asyncio.create_task(
-        run_cycle(app, force_all=force_all, notify_chat_id=notify_chat_id)
-    )
-    return True
+def wake_dispatcher(app=None, *, force_all: bool = False, notify_chat_id: int | None = None):
+    """
+    Despierta el dispatcher (y lo arranca si aún no corre). Debe llamarse desde el loop.
+    force_all: despacha también lo programado para más tarde hasta vaciar lo pendiente.
+    """
+    if force_all:
+        DISPATCH["force"] = True
+    if notify_chat_id:
+        DISPATCH["notify_chat_id"] = notify_chat_id
+    app = app or BOT.app
+    task = DISPATCH["task"]
+    if (task is None or task.done()) and app is not None:
+        DISPATCH["task"] = asyncio.create_task(_dispatcher(app))
+    DISPATCH_EVT.set()
 
 
 # ========= Ciclo programado =========
 
 
+async def _events_retention():
+    """Poda periódica de events (edad + tope de filas) y de rollups horarios."""
+    try:
+        n = await adb.db_prune_events()
+        if n:
+            logger.info("events retention: %d evento(s) eliminados", n)
+    except Exception as e:
+        logger.warning("events retention failed: %r", e)
+
+
+async def _db_maintenance():
+    """
+    Mantenimiento periódico de SQLite. Siempre checkpoint PASSIVE + optimize; en
+    ventana tranquila (sin ciclo ni trabajos en curso) además TRUNCATE del WAL y
+    vacuum incremental de lo liberado por /purge, /clear o la retención.
+    """
+    try:
+        counts = await adb.read(db_count_by_status, False)
+        idle = not ACTIVE and not counts.get("running")
+        m = await adb.db_maintenance(truncate=idle, vacuum=idle)
+        logger.info(
+            "db maintenance (%s): %d ms, %d página(s) liberadas, %d B recuperados, wal=%d B",
+            m["mode"],
+            m["duration_ms"],
+            m["pages_freed"],
+            m["bytes"],
+            m["wal_bytes"],
+        )
+        if idle and not m["incremental"]:
+            # La conversión reescribe toda la DB: no se hace sola, se pide a mano
+            logger.info("db sin auto_vacuum incremental: ejecuta `tgdl.cli db-vacuum` una vez")
+    except Exception as e:
+        logger.warning("db maintenance failed: %r", e)
+
+
+def _kick_maintenance() -> None:
+    """Adelanta la próxima pasada de mantenimiento (tras borrados masivos)."""
+    try:
+        if SCHEDULER is not None:
+            SCHEDULER.modify_job("db_maintenance", next_run_time=datetime.now(TZ))
+    except Exception:
+        pass
+
+
+# Ajuste automático de cupos (AIMD): solo backends conocidos
+AIMD = AimdController(
+    {b: v for b, v in settings.AIMD_BOUNDS.items() if b in BACKENDS},
+    error_rate=settings.AIMD_ERROR_RATE,
+)
+AIMD_SEEN: dict[str, int | None] = {"event_id": None}  # último evento ya contado
+
+
+def _aimd_samples(outcomes: dict[str, dict[str, int]]) -> dict[str, Sample]:
+    samples = {b: Sample(**outcomes.get(b, {})) for b in BACKENDS}
+    for qid, backend in JOB_BACKEND.items():
+        samples[backend].running += 1
+        samples[backend].throughput += db_progress_rate(qid)[0] or 0.0
+    # Lo entregado a aria2 no ocupa cupo, pero sus bytes son de aria2
+    for qid in HANDOFFS:
+        samples["aria2"].throughput += db_progress_rate(qid)[0] or 0.0
+    return samples
+
+
+async def _aimd_tick():
+    """Muestra throughput y fallos por backend y aplica los cupos que decida AIMD."""
+    try:
+        outcomes, AIMD_SEEN["event_id"] = await adb.db_job_outcomes(AIMD_SEEN["event_id"])
+        limits = db_backend_limits()
+        decisions = AIMD.step(limits, _aimd_samples(outcomes))
+        for d in decisions:
+            logger.info(
+                "aimd: %s %d -> %d (%s, %.0f B/s)", d.backend, d.old, d.new, d.reason, d.throughput
+            )
+            await adb.db_set_backend_limit(d.backend, d.new)
+            limits[d.backend] = d.new
+        await adb.db_set_flag(
+            "AIMD_LAST", json.dumps({"at": datetime.now(TZ).isoformat(), **AIMD.metrics(limits)})
+        )
+        if decisions:
+            wake_dispatcher()  # una subida se aprovecha ya
+    except Exception as e:
+        logger.warning("aimd failed: %r", e)
+
+
+# Presupuesto de ancho de banda por franja (BANDWIDTH_WINDOWS)
+BW = BandwidthBudget(floor=max(1, settings.BANDWIDTH_MIN_KIB) * 1024)
+BW_ARIA2: dict[str, int | None] = {"sent": None}  # último límite aplicado en aria2
+
+
+def _bw_counts() -> tuple[int, int]:
+    """Transferencias en curso de aria2 (entregadas) y de Telethon."""
+    return len(HANDOFFS), sum(1 for b in JOB_BACKEND.values() if b == "telegram")
+
+
+async def _rebalance_bw() -> None:
+    """Recalcula el presupuesto vigente y lo reparte entre aria2 y Telethon."""
+    BW.total = budget_for(datetime.now(TZ), settings.BANDWIDTH_WINDOWS)
+    plan = BW.plan(*_bw_counts())
+    BW.telegram.set_rate(plan["telegram"])
+    limit = plan["aria2"] or 0
+    if limit != BW_ARIA2["sent"]:
+        try:
+            await asyncio.to_thread(aria2_set_download_limit, limit)
+            BW_ARIA2["sent"] = limit
+        except Exception as e:
+            logger.warning("bandwidth: aria2 changeGlobalOption falló: %r", e)
+
+
+def _kick_bw() -> None:
+    """Reparto en segundo plano tras un arranque/fin; sin franjas no se toca nada."""
+    if settings.BANDWIDTH_WINDOWS:
+        with contextlib.suppress(RuntimeError):  # sin loop (tests/arranque)
+            asyncio.get_running_loop().create_task(_rebalance_bw())
+
+
+async def _lease_heartbeat():
+    """Renueva los leases de los trabajos en curso y recupera los vencidos de otros."""
+    every = max(5.0, settings.LEASE_SEC / 3)
+    while True:
+        try:
+            await adb.db_renew_leases()
+            n = await adb.db_sweep_expired_leases()
+            if n:
+                logger.warning("lease sweep: %d trabajo(s) devueltos a 'queued'", n)
+        except Exception as e:
+            logger.warning("lease heartbeat failed: %r", e)
+        await asyncio.sleep(every)
+
+
 async def _progress_notifier(app, chat_id, stop_evt: asyncio.Event):
     last_sent: dict[int, float] = {}
     summary_msg = None  # mensaje único editable
+    seq: int | None = None
+    rows_by_qid: dict[int, dict] = {}
     while not stop_evt.is_set():
-        rows = db_get_progress_rows(50)
+        # Solo deltas del feed de cambios; sin cambios en progress no se lee nada más
+        changes, head, reset = await adb.db_changes_since(seq or 0, 500, "progress")
+        if seq is None or reset or len(changes) >= 500:
+            rows_by_qid = {r["qid"]: r for r in await adb.db_get_progress_rows(50)}
+        elif changes:
+            for _, _, op, qid in changes:
+                if op == "D":
+                    rows_by_qid.pop(qid, None)
+            upd = [qid for _, _, op, qid in changes if op != "D"]
+            for r in await adb.db_get_progress_for(upd):
+                rows_by_qid[r["qid"]] = r
+        else:
+            seq = head
+            await asyncio.sleep(settings.PROGRESS_SUMMARY_EVERY)
+            continue
+        seq = head
         now = asyncio.get_event_loop().time()
         lines = []
         count = 0
-        for r in rows:
+        for r in rows_by_qid.values():
             qid = r["qid"]
             total = r.get("total") or 0
             done = r.get("downloaded") or 0
@@ -716,7 +1030,10 @@ async def _progress_notifier(app, chat_id, stop_evt: asyncio.Event):
             pct = 0
             if total > 0:
                 pct = min(100, (int(done) * 100) // int(total))
-            line = f"• *{name}* — {pct}%  ({_fmt_size(int(done))} / {_fmt_size(int(total))})"
+            line = (
+                f"• *{name}* — {pct}%  ({_fmt_size(int(done))} / {_fmt_size(int(total))})"
+                f"{_fmt_rate(r.get('speed'), r.get('eta_sec'))}"
+            )
             lines.append(line)
             count += 1
             if count >= 5:
@@ -745,441 +1062,464 @@ async def _progress_notifier(app, chat_id, stop_evt: asyncio.Event):
         await asyncio.sleep(settings.PROGRESS_SUMMARY_EVERY)
 
 
-async def run_cycle(app, force_all: bool = False, notify_chat_id: int | None = None):
-    outdir = Path(settings.DOWNLOAD_DIR)
-    outdir.mkdir(parents=True, exist_ok=True)
-    outdir_base = Path(settings.DOWNLOAD_DIR)
+def _sync_notifier(app, stop_evt: asyncio.Event | None) -> asyncio.Event | None:
+    """Resumen global de progreso (opcional): vive mientras haya trabajos en curso."""
+    chat_id = DISPATCH["notify_chat_id"]
+    if ACTIVE and stop_evt is None and chat_id and settings.PROGRESS_SUMMARY_ENABLE:
+        stop_evt = asyncio.Event()
+        asyncio.create_task(_progress_notifier(app, chat_id, stop_evt))
+    elif not ACTIVE and stop_evt is not None:
+        stop_evt.set()
+        stop_evt = None
+    return stop_evt
 
-    if is_paused():
-        print("[DBG] Ciclo omitido: PAUSADO")
-        return
-    # limpiar/asegurar estado de pausa
-    PAUSE_EVT.clear()
 
-    now = datetime.now(tz=TZ)
-    rows = db_get_all_queued() if force_all else db_get_due(now)
-
-    notify_stop_evt = asyncio.Event()
-    notifier_task = None
-    # El resumen global es opcional (por defecto deshabilitado)
-    if notify_chat_id and settings.PROGRESS_SUMMARY_ENABLE:
-        notifier_task = asyncio.create_task(
-            _progress_notifier(app, notify_chat_id, notify_stop_evt)
-        )
+def _job_backend(kind: str, payload_json: str) -> str:
+    try:
+        return backend_for(kind, json.loads(payload_json))
+    except ValueError:
+        return "aria2"  # payload roto: _run_job lo marcará en error
 
-    print(f"[DBG] run_cycle start | force_all={force_all} | items={len(rows)}")
 
-    tclient: TelegramClient = BOT.tclient
-    tasks = []
-    for qid, kind, payload_json in rows:
-        # Diagnóstico por ítem (suave, no ruidoso)
+def _start_job(app, qid: int, kind: str, payload_json: str, backend: str) -> None:
+    task = asyncio.create_task(_run_job(app, qid, kind, payload_json, DISPATCH["notify_chat_id"]))
+    ACTIVE[qid] = task
+    JOB_BACKEND[qid] = backend
+    if backend == "telegram":
+        _kick_bw()
+
+    def _done(t: asyncio.Task) -> None:
+        ACTIVE.pop(qid, None)
+        JOB_BACKEND.pop(qid, None)
+        BW.release(qid)
+        _kick_bw()
+        if not t.cancelled() and t.exception() is not None:
+            print(f"[DBG] worker fail: {t.exception()!r}")
+        RUNNING_PROCS.pop(qid, None)
+        DISPATCH_EVT.set()  # hueco libre: el dispatcher reclama el siguiente
+
+    task.add_done_callback(_done)
+
+
+async def _dispatcher(app):
+    """
+    Pool continuo de workers: reclama trabajos vencidos a medida que quedan huecos,
+    con un cupo por backend (db_backend_limits) para que un backend lento (p. ej.
+    torrents largos en aria2) no bloquee a los demás, y otro por sitio (HOST_LIMITS)
+    para no saturar un mismo dominio. Se despierta al instante con wake_dispatcher()
+    (intake, /now, /resume, panel) o al terminar un trabajo y, como mucho, cada DISPATCH_POLL_SEC
+    para recoger lo programado y los reintentos que van venciendo.
+    Con PAUSED no reclama nada; los trabajos en curso atienden PAUSE_EVT.
+    """
+    notify_stop: asyncio.Event | None = None
+    while True:
+        DISPATCH_EVT.clear()
         try:
-            _p = json.loads(payload_json)
-            if kind == "url":
-                _u = (_p.get("url") or "")[:140]
-                print(f"[DBG] item#{qid} kind=url | aria2_enabled={aria2_enabled()} | url={_u!r}")
-        except Exception:
-            pass
-        # Chequeo cooperativo de pausa antes de arrancar cada item
-        if is_paused() or PAUSE_EVT.is_set():
-            db_update_status(qid, "paused")
-            continue
+            if is_paused():
+                DISPATCH["force"] = False
+            else:
+                if PAUSE_EVT.is_set() and not ACTIVE:
+                    PAUSE_EVT.clear()  # la pausa anterior ya drenó
+                limits = db_backend_limits()
+                busy = Counter(JOB_BACKEND.values())
+                if 0 < settings.ARIA2_MAX_HANDOFFS <= len(HANDOFFS):
+                    # aria2 ya lleva demasiadas: no se le entregan más hasta que acabe alguna
+                    limits = {**limits, "aria2": 0, "resolver": 0}
+                slots = {b: n - busy[b] for b, n in limits.items() if n > busy[b]}
+                if slots and not PAUSE_EVT.is_set():
+                    rows = await adb.db_claim_due(
+                        now=datetime.now(tz=TZ), ignore_schedule=DISPATCH["force"], slots=slots
+                    )
+                    for qid, kind, payload_json in rows:
+                        _start_job(app, qid, kind, payload_json, _job_backend(kind, payload_json))
+                # Un cupo sin llenar no basta para dar /now por terminado (puede ser el cupo
+                # por sitio): se deja de forzar cuando ya no sale nada y no hay workers
+                if not ACTIVE:
+                    DISPATCH["force"] = False
+            notify_stop = _sync_notifier(app, notify_stop)
+        except Exception as e:
+            logger.warning("dispatcher: %r", e)
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(DISPATCH_EVT.wait(), timeout=settings.DISPATCH_POLL_SEC)
+
+
+async def _run_job(app, qid: int, kind: str, payload_json: str, notify_chat_id: int | None):
+    """Ejecuta un trabajo ya reclamado (running con lease) y deja su estado final."""
+    outdir_base = Path(settings.DOWNLOAD_DIR)
+    outdir_base.mkdir(parents=True, exist_ok=True)
+    tclient: TelegramClient = BOT.tclient
+    try:
+        payload = json.loads(payload_json)
+        # normaliza el chat de notificación para TODO el item
+        row_notify_chat_id = payload.get("notify_chat_id") or notify_chat_id
+        if kind == "url":
+            # Diagnóstico por ítem (suave, no ruidoso)
+            _u = (payload.get("url") or "")[:140]
+            print(f"[DBG] item#{qid} kind=url | aria2_enabled={aria2_enabled()} | url={_u!r}")
+
+        if kind == "url":
+            url = payload["url"]
+            low = url.lower()
+            ok = False
+            err: str | None = None  # motivo del fallo, para reintentos y el AIMD
+            outdir = pick_outdir("url", payload, outdir_base)
+            await asyncio.sleep(0)  # cede el control al loop
+            # if "mega.nz/" in low:
+            #    print("[URL] MEGA no soportado en este proyecto.")
+            #    ok = False
+
+            if low.endswith(".torrent"):
+                # Descarga el .torrent a temp y envíalo a aria2
+                import tempfile
+
+                import httpx
+
+                from tgdl.utils.retry import retry
+
+                @retry("http", tries=4, base_delay=0.6)
+                async def _pull(u: str) -> bytes:
+                    async with httpx.AsyncClient(timeout=30.0) as cli:
+                        r = await cli.get(u)
+                        r.raise_for_status()
+                        return r.content
+
+                blob = await _pull(url)
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".torrent") as tf:
+                    tf.write(blob)
+                    tf.flush()
+                    tpath = Path(tf.name)
+
+                from tgdl.adapters.downloaders.aria2 import (
+                    add_torrent as aria2_add_torrent,
+                )
+
+                gid = aria2_add_torrent(tpath, outdir)
+                with contextlib.suppress(Exception):
+                    tpath.unlink(missing_ok=True)
+                # aria2 sigue con la descarga: el watcher deja el estado final
+                await _hand_off_aria2(app, qid, gid, row_notify_chat_id)
+                return
 
-        async def _worker(qid=qid, kind=kind, payload_json=payload_json):
-            async with WORK_SEM:
+            elif "mediafire.com/file/" in low:
                 try:
-                    payload = json.loads(payload_json)
-                    # normaliza el chat de notificación para TODO el item
-                    row_notify_chat_id = payload.get("notify_chat_id") or notify_chat_id
+                    direct, hdrs = await resolve_mediafire_direct(url)
+                    if direct and aria2_enabled():
+                        gid = aria2_add(direct, outdir, headers=hdrs)
+                        await _hand_off_aria2(app, qid, gid, row_notify_chat_id)
+                        return
+                    else:
+                        ok = False
+                except Exception as e:
+                    print(f"[DBG] mediafire error: {e!r}")
+                    ok, err = False, f"mediafire: {e!r}"
 
-                    if kind == "url":
-                        url = payload["url"]
-                        low = url.lower()
+            elif "sourceforge.net/" in low:
+                try:
+                    direct, hdrs = await resolve_sourceforge_direct(url)
+                    if not aria2_enabled():
+                        print(
+                            "[DBG] SourceForge: aria2_enabled()=False. Revisa RPC URL/secret/estado de aria2."
+                        )
                         ok = False
-                        outdir = pick_outdir("url", payload, outdir_base)
-                        await asyncio.sleep(0)  # cede el control al loop
-                        # if "mega.nz/" in low:
-                        #    print("[URL] MEGA no soportado en este proyecto.")
-                        #    ok = False
-
-                        if low.endswith(".torrent"):
-                            # Descarga el .torrent a temp y envíalo a aria2
-                            import tempfile
-
-                            import httpx
-
-                            from tgdl.utils.retry import retry
-
-                            @retry("http", tries=4, base_delay=0.6)
-                            async def _pull(u: str) -> bytes:
-                                async with httpx.AsyncClient(timeout=30.0) as cli:
-                                    r = await cli.get(u)
-                                    r.raise_for_status()
-                                    return r.content
-
-                            blob = await _pull(url)
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=".torrent") as tf:
-                                tf.write(blob)
-                                tf.flush()
-                                tpath = Path(tf.name)
-
-                            from tgdl.adapters.downloaders.aria2 import (
-                                add_torrent as aria2_add_torrent,
+                    else:
+                        # Si no hubo 'direct', el resolver ya habrá intentado construir uno.
+                        if not direct:
+                            print(
+                                "[DBG] SF resolver no obtuvo URL directa. Abortando este ítem para evitar descargar HTML."
                             )
+                            ok = False
+                        else:
+                            gid = aria2_add(direct, outdir, headers=hdrs)
+                            await _hand_off_aria2(app, qid, gid, row_notify_chat_id)
+                            return
+                except Exception as e:
+                    print(f"[DBG] sourceforge error: {e!r}")
+                    ok, err = False, f"sourceforge: {e!r}"
+
+            elif any(
+                d in low
+                for d in [
+                    "youtube.com/watch",
+                    "youtu.be/",
+                    "youtube.com/playlist",
+                    "youtube.com/shorts",
+                    "youtube.com/channel/",
+                    "youtube.com/@",
+                    "youtube.com/c/",
+                ]
+            ):
+                # ==== yt-dlp cancelable ====
+                def _on_start(p):
+                    RUNNING_PROCS[qid] = p
 
-                            gid = aria2_add_torrent(tpath, outdir)
-                            db_set_ext_id(qid, gid)
-                            # Esperar finalización aria2 antes de marcar done
-                            final_status, _final_name = await _await_aria2_and_notify(
-                                qid, gid, row_notify_chat_id, app.bot
-                            )
-                            ok = final_status == "complete"
-                            try:
-                                tpath.unlink(missing_ok=True)
-                            except Exception:
-                                pass
-
-                        elif "mediafire.com/file/" in low:
-                            try:
-                                direct, hdrs = await resolve_mediafire_direct(url)
-                                if direct and aria2_enabled():
-                                    gid = aria2_add(direct, outdir, headers=hdrs)
-                                    db_set_ext_id(qid, gid)
-                                    final_status, _final_name = await _await_aria2_and_notify(
-                                        qid, gid, row_notify_chat_id, app.bot
-                                    )
-                                    ok = final_status == "complete"
-                                else:
-                                    ok = False
-                            except Exception as e:
-                                print(f"[DBG] mediafire error: {e!r}")
-                                ok = False
-
-                        elif "sourceforge.net/" in low:
-                            try:
-                                direct, hdrs = await resolve_sourceforge_direct(url)
-                                if not aria2_enabled():
-                                    print(
-                                        "[DBG] SourceForge: aria2_enabled()=False. Revisa RPC URL/secret/estado de aria2."
-                                    )
-                                    ok = False
-                                else:
-                                    # Si no hubo 'direct', el resolver ya habrá intentado construir uno.
-                                    if not direct:
-                                        print(
-                                            "[DBG] SF resolver no obtuvo URL directa. Abortando este ítem para evitar descargar HTML."
-                                        )
-                                        ok = False
-                                    else:
-                                        gid = aria2_add(direct, outdir, headers=hdrs)
-                                        db_set_ext_id(qid, gid)
-                                        final_status, _final_name = await _await_aria2_and_notify(
-                                            qid, gid, row_notify_chat_id, app.bot
-                                        )
-                                        ok = final_status == "complete"
-                            except Exception as e:
-                                print(f"[DBG] sourceforge error: {e!r}")
-                                ok = False
-
-                        elif any(
-                            d in low
-                            for d in [
-                                "youtube.com/watch",
-                                "youtu.be/",
-                                "youtube.com/playlist",
-                                "youtube.com/shorts",
-                                "youtube.com/channel/",
-                                "youtube.com/@",
-                                "youtube.com/c/",
-                            ]
-                        ):
-                            # ==== yt-dlp cancelable ====
-                            RUNNING["ytdlp_proc"] = None
-
-                            def _on_start(p):
-                                RUNNING["ytdlp_proc"] = p
-
-                            # 1) Decisión desde payload, si existe
-                            allow_playlist = payload.get("allow_playlist", None)
-
-                            # 2) Blindaje playlists/radios sin elección explícita
-                            def _has_playlistish_q(u: str) -> bool:
-                                try:
-                                    q = parse_qs(urlparse(u).query)
-                                    if "start_radio" in q and (
-                                        q["start_radio"][0] in ("1", "true", "yes")
-                                    ):
-                                        return True
-                                    return "list" in q
-                                except Exception:
-                                    return False
+                def _on_error(tail: str) -> None:
+                    nonlocal err
+                    err = tail
 
-                            if allow_playlist is None and _has_playlistish_q(url):
-                                allow_playlist = False  # fuerza vídeo único
+                # 1) Decisión desde payload, si existe
+                allow_playlist = payload.get("allow_playlist", None)
 
-                            print(
-                                f"[YTDLP][guard] url_has_playlistish={_has_playlistish_q(url)} | allow_playlist={allow_playlist}"
-                            )
+                # 2) Blindaje playlists/radios sin elección explícita
+                def _has_playlistish_q(u: str) -> bool:
+                    try:
+                        q = parse_qs(urlparse(u).query)
+                        if "start_radio" in q and (q["start_radio"][0] in ("1", "true", "yes")):
+                            return True
+                        return "list" in q
+                    except Exception:
+                        return False
 
-                            progress_msg = None
-                            last_pct_sent = -1
-                            last_edit_ts = 0.0
+                if allow_playlist is None and _has_playlistish_q(url):
+                    allow_playlist = False  # fuerza vídeo único
 
-                            if PAUSE_EVT.is_set():
-                                db_update_status(qid, "paused")
+                print(
+                    f"[YTDLP][guard] url_has_playlistish={_has_playlistish_q(url)} | allow_playlist={allow_playlist}"
+                )
+                # Su parte del presupuesto queda fija mientras dure el proceso
+                limit_rate = BW.reserve_ytdlp(qid, *_bw_counts())
+                if limit_rate:
+                    _kick_bw()
 
-                            async def _send_or_edit(txt: str):
-                                nonlocal progress_msg
-                                try:
-                                    if not row_notify_chat_id:
-                                        return
-                                    if progress_msg is None:
-                                        progress_msg = await app.bot.send_message(
-                                            chat_id=row_notify_chat_id, text=txt
-                                        )
-                                    else:
-                                        progress_msg = await app.bot.edit_message_text(
-                                            chat_id=row_notify_chat_id,
-                                            message_id=progress_msg.message_id,
-                                            text=txt,
-                                        )
-                                except Exception:
-                                    pass
+                progress_msg = None
+                last_pct_sent = -1
+                last_edit_ts = 0.0
 
-                            async def _send_playlist_info(ev: dict):
-                                title = ev.get("title") or "Playlist"
-                                sample = ev.get("sample") or []
-                                limit = _get_playlist_limit()  # <-- lee .env aquí
-                                lines = [
-                                    f"📚 <b>{title}</b> — mostrando hasta {limit} ítems (cap configurado)."
-                                ]
-                                if sample:
-                                    lines.append("Primeros ítems:")
-                                    for s in sample:
-                                        lines.append(
-                                            f"  #{s.get('index', '?')}: {s.get('title', '(sin título)')}"
-                                        )
-                                await _send_or_edit("\n".join(lines))
-
-                            def _tg_progress_cb(ev: dict):
-                                if ev.get("event") == "playlist_info":
-                                    asyncio.create_task(_send_playlist_info(ev))
-                                    return
-                                if ev.get("event") == "batch":
-                                    done = ev.get("done", 0)
-                                    asyncio.create_task(
-                                        _send_or_edit(f"✅ {done} archivo(s) completados…")
-                                    )
-                                    return
-                                nonlocal last_pct_sent, last_edit_ts
-                                pct = int(ev.get("percent", 0))
-                                nowt = asyncio.get_event_loop().time()
-                                if (pct == last_pct_sent) or ((nowt - last_edit_ts) < 3.0):
-                                    return
-                                last_pct_sent = pct
-                                last_edit_ts = nowt
-                                txt = f"⬇️ Descargando… {pct}%"
-                                if ev.get("speed"):
-                                    txt += f" — {ev['speed']}"
-                                if ev.get("eta"):
-                                    txt += f" — ETA {ev['eta']}"
-                                asyncio.create_task(_send_or_edit(txt))
-
-                            # Mensaje inicial
-                            if row_notify_chat_id:
-                                await _send_or_edit("⬇️ Preparando descarga…")
-
-                            try:
-                                ok = await ytdlp.download_proc(
-                                    url,
-                                    outdir,
-                                    on_start=_on_start,
-                                    cancel_evt=PAUSE_EVT,
-                                    allow_playlist=bool(payload.get("allow_playlist", False)),
-                                    progress_cb=_tg_progress_cb,
-                                    max_items=int(payload.get("max_items") or 0)
-                                    or _get_playlist_limit(),
-                                )
-                            except TypeError as _e:
-                                logging.warning(
-                                    "download_proc() no acepta 'progress_cb'; reintentando sin callback: %s",
-                                    _e,
-                                )
-                                ok = await ytdlp.download_proc(
-                                    url,
-                                    outdir,
-                                    on_start=_on_start,
-                                    cancel_evt=PAUSE_EVT,
-                                    allow_playlist=bool(payload.get("allow_playlist", False)),
-                                )
-
-                            # Mensaje final
-                            if row_notify_chat_id:
-                                if ok:
-                                    await _send_or_edit("✅ Descarga completada.")
-                                else:
-                                    await _send_or_edit("❌ Error en la descarga.")
+                if PAUSE_EVT.is_set():
+                    await adb.db_update_status(qid, "paused")
 
+                async def _send_or_edit(txt: str):
+                    nonlocal progress_msg
+                    try:
+                        if not row_notify_chat_id:
+                            return
+                        if progress_msg is None:
+                            progress_msg = await app.bot.send_message(
+                                chat_id=row_notify_chat_id, text=txt
+                            )
                         else:
-                            if aria2_enabled():
-                                try:
-                                    gid = aria2_add(url, outdir)
-                                    db_set_ext_id(qid, gid)
-                                    final_status, _final_name = await _await_aria2_and_notify(
-                                        qid, gid, row_notify_chat_id, app.bot
-                                    )
-                                    ok = final_status == "complete"
-                                except Exception as e:
-                                    print(f"[DBG] aria2 error: {e!r}")
-                                    ok = False
-                            else:
-                                print("[DBG] aria2 no disponible y URL no es yt-dlp")
-                                ok = False
-
-                        db_update_status(
-                            qid, "done" if ok else ("paused" if PAUSE_EVT.is_set() else "error")
+                            progress_msg = await app.bot.edit_message_text(
+                                chat_id=row_notify_chat_id,
+                                message_id=progress_msg.message_id,
+                                text=txt,
+                            )
+                    except Exception:
+                        pass
+
+                async def _send_playlist_info(ev: dict):
+                    title = ev.get("title") or "Playlist"
+                    sample = ev.get("sample") or []
+                    limit = _get_playlist_limit()  # <-- lee .env aquí
+                    lines = [
+                        f"📚 <b>{title}</b> — mostrando hasta {limit} ítems (cap configurado)."
+                    ]
+                    if sample:
+                        lines.append("Primeros ítems:")
+                        for s in sample:
+                            lines.append(
+                                f"  #{s.get('index', '?')}: {s.get('title', '(sin título)')}"
+                            )
+                    await _send_or_edit("\n".join(lines))
+
+                def _tg_progress_cb(ev: dict):
+                    if ev.get("event") == "playlist_info":
+                        asyncio.create_task(_send_playlist_info(ev))
+                        return
+                    if ev.get("event") == "batch":
+                        done = ev.get("done", 0)
+                        asyncio.create_task(_send_or_edit(f"✅ {done} archivo(s) completados…"))
+                        return
+                    nonlocal last_pct_sent, last_edit_ts
+                    pct = int(ev.get("percent", 0))
+                    nowt = asyncio.get_event_loop().time()
+                    if (pct == last_pct_sent) or ((nowt - last_edit_ts) < 3.0):
+                        return
+                    last_pct_sent = pct
+                    last_edit_ts = nowt
+                    txt = f"⬇️ Descargando… {pct}%"
+                    if ev.get("speed"):
+                        txt += f" — {ev['speed']}"
+                    if ev.get("eta"):
+                        txt += f" — ETA {ev['eta']}"
+                    asyncio.create_task(_send_or_edit(txt))
+
+                # Mensaje inicial
+                if row_notify_chat_id:
+                    await _send_or_edit("⬇️ Preparando descarga…")
+
+                try:
+                    try:
+                        ok = await ytdlp.download_proc(
+                            url,
+                            outdir,
+                            on_start=_on_start,
+                            cancel_evt=PAUSE_EVT,
+                            allow_playlist=bool(payload.get("allow_playlist", False)),
+                            progress_cb=_tg_progress_cb,
+                            max_items=int(payload.get("max_items") or 0) or _get_playlist_limit(),
+                            limit_rate=limit_rate,
+                            on_error=_on_error,
                         )
-                        if ok or (not PAUSE_EVT.is_set()):
-                            db_clear_progress(qid)
-                        # Mensaje final ya lo gestiona el tracker editable; no duplicar
-
-                    elif kind == "tg_link":
-                        url = payload["url"]
-                        outdir = pick_outdir(kind, payload, outdir_base)
-                        res = None
-                        try:
-                            res = await telethon_download_by_link(tclient, url, outdir, qid)
-                            if res and res.suffix.lower() == ".torrent":
-                                from tgdl.adapters.downloaders.aria2 import (
-                                    add_torrent as aria2_add_torrent,
-                                )
-
-                                gid = aria2_add_torrent(res, outdir)
-                                db_set_ext_id(qid, gid)
-                                try:
-                                    res.unlink(missing_ok=True)
-                                except Exception:
-                                    pass
-                                db_update_status(qid, "done")
-                                db_clear_progress(qid)
-                        except PauseSignal:
-                            db_update_status(qid, "paused")
-
-                        if res and res.exists():
-                            db_update_status(qid, "done")
-                            db_clear_progress(qid)
-                            if row_notify_chat_id:
-                                try:
-                                    await app.bot.send_message(
-                                        chat_id=row_notify_chat_id,
-                                        text=f"✅ link listo: {res.name}",
-                                    )
-                                except Exception as e:
-                                    print(f"[DBG] notify error: {e!r}")
-                        else:
-                            db_update_status(qid, "error")
-
-                    elif kind == "tg_ref":
-                        outdir = pick_outdir(kind, payload, outdir_base)
-                        chat_id = int(payload["chat_id"])
-                        mid = int(payload["message_id"])
-                        res = None
-                        try:
-                            res = await telethon_download_by_ref(tclient, chat_id, mid, outdir, qid)
-                            if res and res.suffix.lower() == ".torrent":
-                                from tgdl.adapters.downloaders.aria2 import (
-                                    add_torrent as aria2_add_torrent,
-                                )
-
-                                gid = aria2_add_torrent(res, outdir)
-                                db_set_ext_id(qid, gid)
-                                try:
-                                    res.unlink(missing_ok=True)
-                                except Exception:
-                                    pass
-                                db_update_status(qid, "done")
-                                db_clear_progress(qid)
-                        except PauseSignal:
-                            db_update_status(qid, "paused")
-
-                        if res and res.exists():
-                            db_update_status(qid, "done")
-                            db_clear_progress(qid)
-                            if row_notify_chat_id:
-                                try:
-                                    await app.bot.send_message(
-                                        chat_id=row_notify_chat_id, text=f"✅ ref listo: {res.name}"
-                                    )
-                                except Exception as e:
-                                    print(f"[DBG] notify error: {e!r}")
-                        else:
-                            db_update_status(qid, "error")
-
-                    elif kind == "self_ref":
-                        outdir = pick_outdir(kind, payload, outdir_base)
-                        chat_id = int(payload["chat_id"])
-                        mid = int(payload["message_id"])
-                        res = None
-                        try:
-                            # mismo mecanismo que tg_ref pero desde el propio chat del usuario
-                            res = await telethon_download_by_ref(tclient, chat_id, mid, outdir, qid)
-                            if res and res.suffix.lower() == ".torrent":
-                                from tgdl.adapters.downloaders.aria2 import (
-                                    add_torrent as aria2_add_torrent,
-                                )
-
-                                gid = aria2_add_torrent(res, outdir)
-                                db_set_ext_id(qid, gid)
-                                try:
-                                    res.unlink(missing_ok=True)
-                                except Exception:
-                                    pass
-                                db_update_status(qid, "done")
-                                db_clear_progress(qid)
-                        except PauseSignal:
-                            db_update_status(qid, "paused")
-
-                        if res and res.exists():
-                            db_update_status(qid, "done")
-                            db_clear_progress(qid)
-                            if row_notify_chat_id:
-                                try:
-                                    await app.bot.send_message(
-                                        chat_id=row_notify_chat_id,
-                                        text=f"✅ archivo listo: {res.name}",
-                                    )
-                                except Exception as e:
-                                    print(f"[DBG] notify error: {e!r}")
-                        else:
-                            db_update_status(qid, "error")
+                    except TypeError as _e:
+                        logging.warning(
+                            "download_proc() no acepta 'progress_cb'; reintentando sin callback: %s",
+                            _e,
+                        )
+                        ok = await ytdlp.download_proc(
+                            url,
+                            outdir,
+                            on_start=_on_start,
+                            cancel_evt=PAUSE_EVT,
+                            allow_playlist=bool(payload.get("allow_playlist", False)),
+                        )
+                finally:
+                    RUNNING_PROCS.pop(qid, None)
 
+                # Mensaje final
+                if row_notify_chat_id:
+                    if ok:
+                        await _send_or_edit("✅ Descarga completada.")
                     else:
-                        print(f"[DBG] kind desconocido: {kind}")
-                        db_update_status(qid, "error")
+                        await _send_or_edit("❌ Error en la descarga.")
 
-                except Exception as e:
-                    print(f"[DBG] excepcion en ciclo id={qid}: {e!r}")
-                    db_update_status(qid, "error")
-                    await asyncio.sleep(0)  # ceder control
+            else:
+                if aria2_enabled():
+                    try:
+                        gid = aria2_add(url, outdir)
+                        await _hand_off_aria2(app, qid, gid, row_notify_chat_id)
+                        return
+                    except Exception as e:
+                        print(f"[DBG] aria2 error: {e!r}")
+                        ok, err = False, f"aria2: {e!r}"
+                else:
+                    print("[DBG] aria2 no disponible y URL no es yt-dlp")
+                    ok, err = False, "aria2 no disponible"
 
-        tasks.append(asyncio.create_task(_worker()))
+            await adb.db_update_status(
+                qid, "done" if ok else ("paused" if PAUSE_EVT.is_set() else "error"), error=err
+            )
+            if ok or (not PAUSE_EVT.is_set()):
+                await adb.db_clear_progress(qid)
+            # Mensaje final ya lo gestiona el tracker editable; no duplicar
+
+        elif kind == "tg_link":
+            url = payload["url"]
+            outdir = pick_outdir(kind, payload, outdir_base)
+            res = None
+            try:
+                res = await telethon_download_by_link(tclient, url, outdir, qid)
+                if res and res.suffix.lower() == ".torrent":
+                    from tgdl.adapters.downloaders.aria2 import (
+                        add_torrent as aria2_add_torrent,
+                    )
 
-    for t in tasks:
-        try:
-            await t
-        except Exception as e:
-            print(f"[DBG] worker fail: {e!r}")
+                    gid = aria2_add_torrent(res, outdir)
+                    with contextlib.suppress(Exception):
+                        res.unlink(missing_ok=True)
+                    await _hand_off_aria2(app, qid, gid, row_notify_chat_id)
+                    return
+            except PauseSignal:
+                await adb.db_update_status(qid, "paused")
+                return
 
-    if notifier_task:
-        notify_stop_evt.set()
-        try:
-            await notifier_task
-        except Exception:
-            pass
+            if res and res.exists():
+                await adb.db_update_status(
+                    qid, "done", final_path=str(res), size_bytes=res.stat().st_size
+                )
+                await adb.db_clear_progress(qid)
+                if row_notify_chat_id:
+                    try:
+                        await app.bot.send_message(
+                            chat_id=row_notify_chat_id,
+                            text=f"✅ link listo: {res.name}",
+                        )
+                    except Exception as e:
+                        print(f"[DBG] notify error: {e!r}")
+            else:
+                await adb.db_update_status(qid, "error", error="telegram: sin fichero descargado")
 
-    print("[DBG] run_cycle end")
-    RUNNING["ytdlp_proc"] = None
-    PAUSE_EVT.clear()
+        elif kind == "tg_ref":
+            outdir = pick_outdir(kind, payload, outdir_base)
+            chat_id = int(payload["chat_id"])
+            mid = int(payload["message_id"])
+            res = None
+            try:
+                res = await telethon_download_by_ref(tclient, chat_id, mid, outdir, qid)
+                if res and res.suffix.lower() == ".torrent":
+                    from tgdl.adapters.downloaders.aria2 import (
+                        add_torrent as aria2_add_torrent,
+                    )
+
+                    gid = aria2_add_torrent(res, outdir)
+                    with contextlib.suppress(Exception):
+                        res.unlink(missing_ok=True)
+                    await _hand_off_aria2(app, qid, gid, row_notify_chat_id)
+                    return
+            except PauseSignal:
+                await adb.db_update_status(qid, "paused")
+                return
+
+            if res and res.exists():
+                await adb.db_update_status(
+                    qid, "done", final_path=str(res), size_bytes=res.stat().st_size
+                )
+                await adb.db_clear_progress(qid)
+                if row_notify_chat_id:
+                    try:
+                        await app.bot.send_message(
+                            chat_id=row_notify_chat_id, text=f"✅ ref listo: {res.name}"
+                        )
+                    except Exception as e:
+                        print(f"[DBG] notify error: {e!r}")
+            else:
+                await adb.db_update_status(qid, "error", error="telegram: sin fichero descargado")
+
+        elif kind == "self_ref":
+            outdir = pick_outdir(kind, payload, outdir_base)
+            chat_id = int(payload["chat_id"])
+            mid = int(payload["message_id"])
+            res = None
+            try:
+                # mismo mecanismo que tg_ref pero desde el propio chat del usuario
+                res = await telethon_download_by_ref(tclient, chat_id, mid, outdir, qid)
+                if res and res.suffix.lower() == ".torrent":
+                    from tgdl.adapters.downloaders.aria2 import (
+                        add_torrent as aria2_add_torrent,
+                    )
+
+                    gid = aria2_add_torrent(res, outdir)
+                    with contextlib.suppress(Exception):
+                        res.unlink(missing_ok=True)
+                    await _hand_off_aria2(app, qid, gid, row_notify_chat_id)
+                    return
+            except PauseSignal:
+                await adb.db_update_status(qid, "paused")
+                return
+
+            if res and res.exists():
+                await adb.db_update_status(
+                    qid, "done", final_path=str(res), size_bytes=res.stat().st_size
+                )
+                await adb.db_clear_progress(qid)
+                if row_notify_chat_id:
+                    try:
+                        await app.bot.send_message(
+                            chat_id=row_notify_chat_id,
+                            text=f"✅ archivo listo: {res.name}",
+                        )
+                    except Exception as e:
+                        print(f"[DBG] notify error: {e!r}")
+            else:
+                await adb.db_update_status(qid, "error", error="telegram: sin fichero descargado")
+
+        else:
+            print(f"[DBG] kind desconocido: {kind}")
+            # Reintentar no lo va a arreglar
+            await adb.db_update_status(qid, "error", error=f"kind desconocido: {kind}", retry=False)
+
+    except Exception as e:
+        print(f"[DBG] excepcion en ciclo id={qid}: {e!r}")
+        await adb.db_update_status(qid, "error", error=repr(e))
+        await asyncio.sleep(0)  # ceder control
 
 
 # ========= Handlers del bot =========
@@ -1207,13 +1547,82 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "<code>/menu</code> — mostrar botones\n"
         "<code>/schedule</code> — 24/7 o ventana horaria (Start/Stop)\n"
         "<code>/when HH</code> — cambia la hora base (persistente)\n"
-        "<code>/now</code> — ejecutar ciclo ya\n"
+        "<code>/now</code> — descargar ya lo pendiente\n"
+        "<code>/force URL</code> — volver a descargar algo ya encolado/descargado\n"
+        "<code>/bump ID [prio]</code> — adelantar un elemento de la cola (o fijar su prioridad)\n"
+        "<code>/limits [backend N]</code> — descargas simultáneas por backend (aria2, ytdlp, telegram, resolver)\n"
         "<code>/pause</code>, <code>/resume</code>\n"
         "<code>/status</code>, <code>/list</code>, <code>/retry</code>, <code>/purge</code>, <code>/cancel ID</code>, <code>/clear</code>\n"
     )
     await update.message.reply_text(txt, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
 
+async def cmd_force(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/force <enlace...>: encola aunque ya exista un trabajo con la misma clave."""
+    if not context.args:
+        await update.message.reply_text("Uso: /force <enlace> [enlace2 ...]")
+        return
+    await intake(update, context, force=True)
+
+
+async def cmd_bump(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/bump <id> [prioridad]: sin prioridad lo pone por delante de todo lo pendiente."""
+    try:
+        qid = int(context.args[0].lstrip("#"))
+        prio = int(context.args[1]) if len(context.args) > 1 else None
+    except (IndexError, ValueError):
+        await update.message.reply_text("Uso: /bump <id> [prioridad]")
+        return
+    if prio is None:
+        prio = await adb.db_bump([qid])
+        ok = prio is not None
+    else:
+        ok = await adb.db_set_priority(qid, prio)
+    if ok:
+        await update.message.reply_text(f"⏫ #{qid} con prioridad {prio}.")
+    else:
+        await update.message.reply_text(f"No encuentro #{qid} en la cola.")
+
+
+async def cmd_limits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/limits [backend N|default]: muestra o ajusta en caliente el cupo de un backend."""
+    args = context.args or []
+    if args:
+        backend = args[0].lower()
+        try:
+            limit = None if args[1].lower() == "default" else int(args[1])
+        except (IndexError, ValueError):
+            backend = ""
+        if backend not in BACKENDS:
+            await update.message.reply_text(
+                f"Uso: /limits <{'|'.join(BACKENDS)}> <N|default>  (0 = no arrancar nuevos)"
+            )
+            return
+        await adb.db_set_backend_limit(backend, limit)
+        wake_dispatcher(context.application)  # un cupo mayor se aprovecha ya
+    txt = f"⚙️ Cupos (en curso/máx.): {await _limits_line()}"
+    if settings.AIMD_ENABLED:
+        # Ajuste automático: /limits fija el punto de partida, AIMD sigue desde ahí
+        last = AIMD.history[-1] if AIMD.history else None
+        txt += "\n🤖 Ajuste automático activo" + (
+            f"; último: {last.backend} {last.old}→{last.new} ({last.reason})" if last else ""
+        )
+    await update.message.reply_text(txt)
+
+
+def mk_bump_menu(qids: list[int]) -> InlineKeyboardMarkup | None:
+    """Botón para priorizar lo recién encolado (callback_data admite 64 bytes)."""
+    ids: list[str] = []
+    for qid in qids:
+        if len("act:bump:" + ",".join([*ids, str(qid)])) > 64:
+            break
+        ids.append(str(qid))
+    if not ids:
+        return None
+    data = "act:bump:" + ",".join(ids)
+    return InlineKeyboardMarkup([[InlineKeyboardButton("⏫ Priorizar", callback_data=data)]])
+
+
 async def cmd_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     paused = is_paused()
     await update.message.reply_text(
@@ -1233,15 +1642,12 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         if data == "act:run":
-            started = await launch_cycle_background(
+            wake_dispatcher(
                 context.application, force_all=True, notify_chat_id=update.effective_chat.id
             )
-            if started:
-                await query.edit_message_text(
-                    "🚀 Ciclo lanzado en segundo plano. Te avisaré al finalizar."
-                )
-            else:
-                await query.edit_message_text("⚠️ Ya hay un ciclo ejecutándose.")
+            await query.edit_message_text(
+                "🚀 Descargando lo pendiente en segundo plano (sin esperar a la programación)."
+            )
         elif data == "act:pause":
             await cmd_pause(update, context)
             txt, kb = refresh_menu_html()
@@ -1251,28 +1657,22 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
             txt, kb = refresh_menu_html()
             await safe_edit(query, txt, kb)
         elif data == "act:status":
-            await safe_edit(query, fmt_status_message_html(), mk_main_menu(is_paused()))
-        elif data == "act:list":
-            rows = db_list(limit=15)
-            if not rows:
+            await safe_edit(query, await fmt_status_message_html(), mk_main_menu(is_paused()))
+        elif data == "act:list" or data.startswith("act:list:"):
+            # act:list:<cursor> → página siguiente (keyset por id)
+            before = data.split(":")[2] if data.count(":") >= 2 else ""
+            txt, nxt = await fmt_queue_page_html(
+                limit=15, before_id=int(before) if before else None
+            )
+            if txt is None:
                 await query.edit_message_text(
                     "📋 Cola: (vacía)", reply_markup=mk_main_menu(is_paused())
                 )
             else:
-                lines = ["📋 <b>Cola reciente</b>\n"]
-                for qid, kind, payload, status, sched in rows:
-                    title = ""
-                    try:
-                        payload_d = json.loads(payload)
-                        title = payload_d.get("suggested_name") or payload_d.get("url") or ""
-                    except Exception:
-                        pass
-                    title = title or (payload[:60] + "…")
-                    lines.append(f"• #{qid} [{kind}] {status} — {sched}\n  <code>{title}</code>")
                 await query.edit_message_text(
-                    "\n".join(lines),
+                    txt,
                     parse_mode=ParseMode.HTML,
-                    reply_markup=mk_main_menu(is_paused()),
+                    reply_markup=mk_list_menu(nxt, with_main=True),
                     disable_web_page_preview=True,
                 )
         elif data == "act:when":
@@ -1283,7 +1683,7 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
 
         elif data == "act:sched:always":
-            db_set_flag("SCHED_ENABLED", "0")
+            await adb.db_set_flag("SCHED_ENABLED", "0")
             reconfigure_scheduler(context.application)
             txt, kb = mk_sched_menu()
             await safe_edit(query, txt, kb)
@@ -1293,7 +1693,7 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await safe_edit(query, txt, kb)
 
         elif data == "act:sched:window":
-            db_set_flag("SCHED_ENABLED", "1")
+            await adb.db_set_flag("SCHED_ENABLED", "1")
             reconfigure_scheduler(context.application)
             txt, kb = mk_sched_menu()
             await safe_edit(query, txt, kb)
@@ -1302,9 +1702,9 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 h = int(data.split(":")[-1])
                 assert 0 <= h < 24
-                db_set_flag("SCHED_START", str(h))
+                await adb.db_set_flag("SCHED_START", str(h))
                 # sincroniza SCHEDULE_HOUR también (opcional pero útil para coherencia)
-                db_set_flag("SCHEDULE_HOUR", str(h))
+                await adb.db_set_flag("SCHEDULE_HOUR", str(h))
                 reconfigure_scheduler(context.application)
                 txt, kb = mk_sched_menu()
                 await safe_edit(query, txt, kb)
@@ -1317,7 +1717,7 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 h = int(data.split(":")[-1])
                 assert 0 <= h < 24
-                db_set_flag("SCHED_STOP", str(h))
+                await adb.db_set_flag("SCHED_STOP", str(h))
                 reconfigure_scheduler(context.application)
                 txt, kb = mk_sched_menu()
                 await safe_edit(query, txt, kb)
@@ -1338,6 +1738,15 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
             except Exception:
                 await query.edit_message_text("❌ Valor inválido", reply_markup=mk_when_menu())
+        elif data.startswith("act:bump:"):
+            qids = [int(x) for x in data.split(":", 2)[2].split(",") if x.strip()]
+            prio = await adb.db_bump(qids)
+            await query.edit_message_reply_markup(reply_markup=None)
+            ids = ", ".join(f"#{q}" for q in qids)
+            if prio is None:
+                await query.message.reply_text(f"{ids} ya no está(n) en la cola.")
+            else:
+                await query.message.reply_text(f"⏫ {ids} con prioridad {prio}.")
         elif data == "act:back":
             txt, kb = refresh_menu_html()
             await safe_edit(query, txt, kb)
@@ -1371,7 +1780,7 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 if scheduled_at <= datetime.now(tz=TZ):
                     scheduled_at += timedelta(days=1)
 
-            db_add(
+            qid, created = await adb.db_enqueue(
                 "url",
                 {
                     "url": url,
@@ -1380,12 +1789,17 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 },
                 scheduled_at,
             )
+            if not created:
+                await query.edit_message_text(
+                    f"♻️ Ya estaba en la cola o descargado (#{qid}). "
+                    "Usa /force <enlace> para descargar de nuevo."
+                )
+                return
 
             # Mensaje UX: guía siguiente paso
 
             is_always = db_get_flag("SCHED_ENABLED", "1") == "0"
-            rows = db_list(limit=9999)  # rápido, para contar
-            qcount = len(rows) if rows else 1
+            qcount = await adb.db_count_pending()
 
             if is_always:
                 hint = (
@@ -1405,14 +1819,12 @@ async def cb_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 + hint
             )
             if run_now:
-                # Lanzar ciclo inmediato
+                # Despachar ya, sin esperar a la programación
                 try:
-                    asyncio.create_task(
-                        launch_cycle_background(
-                            context.application,
-                            force_all=True,
-                            notify_chat_id=query.message.chat_id,
-                        )
+                    wake_dispatcher(
+                        context.application,
+                        force_all=True,
+                        notify_chat_id=query.message.chat_id,
                     )
                 except Exception:
                     pass
@@ -1443,9 +1855,9 @@ async def cmd_when(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         hh = int(context.args[0])
         assert 0 <= hh < 24
-        db_set_flag("SCHEDULE_HOUR", str(hh))
+        await adb.db_set_flag("SCHEDULE_HOUR", str(hh))
         # si no tienes ventana custom, sincroniza win_start con SCHEDULE_HOUR
-        db_set_flag("SCHED_START", str(hh))
+        await adb.db_set_flag("SCHED_START", str(hh))
         reconfigure_scheduler(context.application)
         await update.message.reply_text(f"✅ Nueva hora programada: {hh:02d}:00")
     except Exception:
@@ -1492,19 +1904,25 @@ async def _safe_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text:
             pass
 
 
+def _terminate_ytdlp(qid: int | None = None) -> None:
+    """Termina el yt-dlp del trabajo `qid` o, sin qid, todos los que sigan vivos."""
+    procs = [RUNNING_PROCS.get(qid)] if qid is not None else list(RUNNING_PROCS.values())
+    for proc in procs:
+        if proc and proc.returncode is None:
+            try:
+                proc.terminate()
+            except Exception:
+                pass
+
+
 async def cmd_pause(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    db_set_flag("PAUSED", "1")
+    await adb.db_set_flag("PAUSED", "1")
     try:
         aria2_pause_all()
     except Exception as e:
         print(f"[DBG] aria2_pause_all: {e!r}")
     PAUSE_EVT.set()
-    proc = RUNNING.get("ytdlp_proc")
-    if proc and proc.returncode is None:
-        try:
-            proc.terminate()
-        except Exception:
-            pass
+    _terminate_ytdlp()
     await _safe_reply(
         update, context, "⏸️ Pausado. La tarea activa será detenida y el resto quedado en 'paused'."
     )
@@ -1522,26 +1940,22 @@ async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # leer ext_id y kind
     try:
-        with _connect() as conn:
-            cur = conn.execute("SELECT ext_id, kind FROM queue WHERE id=?", (qid,))
-            row = cur.fetchone()
-            if not row:
-                await update.message.reply_text(f"No existe el id #{qid}")
-                return
-            ext_id, kind = row[0], row[1]
+        row = await adb.db_get_ext_id_kind(qid)
+        if not row:
+            await update.message.reply_text(f"No existe el id #{qid}")
+            return
+        ext_id, kind = row
     except Exception as e:
         await update.message.reply_text(f"Error DB: {e!r}")
         return
 
-    # Si es yt-dlp activo, termínalo
-    if kind == "url" and RUNNING.get("ytdlp_proc") and RUNNING["ytdlp_proc"].returncode is None:
-        try:
-            RUNNING["ytdlp_proc"].terminate()
-        except Exception:
-            pass
+    # Si es un yt-dlp en curso, termínalo
+    if kind == "url":
+        _terminate_ytdlp(qid)
 
     # Si hay GID de aria2: snapshot -> remove -> unlink
     if ext_id:
+        await _drop_handoff(qid)
         try:
             st = {}
             try:
@@ -1574,7 +1988,7 @@ async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             await update.message.reply_text(f"aria2 remove falló: {e!r}")
 
-    db_update_status(qid, "canceled")
+    await adb.db_update_status(qid, "canceled")
     await update.message.reply_text(f"❌ Cancelado #{qid}")
 
     # Limpieza defensiva de temporales yt-dlp (*.part, *.ytdl)
@@ -1587,15 +2001,15 @@ async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def cmd_resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    db_set_flag("PAUSED", "0")
-    db_requeue_paused_reschedule_now()
+    await adb.db_set_flag("PAUSED", "0")
+    await adb.db_requeue_paused_reschedule_now()
     try:
         aria2_unpause_all()
     except Exception as e:
         print(f"[DBG] aria2_unpause_all: {e!r}")
     PAUSE_EVT.clear()
-    await _safe_reply(update, context, "▶️ Reanudado. Lanzando ciclo en segundo plano…")
-    await launch_cycle_background(
+    await _safe_reply(update, context, "▶️ Reanudado. Despachando la cola en segundo plano…")
+    wake_dispatcher(
         context.application,
         force_all=True,
         notify_chat_id=update.effective_chat.id if update.effective_chat else None,
@@ -1605,68 +2019,65 @@ async def cmd_resume(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Limpiar por completo la cola
 async def cmd_clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Señal de pausa + detener procesos
-    db_set_flag("PAUSED", "1")
+    await adb.db_set_flag("PAUSED", "1")
     PAUSE_EVT.set()
     try:
         aria2_pause_all()
     except Exception:
         pass
-    proc = RUNNING.get("ytdlp_proc")
-    if proc and proc.returncode is None:
-        try:
-            proc.terminate()
-        except Exception:
-            pass
+    _terminate_ytdlp()
     # Limpiar DB
-    db_clear_all()
+    await adb.db_clear_all()
+    _kick_maintenance()
     await update.message.reply_text("🧹 Cola y progreso limpiados completamente. (Estado: PAUSADO)")
 
 
 async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     p = is_paused()
-    await update.message.reply_text(f"Estado: {'PAUSADO' if p else 'ACTIVO'}")
+    today = fmt_today_line(await adb.db_rollup("d"))
+    limits = await _limits_line()
+    bw = fmt_bw_line()
+    await update.message.reply_text(
+        f"Estado: {'PAUSADO' if p else 'ACTIVO'}\n{today}\nCupos: {limits}"
+        + (f"\n{bw}" if bw else "")
+    )
 
 
 async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    rows = db_list(limit=20)
-    if not rows:
+    txt, nxt = await fmt_queue_page_html(limit=20)
+    if txt is None:
         await update.message.reply_text("📋 Cola: (vacía)")
         return
-    lines = ["📋 <b>Cola reciente</b>\n"]
-    for qid, kind, payload, status, sched in rows:
-        try:
-            payload_d = json.loads(payload)
-        except Exception:
-            payload_d = {}
-        title = payload_d.get("suggested_name") or payload_d.get("url") or f"{payload[:60]}…"
-        lines.append(f"• #{qid} [{kind}] {status} — {sched}\n  <code>{title}</code>")
     await update.message.reply_text(
-        "\n".join(lines), parse_mode=ParseMode.HTML, disable_web_page_preview=True
+        txt,
+        parse_mode=ParseMode.HTML,
+        reply_markup=mk_list_menu(nxt),
+        disable_web_page_preview=True,
     )
 
 
 async def cmd_retry(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    db_retry_errors()
-    await update.message.reply_text("🔁 Reintentando elementos en error (puestos en queued).")
+    await adb.db_retry_errors()
+    wake_dispatcher(context.application)
+    await update.message.reply_text(
+        "🔁 Reintentando elementos en error o agotados (puestos en queued, intentos a cero)."
+    )
 
 
 async def cmd_purge(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    db_purge_finished()
-    await update.message.reply_text("🧹 Cola limpiada (done/error).")
+    await adb.db_purge_finished()
+    _kick_maintenance()
+    await update.message.reply_text("🧹 Cola limpiada (done/error/dead).")
 
 
 async def cmd_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    started = await launch_cycle_background(
-        context.application, force_all=True, notify_chat_id=update.effective_chat.id
-    )
-    if started:
-        msg = update.effective_message
-
+    wake_dispatcher(context.application, force_all=True, notify_chat_id=update.effective_chat.id)
+    msg = update.effective_message
     if msg:
         with contextlib.suppress(Exception):
-            await msg.reply_text("🚀 Ciclo lanzado en segundo plano. Te aviso al finalizar.")
-    else:
-        await update.message.reply_text("⚠️ Ya hay un ciclo ejecutándose.")
+            await msg.reply_text(
+                "🚀 Descargando lo pendiente en segundo plano (sin esperar a la programación)."
+            )
 
 
 # ========= Error handler global =========
@@ -1694,7 +2105,7 @@ async def on_error(update: object, context):
         pass  # no bloquees por errores en el handler
 
 
-async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE, force: bool = False):
     m = update.message
     now = datetime.now(tz=TZ)
 
@@ -1704,18 +2115,13 @@ async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     text = (m.text or m.caption or "") if m else ""
 
-    # Contadores para UX
-    c_tg_urls = 0
-    c_web_urls = 0
-    c_media = 0
-    enqueued_any = False
+    # Ítems a encolar; se insertan todos juntos en una transacción (db_add_many)
+    to_add: list[tuple[str, dict[str, Any]]] = []
 
     # 1) Enlaces de mensajes de Telegram
     tg_urls = re.findall(r"https?://t\.me/[^\s]+", text, flags=re.IGNORECASE)
     for u in tg_urls:
-        db_add("tg_link", {"url": u}, scheduled_at)
-        c_tg_urls += 1
-        enqueued_any = True
+        to_add.append(("tg_link", {"url": u}))
 
     # 2) URLs/magnets (excluye t.me)
     urls = [u for u in extract_urls(text) if not u.lower().startswith("https://t.me/")]
@@ -1754,9 +2160,7 @@ async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE):
             continue
 
         # Enlaces "normales": encola directo
-        db_add("url", {"url": u, "notify_chat_id": m.chat_id}, scheduled_at)
-        c_web_urls += 1
-        enqueued_any = True
+        to_add.append(("url", {"url": u, "notify_chat_id": m.chat_id}))
 
     # 3) Media reenviada al bot -> self_ref
     suggested = None
@@ -1770,13 +2174,12 @@ async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE):
         suggested = "photo.jpg"
 
     if m and (m.document or m.video or m.audio or m.photo or m.voice or m.video_note):
-        db_add(
-            "self_ref",
-            {"chat_id": m.chat_id, "message_id": m.message_id, "suggested_name": suggested},
-            scheduled_at,
+        to_add.append(
+            (
+                "self_ref",
+                {"chat_id": m.chat_id, "message_id": m.message_id, "suggested_name": suggested},
+            )
         )
-        c_media += 1
-        enqueued_any = True
 
     # 4) Origen reenviado (si el canal permite revelar origen) -> tg_ref
     try:
@@ -1784,11 +2187,30 @@ async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if fo and getattr(fo, "type", "") == "channel":
             chat_id = fo.chat.id
             mid = fo.message_id
-            db_add("tg_ref", {"chat_id": chat_id, "message_id": mid}, scheduled_at)
-            enqueued_any = True
+            to_add.append(("tg_ref", {"chat_id": chat_id, "message_id": mid}))
     except Exception as e:
         print(f"[DBG] forward_origin error: {e!r}")
 
+    results = await adb.db_add_many(
+        [(kind, payload, scheduled_at) for kind, payload in to_add], force=force
+    )
+
+    # Contadores para UX
+    c_tg_urls = 0
+    c_web_urls = 0
+    c_media = 0
+    dup_ids: list[int] = []  # ya en cola o descargados (misma clave canónica)
+    for (kind, _), (qid, created) in zip(to_add, results, strict=True):
+        if not created:
+            dup_ids.append(qid)
+        elif kind == "tg_link":
+            c_tg_urls += 1
+        elif kind == "url":
+            c_web_urls += 1
+        elif kind == "self_ref":
+            c_media += 1
+    enqueued_any = bool(to_add)
+
     # 5) Si no hay insumos accionables → NO encolar y NO disparar ciclo.
     if not enqueued_any:
         await m.reply_text(
@@ -1802,19 +2224,22 @@ async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    dup_hint = ""
+    if dup_ids:
+        ids = ", ".join(f"#{i}" for i in dup_ids)
+        dup_hint = (
+            f"♻️ {len(dup_ids)} ya estaba(n) en la cola o descargado(s): {ids}. "
+            "Usa /force <enlace> para descargar de nuevo.\n"
+        )
+        if not (c_tg_urls or c_web_urls or c_media):
+            await m.reply_text(dup_hint.strip())
+            return
+
     # 6) Si no hay programación (24/7): solo reprograma si encolaste algo
     try:
         if db_get_flag("SCHED_ENABLED", "1") == "0":
-            from tgdl.core.db import _connect
-
-            now_iso = now.strftime("%Y-%m-%d %H:%M:%S")
-            with _connect() as conn:
-                conn.execute(
-                    "UPDATE queue SET scheduled_at=? WHERE status='queued' AND scheduled_at>?",
-                    (now_iso, now_iso),
-                )
-                conn.commit()
-            await launch_cycle_background(
+            await adb.db_pull_forward_queued(now)
+            wake_dispatcher(
                 context.application, force_all=True, notify_chat_id=update.effective_chat.id
             )
     except Exception as e:
@@ -1832,8 +2257,7 @@ async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # ¿24/7 o ventana?
     is_always = db_get_flag("SCHED_ENABLED", "1") == "0"
-    rows = db_list(limit=9999)
-    qcount = len(rows) if rows else 1
+    qcount = await adb.db_count_pending()
 
     if is_always:
         next_hint = (
@@ -1845,10 +2269,13 @@ async def intake(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Usa /list para ver la cola o /now para ejecutar ahora."
         )
 
+    new_ids = [qid for qid, created in results if created]
     await m.reply_text(
         f"✅ {summary} encolado(s).\n"
+        f"{dup_hint}"
         f"Actualmente tienes {qcount} elemento(s) en la cola.\n"
-        f"{next_hint}"
+        f"{next_hint}",
+        reply_markup=mk_bump_menu(new_ids),
     )
 
 
@@ -1863,58 +2290,52 @@ def start_control_server():
         # Cancelación cooperativa:
         # 1) si es aria2 y tiene GID -> remove
         try:
-            with _connect() as conn:
-                cur = conn.execute("SELECT ext_id, kind FROM queue WHERE id=?", (qid,))
-                row = cur.fetchone()
-                if not row:
-                    return {"ok": False, "error": "not-found"}
-                ext_id, kind = row[0], row[1]
-                # detener yt-dlp si es el activo (RUNNING)
-                if (
-                    kind == "url"
-                    and RUNNING.get("ytdlp_proc")
-                    and RUNNING["ytdlp_proc"].returncode is None
-                ):
-                    try:
-                        RUNNING["ytdlp_proc"].terminate()
-                    except Exception:
-                        pass
-                # aria2: remove si hay ext_id
-                if ext_id:
+            row = db_get_ext_id_kind(qid)
+            if not row:
+                return {"ok": False, "error": "not-found"}
+            ext_id, kind = row
+            # detener su yt-dlp si está en curso
+            if kind == "url":
+                _terminate_ytdlp(qid)
+            # aria2: remove si hay ext_id
+            if ext_id:
+                if BOT.loop is not None:
+                    # Igual que /cancel: fuera del watcher antes de quitarla de aria2
+                    asyncio.run_coroutine_threadsafe(_drop_handoff(qid), BOT.loop).result(5.0)
+                try:
+                    aria2_remove(ext_id)
                     try:
-                        aria2_remove(ext_id)
-                        try:
-                            st = aria2_tell(ext_id)
-                            for f in st.get("files") or []:
-                                for p in (f.get("path"),):
-                                    if not p:
-                                        continue
-                                    try:
-                                        Path(p).unlink(missing_ok=True)
-                                    except Exception:
-                                        pass
-                        except Exception as e:
-                            print(f"[DBG] cleanup aria2 files: {e!r}")
+                        st = aria2_tell(ext_id)
+                        for f in st.get("files") or []:
+                            for p in (f.get("path"),):
+                                if not p:
+                                    continue
+                                try:
+                                    Path(p).unlink(missing_ok=True)
+                                except Exception:
+                                    pass
                     except Exception as e:
-                        print(f"[DBG] aria2 remove failed: {e!r}")
-                db_update_status(qid, "canceled")
-                return {"ok": True, "id": qid, "canceled": True}
+                        print(f"[DBG] cleanup aria2 files: {e!r}")
+                except Exception as e:
+                    print(f"[DBG] aria2 remove failed: {e!r}")
+            WRITER.call(db_update_status, qid, "canceled")
+            return {"ok": True, "id": qid, "canceled": True}
         except Exception as e:
             return {"ok": False, "error": str(e)}
 
     @api.post("/pause")
     def http_pause():
-        db_set_flag("PAUSED", "1")
+        WRITER.call(db_set_flag, "PAUSED", "1")
         return {"ok": True, "paused": True}
 
     @api.post("/resume")
     def http_resume():
-        db_set_flag("PAUSED", "0")
-        db_requeue_paused_reschedule_now()
+        WRITER.call(db_set_flag, "PAUSED", "0")
+        WRITER.call(db_requeue_paused_reschedule_now)
         app = BOT.app
         loop = BOT.loop
         if app is not None and loop is not None:
-            asyncio.run_coroutine_threadsafe(launch_cycle_background(app, force_all=True), loop)
+            loop.call_soon_threadsafe(lambda: wake_dispatcher(app, force_all=True))
         return {"ok": True, "paused": False, "running": True}
 
     @api.post("/run")
@@ -1923,9 +2344,31 @@ def start_control_server():
         loop = BOT.loop
         if app is None or loop is None:
             return {"ok": False, "error": "app-not-ready"}
-        asyncio.run_coroutine_threadsafe(launch_cycle_background(app, force_all=True), loop)
+        loop.call_soon_threadsafe(lambda: wake_dispatcher(app, force_all=True))
         return {"ok": True, "running": True}
 
+    @api.post("/db/{op}")
+    def http_db(
+        op: str,
+        body: dict | None = None,
+        x_panel_token: Annotated[str | None, Header()] = None,
+    ):
+        # Mutaciones de otros procesos (panel): las aplica el writer único del bot.
+        # Escriben en la DB, así que exigen el mismo token que el panel
+        if settings.PANEL_TOKEN and x_panel_token != settings.PANEL_TOKEN:
+            return {"ok": False, "error": "unauthorized"}
+        if op not in WRITE_OPS:
+            return {"ok": False, "error": "unknown-op"}
+        body = body or {}
+        try:
+            res = apply_op(op, body.get("args"), body.get("kwargs"))
+            if BOT.loop is not None:
+                # Un alta, /retry o cambio de prioridad del panel se atiende ya
+                BOT.loop.call_soon_threadsafe(wake_dispatcher)
+            return {"ok": True, "result": res}
+        except Exception as e:
+            return {"ok": False, "error": repr(e)}
+
     # Levantar uvicorn en un hilo aparte
     def _run():
         uvicorn.run(api, host="127.0.0.1", port=8765, log_level="warning")
@@ -1934,7 +2377,7 @@ def start_control_server():
 
     th = threading.Thread(target=_run, daemon=True)
     th.start()
-    print("[i] Endpoints locales en http://127.0.0.1:8765  (/pause, /resume, /run)")
+    print("[i] Endpoints locales en http://127.0.0.1:8765  (/pause, /resume, /run, /db/{op})")
 
 
 # ========= Main (corutina) =========
@@ -1945,6 +2388,14 @@ async def main():
 
     # DB y carpeta
     db_init()
+    # Trabajos que quedaron 'running' de una ejecución anterior de este host: los que
+    # ya estaban en aria2 se siguen vigilando; el resto vuelve a la cola
+    adopted = db_adopt_handoffs()
+    n_stale = db_release_stale_leases()
+    if n_stale:
+        print(f"[i] {n_stale} trabajo(s) interrumpidos devueltos a la cola.")
+    if adopted:
+        print(f"[i] {len(adopted)} descarga(s) en aria2 retomadas.")
     Path(settings.DOWNLOAD_DIR).mkdir(parents=True, exist_ok=True)
 
     # Telethon (usuario)
@@ -2012,6 +2463,9 @@ async def main():
     app.add_handler(MessageHandler(filters.ALL & (~filters.COMMAND), intake))
     app.add_handler(CommandHandler("clear", cmd_clear))
     app.add_handler(CommandHandler("cancel", cmd_cancel))
+    app.add_handler(CommandHandler("force", cmd_force))
+    app.add_handler(CommandHandler("bump", cmd_bump))
+    app.add_handler(CommandHandler("limits", cmd_limits))
     app.add_handler(CommandHandler("help", cmd_help))
     app.add_handler(CommandHandler("menu", cmd_menu))
     app.add_handler(CallbackQueryHandler(cb_router))
@@ -2021,8 +2475,39 @@ async def main():
     # Scheduler
     from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
+    from apscheduler.triggers.interval import IntervalTrigger
+
     scheduler = AsyncIOScheduler(timezone=TZ)
     scheduler.start()
+    scheduler.add_job(
+        _events_retention,
+        IntervalTrigger(hours=1),
+        id="events_retention",
+        replace_existing=True,
+        next_run_time=datetime.now(TZ),
+    )
+    scheduler.add_job(
+        _db_maintenance,
+        IntervalTrigger(minutes=max(1, settings.DB_MAINT_EVERY_MIN)),
+        id="db_maintenance",
+        replace_existing=True,
+    )
+    if settings.BANDWIDTH_WINDOWS:
+        # Cambios de franja; los arranques/fines de trabajos reparten al momento
+        scheduler.add_job(
+            _rebalance_bw,
+            IntervalTrigger(minutes=1),
+            id="bandwidth",
+            replace_existing=True,
+            next_run_time=datetime.now(TZ),
+        )
+    if settings.AIMD_ENABLED:
+        scheduler.add_job(
+            _aimd_tick,
+            IntervalTrigger(seconds=max(5, settings.AIMD_EVERY_SEC)),
+            id="aimd",
+            replace_existing=True,
+        )
     SCHEDULER = scheduler  # <-- ahora sí afecta a la global
 
     # Guardar contexto global para el HTTP control
@@ -2031,6 +2516,10 @@ async def main():
     BOT.tclient = tclient
 
     start_control_server()
+    asyncio.create_task(_lease_heartbeat())
+    for qid, gid, chat_id in adopted:
+        _watch_aria2(app, qid, gid, chat_id)
+    wake_dispatcher(app)  # recoge lo vencido mientras el bot estaba parado
 
     # Reconfigurar una vez que SCHEDULER YA existe
     reconfigure_scheduler(app)
@@ -2053,4 +2542,6 @@ async def main():
         await app.updater.stop()
         await app.stop()
         await app.shutdown()
+        WRITER.close()
+        db_flush_progress()
         await tclient.disconnect()
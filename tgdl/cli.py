@@ -12,6 +12,10 @@ def main():
     sub.add_parser("panel", help="Inicia el Panel FastAPI")
     sub.add_parser("bot", help="Inicia el bot de Telegram")
     sub.add_parser("control", help="(Reservado) Control local")
+    sub.add_parser(
+        "db-vacuum",
+        help="Convierte la DB a auto_vacuum incremental (VACUUM completo; con el bot parado)",
+    )
 
     args = parser.parse_args()
 
@@ -52,6 +56,23 @@ def main():
         print("Los endpoints de control viven ahora en 127.0.0.1:8765 y arrancan junto al bot.")
         return 0
 
+    elif args.cmd == "db-vacuum":
+        from tgdl.core import db
+
+        try:
+            db.db_init()
+            m = db.db_maintenance(truncate=True, vacuum=True, vacuum_pages=0, convert=True)
+            print(
+                f"[i] DB {'convertida' if m['converted'] else 'ya incremental'}: "
+                f"{m['bytes']} bytes recuperados en {m['duration_ms']} ms"
+            )
+            return 0
+        except Exception as e:
+            print(f"[!] Error en el mantenimiento de la DB: {e!r}")
+            return 1
+        finally:
+            db.db_close()
+
     else:
         parser.print_help()
         # código 2 suele indicar 'uso incorrecto de CLI'
@@ -26,6 +26,63 @@ class Settings(BaseSettings):
     # Rutas
     DOWNLOAD_DIR: Path = Field(default=Path("./downloads"))
     DB_PATH: Path = Field(default=Path("./data/queue.db"))
+    DB_READERS: int = 4  # conexiones lectoras reutilizables por proceso
+    FLAG_CACHE_TTL: float = 0.25  # s entre comprobaciones de cambios en kv de otros procesos
+    LEASE_SEC: int = 120  # vida de un lease de trabajo; se renueva cada LEASE_SEC/3
+    DISPATCH_POLL_SEC: float = 5.0  # espera máx. del dispatcher sin avisos (programados/reintentos)
+    # Trabajos simultáneos por backend (tgdl.utils.backends); en caliente: /limits o el panel
+    # BACKEND_LIMITS={"aria2": 3, "ytdlp": 1, "telegram": 2, "resolver": 1}
+    BACKEND_LIMITS: dict[str, int] = Field(
+        default_factory=lambda: {"aria2": 2, "ytdlp": 1, "telegram": 2, "resolver": 1}
+    )
+    # Tras entregarlas a aria2 las descargas no ocupan cupo: las vigila un único bucle
+    ARIA2_WATCH_SEC: float = 2.0  # cada cuánto se consulta aria2 (una RPC para todas)
+    ARIA2_MAX_HANDOFFS: int = 100  # entregadas a la vez como máximo (0 = sin límite)
+    # Trabajos simultáneos contra un mismo sitio (dominio registrable, tgdl.utils.hosts),
+    # sumando todos los backends web; por dominio, JSON en .env. Ej.:
+    # HOST_LIMITS={"mediafire.com": 1, "sourceforge.net": 2}
+    HOST_LIMIT: int = 2
+    HOST_LIMITS: dict[str, int] = Field(default_factory=lambda: {"mediafire.com": 1})
+    HOST_SCAN_ROWS: int = 500  # candidatos que se revisan al reclamar buscando sitios libres
+    # Ajuste automático de BACKEND_LIMITS (AIMD, tgdl.core.aimd) por throughput y fallos.
+    # Parte del cupo vigente (BACKEND_LIMITS o /limits) y lo deja en LIMIT_<BACKEND>
+    AIMD_ENABLED: bool = False
+    AIMD_EVERY_SEC: int = 60  # intervalo entre muestras/decisiones
+    # Cupo mín./máx. por backend (los que no aparezcan no se tocan). Ej.:
+    # AIMD_BOUNDS={"aria2": [1, 8], "ytdlp": [1, 2]}
+    AIMD_BOUNDS: dict[str, tuple[int, int]] = Field(
+        default_factory=lambda: {
+            "aria2": (1, 6),
+            "ytdlp": (1, 3),
+            "telegram": (1, 4),
+            "resolver": (1, 2),
+        }
+    )
+    AIMD_ERROR_RATE: float = 0.25  # fallos/terminados por encima de esto => recorte
+    # Presupuesto de ancho de banda por franja horaria (TIMEZONE), en MiB/s repartidos entre
+    # aria2, yt-dlp y Telethon; fuera de toda franja (o con 0) no se limita. Ej.:
+    # BANDWIDTH_WINDOWS={"08:00-23:00": 2.5, "23:00-08:00": 0}
+    BANDWIDTH_WINDOWS: dict[str, float] = Field(default_factory=dict)
+    BANDWIDTH_MIN_KIB: int = 64  # ninguna parte del reparto baja de esto (KiB/s)
+    DB_WRITE_BATCH: int = 64  # mutaciones máx. agrupadas por transacción en el writer
+    CONTROL_URL: str = "http://127.0.0.1:8765"  # servidor de control del bot (writer)
+    EVENTS_MAX_AGE_DAYS: int = 30  # retención de events por edad (0 = sin límite)
+    EVENTS_MAX_ROWS: int = 100_000  # tope de filas en events (0 = sin límite)
+    EVENTS_PRUNE_BATCH: int = 1000  # filas por DELETE al podar (transacciones cortas)
+    ROLLUP_HOURLY_DAYS: int = 14  # días que se conservan los rollups por hora
+    CHANGES_KEEP: int = 10_000  # filas del feed de cambios que sobreviven a la poda
+    # Mantenimiento de SQLite (job "db_maintenance" del bot)
+    DB_MAINT_EVERY_MIN: int = 30  # checkpoint PASSIVE + PRAGMA optimize
+    DB_VACUUM_PAGES: int = 2000  # páginas libres por incremental_vacuum (0 = todas)
+    DB_WAL_LIMIT_MB: int = 64  # journal_size_limit: tamaño al que se recorta el -wal
+    # Reintentos de trabajos fallidos: backoff exponencial con jitter, luego 'dead'
+    RETRY_MAX_ATTEMPTS: int = 5  # intentos totales antes de pasar a 'dead'
+    RETRY_BASE_SEC: float = 30.0  # espera tras el primer fallo (se duplica en cada uno)
+    RETRY_MAX_SEC: float = 3600.0  # tope de la espera
+    RETRY_JITTER: float = 0.25  # ±25 % aleatorio para no reintentar todos a la vez
+    # Ajustes por backend (telegram|ytdlp|aria2), JSON en .env. Ej.:
+    # RETRY_BACKENDS={"ytdlp": {"base_sec": 300, "max_attempts": 3}}
+    RETRY_BACKENDS: dict[str, dict[str, float]] = Field(default_factory=dict)
 
     # Zona horaria
     TIMEZONE: str = "America/New_York"
@@ -72,6 +129,15 @@ class Settings(BaseSettings):
     except Exception:
         PROGRESS_KEEPALIVE_SEC = 180
 
+    # --- Persistencia de progreso (write-behind) ---
+    # Intervalo de volcado por lotes a SQLite (segundos); 0 = escribir en cada llamada
+    try:
+        PROGRESS_FLUSH_SEC: float = max(0.0, float(os.getenv("PROGRESS_FLUSH_SEC", "1.0")))
+    except Exception:
+        PROGRESS_FLUSH_SEC = 1.0
+    # Constante de tiempo (s) de la media móvil exponencial de velocidad (ETA)
+    PROGRESS_EWMA_SEC: float = 10.0
+
     # --- Notificador global de progreso (resumen) ---
     # 0 = deshabilitado (recomendado); 1 = habilitado
     PROGRESS_SUMMARY_ENABLE: bool = os.getenv("PROGRESS_SUMMARY_ENABLE", "0").strip() == "1"
@@ -0,0 +1,226 @@
+"""
+Fachada async de tgdl.core.db para el event loop del bot.
+
+Las funciones sync de db pueden bloquear hasta `timeout=30` s esperando el lock
+de escritura de SQLite (p. ej. si el panel está escribiendo). Aquí se ejecutan
+fuera del loop:
+- escrituras en el writer único (tgdl.core.writer: FIFO, agrupadas por lote);
+- lecturas en un pool pequeño de hilos (uno por conexión lectora).
+Los helpers sync siguen disponibles para el servidor de control y scripts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any
+
+from tgdl.config.settings import settings
+from tgdl.core import db
+from tgdl.core.writer import WRITER
+
+_READ_EXEC = ThreadPoolExecutor(
+    max_workers=max(1, settings.DB_READERS), thread_name_prefix="tgdl-db-read"
+)
+
+
+async def _run(executor: ThreadPoolExecutor, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+async def write(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Ejecuta una mutación sync de db en el hilo escritor."""
+    return await asyncio.wrap_future(WRITER.submit(fn, *args, **kwargs))
+
+
+async def read(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Ejecuta una lectura sync de db en el pool lector."""
+    return await _run(_READ_EXEC, fn, *args, **kwargs)
+
+
+# ---------- Flags ----------
+async def db_set_flag(key: str, value: str) -> None:
+    await write(db.db_set_flag, key, value)
+
+
+# ---------- Queue ----------
+async def db_add(
+    kind: str,
+    payload: dict[str, Any],
+    scheduled_at: datetime,
+    *,
+    force: bool = False,
+    priority: int = 0,
+) -> int:
+    return await write(db.db_add, kind, payload, scheduled_at, force=force, priority=priority)
+
+
+async def db_enqueue(
+    kind: str,
+    payload: dict[str, Any],
+    scheduled_at: datetime,
+    *,
+    force: bool = False,
+    priority: int = 0,
+) -> tuple[int, bool]:
+    return await write(db.db_enqueue, kind, payload, scheduled_at, force=force, priority=priority)
+
+
+async def db_add_many(
+    items: list[db.EnqueueItem], *, force: bool = False, priority: int = 0
+) -> list[tuple[int, bool]]:
+    return await write(db.db_add_many, items, force=force, priority=priority)
+
+
+async def db_claim_due(limit: int | None = None, **kwargs) -> list[tuple[int, str, str]]:
+    return await write(db.db_claim_due, limit, **kwargs)
+
+
+async def db_update_status(
+    qid: int,
+    status: str,
+    *,
+    final_path: str | None = None,
+    size_bytes: int | None = None,
+    error: str | None = None,
+    retry: bool = True,
+) -> None:
+    await write(
+        db.db_update_status,
+        qid,
+        status,
+        final_path=final_path,
+        size_bytes=size_bytes,
+        error=error,
+        retry=retry,
+    )
+
+
+async def db_set_ext_id(qid: int, ext_id: str | None) -> None:
+    await write(db.db_set_ext_id, qid, ext_id)
+
+
+async def db_clear_progress(qid: int) -> None:
+    await write(db.db_clear_progress, qid)
+
+
+async def db_purge_finished() -> int:
+    return await write(db.db_purge_finished)
+
+
+async def db_retry_errors() -> int:
+    return await write(db.db_retry_errors)
+
+
+async def db_requeue_paused_reschedule_now() -> int:
+    return await write(db.db_requeue_paused_reschedule_now)
+
+
+async def db_pull_forward_queued(when: datetime) -> int:
+    return await write(db.db_pull_forward_queued, when)
+
+
+async def db_set_priority(qid: int, priority: int) -> bool:
+    return await write(db.db_set_priority, qid, priority)
+
+
+async def db_bump(qids: list[int]) -> int | None:
+    return await write(db.db_bump, qids)
+
+
+async def db_set_backend_limit(backend: str, limit: int | None) -> None:
+    await write(db.db_set_backend_limit, backend, limit)
+
+
+async def db_clear_all() -> None:
+    await write(db.db_clear_all)
+
+
+# ---------- Leases ----------
+async def db_renew_leases() -> int:
+    return await write(db.db_renew_leases)
+
+
+async def db_sweep_expired_leases() -> int:
+    return await write(db.db_sweep_expired_leases)
+
+
+# ---------- Lecturas ----------
+async def db_get_ext_id_kind(qid: int) -> tuple[str | None, str] | None:
+    return await read(db.db_get_ext_id_kind, qid)
+
+
+async def db_list_page(
+    limit: int = 50,
+    before_id: int | None = None,
+    status: str | None = None,
+    host: str | None = None,
+    chat_id: int | None = None,
+) -> tuple[list[dict[str, Any]], int | None]:
+    return await read(db.db_list_page, limit, before_id, status, host, chat_id)
+
+
+async def db_count_pending() -> int:
+    return await read(db.db_count_pending)
+
+
+async def db_get_progress_rows(limit: int = 100) -> list[dict[str, Any]]:
+    return await read(db.db_get_progress_rows, limit)
+
+
+async def db_get_progress_for(qids: list[int]) -> list[dict[str, Any]]:
+    return await read(db.db_get_progress_for, qids)
+
+
+async def db_changes_since(
+    seq: int, limit: int = 1000, tbl: str | None = None
+) -> tuple[list[db.Change], int, bool]:
+    return await read(db.db_changes_since, seq, limit, tbl)
+
+
+async def db_running_by_backend() -> dict[str, int]:
+    return await read(db.db_running_by_backend)
+
+
+async def db_count_handed_off() -> int:
+    return await read(db.db_count_handed_off)
+
+
+async def db_rollup(bucket: str = "d", period: str | None = None) -> dict[str, dict[str, int]]:
+    return await read(db.db_rollup, bucket, period)
+
+
+async def db_job_outcomes(since_id: int | None = None) -> tuple[dict[str, dict[str, int]], int]:
+    return await read(db.db_job_outcomes, since_id)
+
+
+# ---------- Retención ----------
+async def db_prune_events() -> int:
+    """
+    Poda events en lotes (entre lote y lote el writer atiende otras mutaciones),
+    rollups horarios y el feed de cambios.
+    """
+    floor = await read(db.db_events_prune_floor)
+    batch = settings.EVENTS_PRUNE_BATCH
+    total = 0
+    while True:
+        n = await write(db.db_prune_events_batch, floor, batch)
+        total += n
+        if n < batch:
+            break
+    await write(db.db_prune_rollups)
+    await write(db.db_prune_changes)
+    return total
+
+
+# ---------- Mantenimiento ----------
+async def db_maintenance(*, truncate: bool = False, vacuum: bool = False) -> dict[str, Any]:
+    """
+    Checkpoint/optimize/vacuum en un hilo aparte: no puede ir por el writer porque
+    este envuelve cada lote en una transacción (VACUUM y TRUNCATE necesitan ir fuera).
+    """
+    return await asyncio.to_thread(db.db_maintenance, truncate=truncate, vacuum=vacuum)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import re
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+# Señales de "vas demasiado rápido" en los errores de yt-dlp, aria2 y los resolvers
+_THROTTLE_RE = re.compile(r"\b429\b|too many requests|rate.?limit|flood.?wait", re.IGNORECASE)
+
+
+def is_throttle(error: str | None) -> bool:
+    return bool(error and _THROTTLE_RE.search(error))
+
+
+@dataclass
+class Sample:
+    """Lo observado de un backend en el último intervalo."""
+
+    throughput: float = 0.0  # B/s sumados de sus trabajos en curso
+    running: int = 0  # trabajos en curso que ocupan cupo
+    done: int = 0
+    failed: int = 0
+    throttled: int = 0  # de los fallidos, cuántos por 429/flood/rate limit
+
+
+@dataclass
+class Decision:
+    backend: str
+    old: int
+    new: int
+    reason: str
+    throughput: float
+    at: float = field(default_factory=time.time)
+
+
+@dataclass
+class _State:
+    probe_from: float | None = None  # throughput antes de la última subida
+    hold: int = 0  # intervalos sin volver a subir (meseta o recorte reciente)
+    last: Sample = field(default_factory=Sample)
+
+
+class AimdController:
+    """
+    Ajuste de cupos por backend al estilo AIMD (como la ventana de TCP):
+    - recorte multiplicativo (x `decrease`) ante 429/flood o una tasa de fallos
+      mayor que `error_rate`;
+    - subida aditiva (+1) mientras el backend está saturado (todo su cupo en uso) y
+      la subida anterior mejoró el throughput al menos un `min_gain`; si no lo hizo,
+      deshace esa subida y espera `hold` intervalos antes de volver a probar.
+    Siempre dentro de `bounds` ({backend: (mín, máx)}); los backends fuera de
+    `bounds` no se tocan. No hace E/S: quien lo usa aporta las muestras y aplica
+    (y registra) las decisiones.
+    """
+
+    def __init__(
+        self,
+        bounds: dict[str, tuple[int, int]],
+        *,
+        decrease: float = 0.5,
+        error_rate: float = 0.25,
+        min_gain: float = 0.05,
+        hold: int = 3,
+        keep: int = 50,
+    ):
+        self.bounds = {
+            b: (max(0, int(lo)), max(int(lo), int(hi))) for b, (lo, hi) in bounds.items()
+        }
+        self.decrease = decrease
+        self.error_rate = error_rate
+        self.min_gain = min_gain
+        self.hold = hold
+        self._state: dict[str, _State] = {b: _State() for b in self.bounds}
+        self.history: deque[Decision] = deque(maxlen=keep)
+
+    def step(self, limits: dict[str, int], samples: dict[str, Sample]) -> list[Decision]:
+        """Decide los nuevos cupos a partir de los actuales; devuelve solo los cambios."""
+        out: list[Decision] = []
+        for backend, (lo, hi) in self.bounds.items():
+            cur = int(limits.get(backend, lo))
+            s = samples.get(backend, Sample())
+            new, reason = self._decide(self._state[backend], cur, s, lo, hi)
+            self._state[backend].last = s
+            if new != cur:
+                d = Decision(backend, cur, new, reason, s.throughput)
+                self.history.append(d)
+                out.append(d)
+        return out
+
+    def _decide(self, st: _State, cur: int, s: Sample, lo: int, hi: int) -> tuple[int, str]:
+        if cur < lo or cur > hi:
+            return min(hi, max(lo, cur)), "fuera de límites"
+        finished = s.done + s.failed
+        if s.throttled or (s.failed >= 2 and s.failed > self.error_rate * finished):
+            st.probe_from, st.hold = None, self.hold
+            new = max(lo, int(cur * self.decrease))
+            return new, ("429/flood" if s.throttled else f"fallos {s.failed}/{finished}")
+        if st.probe_from is not None:
+            # Resultado de la última subida
+            base, st.probe_from = st.probe_from, None
+            if s.throughput < base * (1 + self.min_gain):
+                st.hold = self.hold
+                return max(lo, cur - 1), "sin mejora de throughput"
+        if st.hold:
+            st.hold -= 1
+            return cur, ""
+        if s.running >= cur and cur < hi:
+            st.probe_from = s.throughput
+            return cur + 1, "saturado"
+        return cur, ""
+
+    def metrics(self, limits: dict[str, int]) -> dict[str, Any]:
+        """Estado para /status y el panel: cupo, última muestra y últimas decisiones."""
+        return {
+            "backends": {
+                b: {
+                    "limit": int(limits.get(b, lo)),
+                    "min": lo,
+                    "max": hi,
+                    "probing": self._state[b].probe_from is not None,
+                    "hold": self._state[b].hold,
+                    **asdict(self._state[b].last),
+                }
+                for b, (lo, hi) in self.bounds.items()
+            },
+            "decisions": [asdict(d) for d in self.history],
+        }
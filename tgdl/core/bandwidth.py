@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import datetime
+
+_MIB = 1024 * 1024
+
+
+def _minutes(hhmm: str) -> int:
+    h, _, m = hhmm.strip().partition(":")
+    return (int(h) * 60 + int(m or 0)) % (24 * 60)
+
+
+def budget_for(now: datetime, windows: dict[str, float]) -> int | None:
+    """
+    Presupuesto en B/s de la primera franja {"HH:MM-HH:MM": MiB/s} que contiene `now`
+    (una franja con inicio > fin cruza la medianoche). None = sin límite: fuera de
+    toda franja o con valor <= 0.
+    """
+    t = now.hour * 60 + now.minute
+    for span, mib in windows.items():
+        start, _, end = span.partition("-")
+        a, b = _minutes(start), _minutes(end)
+        inside = a <= t < b if a < b else (t >= a or t < b)
+        if inside:
+            return int(mib * _MIB) if mib > 0 else None
+    return None
+
+
+class TokenBucket:
+    """
+    Cubo de tokens async compartido (ráfaga de 1 s). consume(n) espera lo necesario
+    para no pasar de `rate` B/s entre todos los que lo usan; rate None = sin límite.
+    """
+
+    def __init__(self, rate: int | None = None):
+        self.rate = rate
+        self._tokens = float(rate or 0)
+        self._t = time.monotonic()
+
+    def set_rate(self, rate: int | None) -> None:
+        self._refill()
+        self.rate = rate
+        if rate:
+            self._tokens = min(self._tokens, float(rate))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(float(self.rate), self._tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    async def consume(self, n: int) -> None:
+        if not self.rate or n <= 0:
+            return
+        self._refill()
+        self._tokens -= n
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class BandwidthBudget:
+    """
+    Reparto de un presupuesto global (B/s) entre los backends que mueven bytes:
+    - yt-dlp: --limit-rate fijo por proceso (no se puede cambiar en marcha), así que
+      cada uno se lleva su parte al arrancar y la conserva hasta terminar;
+    - aria2 (un límite global para todas sus descargas) y Telethon (un cubo compartido)
+      se reparten lo que dejan libre los yt-dlp, según cuántas transferencias tiene
+      cada uno, y se recalculan cada vez que algo empieza o acaba.
+    Ninguna parte baja de `floor` B/s.
+    """
+
+    def __init__(self, floor: int = 64 * 1024):
+        self.total: int | None = None
+        self.floor = floor
+        self.ytdlp: dict[int, int] = {}  # qid -> --limit-rate con el que se lanzó
+        self.telegram = TokenBucket()
+
+    def _free(self) -> int:
+        return max(self.floor, (self.total or 0) - sum(self.ytdlp.values()))
+
+    def plan(self, aria2: int, telegram: int) -> dict[str, int | None]:
+        """Límites de aria2 y Telethon para `aria2`/`telegram` transferencias en curso."""
+        if self.total is None:
+            return {"aria2": None, "telegram": None}
+        free, n = self._free(), aria2 + telegram
+        # Un backend sin transferencias se queda con todo lo libre hasta el próximo reparto
+        return {
+            "aria2": max(self.floor, free * aria2 // n) if aria2 else free,
+            "telegram": max(self.floor, free * telegram // n) if telegram else free,
+        }
+
+    def reserve_ytdlp(self, qid: int, aria2: int, telegram: int) -> int | None:
+        """--limit-rate para un yt-dlp que arranca: su parte de lo que queda libre."""
+        if self.total is None:
+            return None
+        rate = max(self.floor, self._free() // (aria2 + telegram + 1))
+        self.ytdlp[qid] = rate
+        return rate
+
+    def release(self, qid: int) -> None:
+        self.ytdlp.pop(qid, None)
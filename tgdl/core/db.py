@@ -1,25 +1,252 @@
 from __future__ import annotations
 
+import atexit
 import json
+import os
+import queue
+import socket
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any
+from urllib.parse import urlparse
+from zoneinfo import ZoneInfo
 
 from tgdl.config.settings import settings
+from tgdl.core.aimd import is_throttle
+from tgdl.core.progress import ProgressBuffer, ProgressRow
+from tgdl.utils.backends import BACKENDS, backend_for, backend_sql, retry_policy
+from tgdl.utils.canonical import canonical_key
+from tgdl.utils.hosts import host_limit, site_of
 
 
 # ---------- Helpers de conexión ----------
-def _connect(db_path: Path | None = None) -> sqlite3.Connection:
+def _connect(db_path: Path | None = None, *, readonly: bool = False) -> sqlite3.Connection:
+    """Abre una conexión nueva. El código normal debe usar el pool (_reader/_writer)."""
     db_file = db_path or settings.DB_PATH
     db_file.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_file, isolation_level=None, timeout=30)
+    conn = sqlite3.connect(db_file, isolation_level=None, timeout=30, check_same_thread=False)
+    # Solo surte efecto en una DB vacía (antes de que WAL escriba la cabecera);
+    # las existentes se convierten en db_maintenance
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
     conn.execute("PRAGMA foreign_keys=ON;")
+    # Tras un checkpoint el -wal se recorta a este tamaño (si no, solo crece)
+    conn.execute(f"PRAGMA journal_size_limit={int(settings.DB_WAL_LIMIT_MB) * 1024 * 1024};")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON;")
     return conn
 
 
+class FlagCache:
+    """
+    Copia en memoria de la tabla kv para lecturas en caliente (is_paused por chunk).
+    - Las escrituras de este proceso se reflejan al instante (set()).
+    - Los cambios de otros procesos se detectan con PRAGMA data_version en una
+      conexión dedicada, como mucho una vez cada `ttl` segundos; solo si cambió
+      algo se recarga kv (tabla diminuta).
+    """
+
+    def __init__(self, db_path: Path, ttl: float = 0.25):
+        self.db_path = db_path
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._values: dict[str, str] | None = None
+        self._version: int | None = None
+        self._checked = 0.0
+
+    def get(self, key: str, default: str | None = None) -> str | None:
+        values = self._values
+        if values is None or time.monotonic() - self._checked >= self.ttl:
+            values = self._refresh()
+        v = values.get(key)
+        return default if v is None else v
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            if self._values is not None:
+                self._values = {**self._values, key: value}
+
+    def _refresh(self) -> dict[str, str]:
+        with self._lock:
+            if self._conn is None:
+                self._conn = _connect(self.db_path, readonly=True)
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._values is None or version != self._version:
+                rows = self._conn.execute("SELECT k, v FROM kv").fetchall()
+                self._values = {k: v for k, v in rows if v is not None}
+                self._version = version
+            self._checked = time.monotonic()
+            return self._values
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._values = None
+
+
+class ConnectionPool:
+    """
+    Conexiones SQLite reutilizables para un proceso:
+    - Un único escritor de larga vida, serializado con un RLock (WAL solo admite un writer).
+    - Un pool pequeño de lectores (query_only), cada uno prestado en exclusiva a un hilo.
+    Tras un fork el hijo descarta los pools heredados y abre los suyos.
+    """
+
+    def __init__(self, db_path: Path, readers: int = 4):
+        self.db_path = db_path
+        self._max_readers = max(1, readers)
+        self._writer: sqlite3.Connection | None = None
+        self._wlock = threading.RLock()
+        self._tx_depth = 0
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._created = 0
+        self._rlock = threading.Lock()
+        self.flags = FlagCache(db_path, ttl=settings.FLAG_CACHE_TTL)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        with self._wlock:
+            if self._writer is None:
+                self._writer = _connect(self.db_path)
+            yield self._writer
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE ... COMMIT en el escritor; anidado usa SAVEPOINT."""
+        with self.writer() as conn:
+            depth = self._tx_depth
+            sp = f"sp{depth}"
+            conn.execute(f"SAVEPOINT {sp}" if depth else "BEGIN IMMEDIATE")
+            self._tx_depth += 1
+            try:
+                yield conn
+            except BaseException:
+                self._tx_depth -= 1
+                if depth:
+                    conn.execute(f"ROLLBACK TO {sp}")
+                    conn.execute(f"RELEASE {sp}")
+                else:
+                    conn.execute("ROLLBACK")
+                raise
+            self._tx_depth -= 1
+            conn.execute(f"RELEASE {sp}" if depth else "COMMIT")
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            broken = True
+            raise
+        finally:
+            if broken:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._rlock:
+            if self._created < self._max_readers:
+                self._created += 1
+                try:
+                    return _connect(self.db_path, readonly=True)
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get()
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._rlock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        self.flags.close()
+        with self._wlock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_POOLS: dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _pool(db_path: Path | None = None) -> ConnectionPool:
+    key = str(db_path or settings.DB_PATH)
+    pool = _POOLS.get(key)
+    if pool is not None:
+        return pool
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(Path(key), readers=settings.DB_READERS)
+            _POOLS[key] = pool
+        return pool
+
+
+def _forget_pools_after_fork() -> None:
+    # En el hijo no cerramos las conexiones heredadas (siguen siendo del padre)
+    _POOLS.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+
+@contextmanager
+def _reader(db_path: Path | None = None) -> Iterator[sqlite3.Connection]:
+    with _pool(db_path).reader() as conn:
+        yield conn
+
+
+@contextmanager
+def _writer(db_path: Path | None = None) -> Iterator[sqlite3.Connection]:
+    with _pool(db_path).writer() as conn:
+        yield conn
+
+
+@contextmanager
+def _tx(db_path: Path | None = None) -> Iterator[sqlite3.Connection]:
+    with _pool(db_path).transaction() as conn:
+        yield conn
+
+
+def db_close() -> None:
+    """Vuelca el progreso pendiente y cierra las conexiones del pool de este proceso."""
+    PROGRESS.flush()
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for p in pools:
+        p.close()
+
+
 # ---------- Esquema ----------
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS queue (
@@ -27,13 +254,13 @@ CREATE TABLE IF NOT EXISTS queue (
   kind         TEXT NOT NULL,
   payload      TEXT NOT NULL,               -- JSON
   status       TEXT NOT NULL DEFAULT 'queued',
-  scheduled_at TEXT NOT NULL,               -- ISO datetime
+  scheduled_at TEXT NOT NULL,               -- ISO datetime (solo para mostrar)
   created_at   TEXT NOT NULL,               -- ISO datetime
   updated_at   TEXT NOT NULL                -- ISO datetime
 );
 
+-- idx_queue_status equivale a (status, id): sirve listados por estado paginados por id
 CREATE INDEX IF NOT EXISTS idx_queue_status      ON queue(status);
-CREATE INDEX IF NOT EXISTS idx_queue_scheduled   ON queue(scheduled_at);
 CREATE INDEX IF NOT EXISTS idx_queue_created     ON queue(created_at);
 
 CREATE TABLE IF NOT EXISTS progress (
@@ -44,20 +271,62 @@ CREATE TABLE IF NOT EXISTS progress (
   FOREIGN KEY(qid) REFERENCES queue(id) ON DELETE CASCADE
 );
 
+CREATE INDEX IF NOT EXISTS idx_progress_updated ON progress(updated_at, qid);
+
 CREATE TABLE IF NOT EXISTS kv (
   k TEXT PRIMARY KEY,
   v TEXT
 );
 
+-- Sin FK a queue: los trabajos terminados se mueven a queue_history y el qid se conserva
 CREATE TABLE IF NOT EXISTS events (
   id         INTEGER PRIMARY KEY AUTOINCREMENT,
   qid        INTEGER,
   ts         TEXT NOT NULL,
   type       TEXT NOT NULL,
-  payload    TEXT NOT NULL,                  -- JSON
-  FOREIGN KEY(qid) REFERENCES queue(id) ON DELETE SET NULL
+  payload    TEXT NOT NULL                   -- JSON
 );
 
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+
+-- Agregados de events por hora ('h') y por día ('d'), mantenidos al insertar cada evento
+CREATE TABLE IF NOT EXISTS events_rollup (
+  bucket      TEXT NOT NULL,                 -- 'h' | 'd'
+  period      TEXT NOT NULL,                 -- 'YYYY-MM-DDTHH' | 'YYYY-MM-DD' (hora local)
+  type        TEXT NOT NULL,
+  kind        TEXT NOT NULL DEFAULT '',
+  host        TEXT NOT NULL DEFAULT '',
+  outcome     TEXT NOT NULL DEFAULT '',
+  n           INTEGER NOT NULL DEFAULT 0,
+  bytes       INTEGER NOT NULL DEFAULT 0,
+  duration_ms INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY(bucket, period, type, kind, host, outcome)
+) WITHOUT ROWID;
+
+-- Trabajos terminados (done/error/canceled): la tabla queue solo guarda trabajo vivo
+CREATE TABLE IF NOT EXISTS queue_history (
+  id           INTEGER PRIMARY KEY,          -- mismo id que tuvo en queue
+  kind         TEXT NOT NULL,
+  payload      TEXT NOT NULL,                -- JSON
+  status       TEXT NOT NULL,                -- done | error | canceled
+  scheduled_at TEXT NOT NULL,
+  created_at   TEXT NOT NULL,
+  finished_at  TEXT NOT NULL,                -- ISO
+  ext_id       TEXT,
+  canon_key    TEXT,
+  url          TEXT,
+  host         TEXT,
+  final_path   TEXT,
+  size_bytes   INTEGER,
+  duration_ms  INTEGER,
+  avg_speed    REAL                          -- bytes/s
+);
+
+CREATE INDEX IF NOT EXISTS idx_history_status   ON queue_history(status, id);
+CREATE INDEX IF NOT EXISTS idx_history_canon    ON queue_history(canon_key, status);
+CREATE INDEX IF NOT EXISTS idx_history_host     ON queue_history(host, id);
+CREATE INDEX IF NOT EXISTS idx_history_finished ON queue_history(finished_at);
+
 CREATE TABLE IF NOT EXISTS schedules (
   id          INTEGER PRIMARY KEY AUTOINCREMENT,
   rule        TEXT NOT NULL,                 -- JSON: descripción APScheduler (cron/interval/once)
@@ -68,25 +337,219 @@ CREATE TABLE IF NOT EXISTS schedules (
 """
 
 
+# Host de la URL del payload: lo que va entre '://' y la primera '/' (NULL en magnets)
+_J_URL = "json_extract(payload, '$.url')"
+_J_REST = f"substr({_J_URL}, instr({_J_URL}, '://') + 3)"
+_J_HOST = (
+    f"CASE WHEN instr({_J_URL}, '://') > 0 "
+    f"THEN lower(substr({_J_REST}, 1, instr({_J_REST} || '/', '/') - 1)) END"
+)
+# Backend que atenderá el trabajo (tgdl.utils.backends): cupos separados al reclamar
+_J_BACKEND = backend_sql("kind", _J_URL)
+
+# Columnas añadidas tras el esquema inicial (ALTER TABLE idempotente)
+_ADDED_COLUMNS: dict[str, list[tuple[str, str]]] = {
+    "queue": [
+        ("ext_id", "TEXT"),  # GID de aria2 u otros ids externos
+        ("lease_owner", "TEXT"),  # proceso que reclamó el trabajo (host:pid)
+        ("lease_expires_at", "INTEGER"),  # epoch ms; vencido => vuelve a 'queued'
+        ("canon_key", "TEXT"),  # clave de deduplicación (tgdl.utils.canonical)
+        ("scheduled_ms", "INTEGER"),  # scheduled_at en epoch ms: orden y rangos correctos
+        # Reintentos con backoff (db_fail_job)
+        ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+        ("next_attempt_at", "INTEGER"),  # epoch ms; no se despacha antes
+        ("last_error", "TEXT"),
+        ("priority", "INTEGER NOT NULL DEFAULT 0"),  # mayor = antes; empate por id
+        # Campos calientes del payload como columnas generadas (VIRTUAL: sin coste en disco)
+        ("url", f"TEXT GENERATED ALWAYS AS ({_J_URL}) VIRTUAL"),
+        (
+            "suggested_name",
+            "TEXT GENERATED ALWAYS AS (json_extract(payload, '$.suggested_name')) VIRTUAL",
+        ),
+        (
+            "notify_chat_id",
+            "INTEGER GENERATED ALWAYS AS (json_extract(payload, '$.notify_chat_id')) VIRTUAL",
+        ),
+        ("host", f"TEXT GENERATED ALWAYS AS ({_J_HOST}) VIRTUAL"),
+        ("backend", f"TEXT GENERATED ALWAYS AS ({_J_BACKEND}) VIRTUAL"),
+    ],
+    "progress": [
+        ("speed", "REAL"),  # B/s (EWMA, ver ProgressBuffer)
+        ("eta_sec", "INTEGER"),
+    ],
+    "queue_history": [
+        ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+        ("last_error", "TEXT"),
+    ],
+}
+
+# Índices y triggers sobre columnas migradas (tras _migrate)
+POST_MIGRATION_SQL = """
+-- Consulta del despachador: status='queued' AND scheduled_ms<=? (índice cubriente)
+DROP INDEX IF EXISTS idx_queue_dispatch;
+DROP INDEX IF EXISTS idx_queue_scheduled;
+CREATE INDEX IF NOT EXISTS idx_queue_due ON queue(status, scheduled_ms, id);
+-- Orden de despacho: prioridad y luego id (recorrido del índice, sin ordenar)
+CREATE INDEX IF NOT EXISTS idx_queue_prio ON queue(status, priority DESC, id);
+-- Mismo orden dentro de cada backend (reclamo con cupos por backend)
+CREATE INDEX IF NOT EXISTS idx_queue_backend ON queue(status, backend, priority DESC, id);
+CREATE INDEX IF NOT EXISTS idx_queue_lease ON queue(status, lease_expires_at);
+CREATE INDEX IF NOT EXISTS idx_queue_canon ON queue(canon_key, status);
+CREATE INDEX IF NOT EXISTS idx_queue_host ON queue(host, status);
+CREATE INDEX IF NOT EXISTS idx_queue_notify ON queue(notify_chat_id, id)
+  WHERE notify_chat_id IS NOT NULL;
+
+-- Feed de cambios: una fila por (tbl, qid) con el último seq que la tocó.
+-- Lo escriben triggers, así que va en la misma transacción que la mutación.
+CREATE TABLE IF NOT EXISTS changes (
+  seq  INTEGER PRIMARY KEY AUTOINCREMENT,   -- monótono, nunca se reutiliza
+  tbl  TEXT NOT NULL,                       -- 'queue' | 'progress'
+  op   TEXT NOT NULL,                       -- 'I' | 'U' | 'D'
+  qid  INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_changes_row ON changes(tbl, qid);
+
+CREATE TRIGGER IF NOT EXISTS trg_queue_ins AFTER INSERT ON queue BEGIN
+  DELETE FROM changes WHERE tbl='queue' AND qid=NEW.id;
+  INSERT INTO changes(tbl, op, qid) VALUES ('queue', 'I', NEW.id);
+END;
+-- Solo columnas visibles: renovar leases no genera cambios (se recrea si cambia la lista)
+DROP TRIGGER IF EXISTS trg_queue_upd;
+CREATE TRIGGER trg_queue_upd
+AFTER UPDATE OF status, scheduled_at, payload, ext_id, priority ON queue BEGIN
+  DELETE FROM changes WHERE tbl='queue' AND qid=NEW.id;
+  INSERT INTO changes(tbl, op, qid) VALUES ('queue', 'U', NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_queue_del AFTER DELETE ON queue BEGIN
+  DELETE FROM changes WHERE tbl='queue' AND qid=OLD.id;
+  INSERT INTO changes(tbl, op, qid) VALUES ('queue', 'D', OLD.id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_progress_ins AFTER INSERT ON progress BEGIN
+  DELETE FROM changes WHERE tbl='progress' AND qid=NEW.qid;
+  INSERT INTO changes(tbl, op, qid) VALUES ('progress', 'I', NEW.qid);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_progress_upd AFTER UPDATE ON progress BEGIN
+  DELETE FROM changes WHERE tbl='progress' AND qid=NEW.qid;
+  INSERT INTO changes(tbl, op, qid) VALUES ('progress', 'U', NEW.qid);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_progress_del AFTER DELETE ON progress BEGIN
+  DELETE FROM changes WHERE tbl='progress' AND qid=OLD.qid;
+  INSERT INTO changes(tbl, op, qid) VALUES ('progress', 'D', OLD.qid);
+END;
+"""
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    added: set[str] = set()
+    for table, cols in _ADDED_COLUMNS.items():
+        # table_xinfo: table_info omite las columnas generadas y se volverían a añadir
+        have = {r[1] for r in conn.execute(f"PRAGMA table_xinfo({table})").fetchall()}
+        for name, decl in cols:
+            if name not in have:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+                added.add(f"{table}.{name}")
+    if "queue.canon_key" in added:
+        _backfill_canon_keys(conn)
+    if "queue.scheduled_ms" in added:
+        _backfill_scheduled_ms(conn)
+    conn.executescript(POST_MIGRATION_SQL)
+    if conn.execute("PRAGMA foreign_key_list(events)").fetchone():
+        _rebuild_events_without_fk(conn)
+    _archive_finished(conn)
+
+
+def _rebuild_events_without_fk(conn: sqlite3.Connection) -> None:
+    # Con el FK antiguo (ON DELETE SET NULL) archivar un trabajo borraría el qid de sus eventos
+    conn.execute("SAVEPOINT events_rebuild")
+    conn.execute(
+        "CREATE TABLE events_new (id INTEGER PRIMARY KEY AUTOINCREMENT, qid INTEGER, "
+        "ts TEXT NOT NULL, type TEXT NOT NULL, payload TEXT NOT NULL)"
+    )
+    conn.execute("INSERT INTO events_new(id, qid, ts, type, payload) SELECT * FROM events")
+    conn.execute("DROP TABLE events")
+    conn.execute("ALTER TABLE events_new RENAME TO events")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)")
+    conn.execute("RELEASE events_rebuild")
+
+
+# Columnas de queue_history copiadas tal cual desde queue al archivar
+_HISTORY_COPY = (
+    "kind, payload, status, scheduled_at, created_at, ext_id, canon_key, url, host, "
+    "attempts, last_error"
+)
+
+
+def _archive_finished(conn: sqlite3.Connection) -> None:
+    """Mueve a queue_history los terminados que aún estén en queue (datos previos)."""
+    conn.execute("SAVEPOINT archive_finished")
+    conn.execute(
+        f"INSERT OR REPLACE INTO queue_history(id, {_HISTORY_COPY}, finished_at) "
+        f"SELECT id, {_HISTORY_COPY}, updated_at FROM queue "
+        "WHERE status IN ('done','error','canceled','dead')"
+    )
+    conn.execute("DELETE FROM queue WHERE status IN ('done','error','canceled','dead')")
+    conn.execute("RELEASE archive_finished")
+
+
+def _backfill_canon_keys(conn: sqlite3.Connection) -> None:
+    rows = conn.execute("SELECT id, kind, payload FROM queue").fetchall()
+    keys = []
+    for qid, kind, payload in rows:
+        try:
+            key = canonical_key(kind, json.loads(payload or "{}"))
+        except Exception:
+            key = None
+        if key:
+            keys.append((key, qid))
+    conn.executemany("UPDATE queue SET canon_key=? WHERE id=?", keys)
+
+
+def _sched_ms(dt: datetime) -> int:
+    """Epoch ms de un datetime (naive = hora local, como astimezone())."""
+    return int(dt.timestamp() * 1000)
+
+
+def _parse_sched_ms(text: str | None, tz: ZoneInfo | None = None) -> int:
+    # Acepta ISO con offset y el formato naive "%Y-%m-%d %H:%M:%S" que escribía el modo
+    # 24/7 en settings.TIMEZONE (`tz`), que no tiene por qué ser la zona del sistema
+    try:
+        dt = datetime.fromisoformat(str(text).strip())
+    except ValueError:
+        return 0  # ilegible: vencido, mejor que perderlo
+    if dt.tzinfo is None and tz is not None:
+        dt = dt.replace(tzinfo=tz)
+    return _sched_ms(dt)
+
+
+def _backfill_scheduled_ms(conn: sqlite3.Connection) -> None:
+    rows = conn.execute("SELECT id, scheduled_at FROM queue").fetchall()
+    tz = ZoneInfo(settings.TIMEZONE)
+    conn.executemany(
+        "UPDATE queue SET scheduled_ms=? WHERE id=?",
+        [(_parse_sched_ms(sched, tz), qid) for qid, sched in rows],
+    )
+
+
 def db_init(db_path: Path | None = None) -> None:
-    with _connect(db_path) as conn:
+    with _writer(db_path) as conn:
         conn.executescript(SCHEMA_SQL)
+        _migrate(conn)
 
 
 # ---------- Flags ----------
 def db_set_flag(key: str, value: str) -> None:
-    with _connect() as conn:
+    pool = _pool()
+    with pool.writer() as conn:
         conn.execute(
             "INSERT INTO kv(k,v) VALUES(?,?) ON CONFLICT(k) DO UPDATE SET v=excluded.v",
             (key, value),
         )
+    pool.flags.set(key, value)
 
 
 def db_get_flag(key: str, default: str | None = None) -> str | None:
-    with _connect() as conn:
-        cur = conn.execute("SELECT v FROM kv WHERE k=?", (key,))
-        row = cur.fetchone()
-        return row[0] if row else default
+    """Lectura desde la caché en memoria (ver FlagCache); barata en rutas calientes."""
+    return _pool().flags.get(key, default)
 
 
 def is_paused() -> bool:
@@ -98,73 +561,383 @@ def _iso_now() -> str:
     return datetime.now().astimezone().isoformat()
 
 
-def db_add(kind: str, payload: dict[str, Any], scheduled_at: datetime) -> int:
+# Estados en los que un trabajo con la misma clave canónica cuenta como duplicado
+# (los vivos están en queue; 'done' vive en queue_history)
+DEDUP_STATUSES = ("queued", "running", "paused", "done")
+
+
+def _find_existing(conn: sqlite3.Connection, keys: list[str]) -> dict[str, int]:
+    """clave -> id del trabajo más reciente que la hace duplicada (queue o history)."""
+    found: dict[str, int] = {}
+    wanted = sorted(set(keys))
+    for i in range(0, len(wanted), 500):
+        chunk = wanted[i : i + 500]
+        marks = ",".join("?" * len(chunk))
+        found.update(
+            conn.execute(
+                f"SELECT canon_key, MAX(id) FROM queue WHERE canon_key IN ({marks}) "
+                "AND status IN (?,?,?,?) GROUP BY canon_key",
+                (*chunk, *DEDUP_STATUSES),
+            ).fetchall()
+        )
+        rest = [k for k in chunk if k not in found]
+        if rest:
+            marks = ",".join("?" * len(rest))
+            found.update(
+                conn.execute(
+                    f"SELECT canon_key, MAX(id) FROM queue_history WHERE canon_key IN ({marks}) "
+                    "AND status='done' GROUP BY canon_key",
+                    rest,
+                ).fetchall()
+            )
+    return {k: int(v) for k, v in found.items()}
+
+
+def db_enqueue(
+    kind: str,
+    payload: dict[str, Any],
+    scheduled_at: datetime,
+    *,
+    force: bool = False,
+    priority: int = 0,
+) -> tuple[int, bool]:
+    """
+    Encola deduplicando por clave canónica. Devuelve (id, creado).
+    Si ya hay un trabajo activo o terminado con la misma clave, devuelve su id
+    y creado=False; force=True encola igualmente (re-descarga).
+    Mayor `priority` se despacha antes (a igual prioridad, por orden de llegada).
+    """
     now_iso = _iso_now()
     sched_iso = scheduled_at.astimezone().isoformat()
-    with _connect() as conn:
+    sched_ms = _sched_ms(scheduled_at)
+    key = canonical_key(kind, payload)
+    with _tx() as conn:
+        if key and not force:
+            found = _find_existing(conn, [key])
+            if key in found:
+                return found[key], False
         cur = conn.execute(
-            "INSERT INTO queue(kind, payload, status, scheduled_at, created_at, updated_at) "
-            "VALUES (?,?,?,?,?,?)",
-            (kind, json.dumps(payload, ensure_ascii=False), "queued", sched_iso, now_iso, now_iso),
+            "INSERT INTO queue(kind, payload, status, scheduled_at, scheduled_ms, created_at, "
+            "updated_at, canon_key, priority) VALUES (?,?,?,?,?,?,?,?,?)",
+            (
+                kind,
+                json.dumps(payload, ensure_ascii=False),
+                "queued",
+                sched_iso,
+                sched_ms,
+                now_iso,
+                now_iso,
+                key,
+                int(priority),
+            ),
         )
-        return int(cur.lastrowid)
+        return int(cur.lastrowid), True
+
+
+def db_add(
+    kind: str,
+    payload: dict[str, Any],
+    scheduled_at: datetime,
+    *,
+    force: bool = False,
+    priority: int = 0,
+) -> int:
+    """Como db_enqueue pero solo el id (el existente si era un duplicado)."""
+    return db_enqueue(kind, payload, scheduled_at, force=force, priority=priority)[0]
+
+
+EnqueueItem = tuple[str, dict[str, Any], datetime]
+
+
+def db_add_many(
+    items: list[EnqueueItem], *, force: bool = False, priority: int = 0
+) -> list[tuple[int, bool]]:
+    """
+    Encolado masivo en UNA transacción (un solo fsync); cada INSERT devuelve su id
+    con RETURNING, sin suponer nada sobre cómo los asigna SQLite.
+    Devuelve (id, creado) por ítem y en el mismo orden, con la misma deduplicación
+    que db_enqueue (también entre ítems repetidos dentro del lote).
+    """
+    if not items:
+        return []
+    now_iso = _iso_now()
+    keys = [canonical_key(kind, payload) for kind, payload, _ in items]
+    out: list[tuple[int, bool] | None] = [None] * len(items)
+    with _tx() as conn:
+        existing: dict[str, int] = {}
+        if not force:
+            existing = _find_existing(conn, [k for k in keys if k])
+        rows = []
+        pending: dict[str, int] = {}  # clave -> índice del primer ítem nuevo con ella
+        new_idx: list[int] = []
+        for i, ((kind, payload, sched), key) in enumerate(zip(items, keys, strict=True)):
+            if key and not force:
+                if key in existing:
+                    out[i] = (int(existing[key]), False)
+                    continue
+                if key in pending:
+                    continue  # se resuelve tras insertar al primero
+                pending[key] = i
+            new_idx.append(i)
+            rows.append(
+                (
+                    kind,
+                    json.dumps(payload, ensure_ascii=False),
+                    "queued",
+                    sched.astimezone().isoformat(),
+                    _sched_ms(sched),
+                    now_iso,
+                    now_iso,
+                    key,
+                    int(priority),
+                )
+            )
+        sql = (
+            "INSERT INTO queue(kind, payload, status, scheduled_at, scheduled_ms, created_at, "
+            "updated_at, canon_key, priority) VALUES (?,?,?,?,?,?,?,?,?) RETURNING id"
+        )
+        for i, row in zip(new_idx, rows, strict=True):
+            out[i] = (int(conn.execute(sql, row).fetchone()[0]), True)
+        for i, key in enumerate(keys):
+            if out[i] is None and key is not None:
+                out[i] = (out[pending[key]][0], False)
+    return out  # type: ignore[return-value]
 
 
 def db_get_due(now: datetime) -> list[tuple[int, str, str]]:
     """Elementos en 'queued' programados hasta 'now' (incl)."""
-    now_iso = now.astimezone().isoformat()
-    with _connect() as conn:
+    with _reader() as conn:
         cur = conn.execute(
             "SELECT id, kind, payload FROM queue "
-            "WHERE status='queued' AND scheduled_at<=? "
-            "ORDER BY id ASC",
-            (now_iso,),
+            "WHERE status='queued' AND scheduled_ms<=? "
+            "AND (next_attempt_at IS NULL OR next_attempt_at<=?) "
+            "ORDER BY priority DESC, id ASC",
+            (_sched_ms(now), _sched_ms(now)),
         )
         return list(cur.fetchall())
 
 
 def db_get_all_queued() -> list[tuple[int, str, str]]:
-    with _connect() as conn:
+    with _reader() as conn:
         cur = conn.execute(
-            "SELECT id, kind, payload FROM queue WHERE status='queued' ORDER BY id ASC"
+            "SELECT id, kind, payload FROM queue WHERE status='queued' "
+            "ORDER BY priority DESC, id ASC"
         )
         return list(cur.fetchall())
 
 
-def db_update_status(qid: int, status: str) -> None:
-    with _connect() as conn:
+# Estados finales: el trabajo se archiva en queue_history y se registra 'job_end'.
+# 'dead' = agotó los reintentos (dead-letter); 'error' = fallo sin reintento.
+TERMINAL_STATUSES = ("done", "error", "canceled", "dead")
+
+
+def db_update_status(
+    qid: int,
+    status: str,
+    *,
+    final_path: str | None = None,
+    size_bytes: int | None = None,
+    error: str | None = None,
+    retry: bool = True,
+) -> None:
+    """
+    Cambia el estado de un trabajo. 'error' pasa por db_fail_job: se reprograma con
+    backoff mientras queden intentos (retry=False lo da por perdido sin reintentar).
+    """
+    if status == "error":
+        db_fail_job(qid, error, retry=retry)
+        return
+    if status in TERMINAL_STATUSES:
+        db_finish_job(qid, status, final_path=final_path, size_bytes=size_bytes)
+        return
+    if status != "running":
+        # Pausa: persistir ya el último progreso conocido
+        PROGRESS.flush()
+    with _tx() as conn:
+        if status == "running":
+            conn.execute(
+                "UPDATE queue SET status=?, updated_at=? WHERE id=?",
+                (status, _iso_now(), qid),
+            )
+        else:
+            # Fuera de 'running' el lease deja de tener sentido
+            conn.execute(
+                "UPDATE queue SET status=?, updated_at=?, lease_owner=NULL, lease_expires_at=NULL "
+                "WHERE id=?",
+                (status, _iso_now(), qid),
+            )
+
+
+def db_fail_job(qid: int, error: str | None = None, *, retry: bool = True) -> str | None:
+    """
+    Registra un intento fallido. Con intentos restantes (RETRY_*, por backend) vuelve
+    a 'queued' con next_attempt_at = ahora + backoff con jitter; si no, se archiva
+    como 'dead' (o 'error' con retry=False). Solo afecta a trabajos 'running': uno
+    pausado, cancelado o ya reencolado no gasta intento ni pierde su progreso.
+    Devuelve el estado resultante o None si el qid no estaba en curso.
+    """
+    PROGRESS.flush()
+    with _tx() as conn:
+        row = conn.execute(
+            "SELECT kind, payload, attempts, url FROM queue WHERE id=? AND status='running'",
+            (qid,),
+        ).fetchone()
+        if row is None:
+            return None
+        attempts = int(row[2] or 0) + 1
+        try:
+            payload = json.loads(row[1] or "{}")
+        except ValueError:
+            payload = {}
+        policy = retry_policy(backend_for(row[0], payload))
+        if retry and attempts < policy.max_attempts:
+            next_at = _now_ms() + int(policy.delay_sec(attempts) * 1000)
+            conn.execute(
+                "UPDATE queue SET status='queued', attempts=?, next_attempt_at=?, "
+                "last_error=COALESCE(?, last_error), updated_at=?, "
+                "lease_owner=NULL, lease_expires_at=NULL WHERE id=?",
+                (attempts, next_at, error, _iso_now(), qid),
+            )
+            # El reintento empieza de cero: fuera el progreso del intento fallido
+            conn.execute("DELETE FROM progress WHERE qid=?", (qid,))
+            status = "queued"
+        else:
+            conn.execute(
+                "UPDATE queue SET attempts=?, last_error=COALESCE(?, last_error) WHERE id=?",
+                (attempts, error, qid),
+            )
+            status = "dead" if retry else "error"
+            db_finish_job(qid, status)
+        # Cada intento fallido (también los que se reintentan): base del ajuste AIMD
+        db_add_event(
+            qid,
+            "job_fail",
+            {
+                "kind": row[0],
+                "url": row[3],
+                "outcome": status,
+                "attempt": attempts,
+                "error": (error or "")[:300],
+            },
+        )
+    PROGRESS.discard(qid)
+    return status
+
+
+def _run_duration_ms(prev_status: str, updated_at: str | None) -> int:
+    # updated_at se fija al reclamar el trabajo (queued -> running)
+    if prev_status != "running" or not updated_at:
+        return 0
+    try:
+        started = datetime.fromisoformat(updated_at)
+    except (TypeError, ValueError):
+        return 0
+    return max(0, int((datetime.now().astimezone() - started).total_seconds() * 1000))
+
+
+def db_finish_job(
+    qid: int,
+    status: str,
+    *,
+    final_path: str | None = None,
+    size_bytes: int | None = None,
+) -> bool:
+    """
+    Cierra un trabajo en UNA transacción: lo copia a queue_history (con ruta final,
+    tamaño, duración y velocidad media), lo borra de queue (y su progreso) y registra
+    el evento 'job_end'. False si el qid ya no estaba en queue.
+    """
+    # Persistir el último progreso conocido: de ahí sale el tamaño si no se indica
+    PROGRESS.flush()
+    with _tx() as conn:
+        row = conn.execute(
+            f"SELECT {_HISTORY_COPY}, q.updated_at, p.downloaded "
+            "FROM queue q LEFT JOIN progress p ON p.qid=q.id WHERE q.id=?",
+            (qid,),
+        ).fetchone()
+        if row is None:
+            return False
+        kind, payload, prev_status = row[0], row[1], row[2]
+        url, host, updated_at, downloaded = row[7], row[8], row[11], row[12]
+        duration_ms = _run_duration_ms(prev_status, updated_at)
+        size = size_bytes if size_bytes is not None else downloaded
+        speed = (size / (duration_ms / 1000)) if size and duration_ms else None
         conn.execute(
-            "UPDATE queue SET status=?, updated_at=? WHERE id=?",
-            (status, _iso_now(), qid),
+            f"INSERT OR REPLACE INTO queue_history(id, {_HISTORY_COPY}, finished_at, "
+            "final_path, size_bytes, duration_ms, avg_speed) "
+            "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            (
+                qid,
+                kind,
+                payload,
+                status,
+                *row[3:11],
+                _iso_now(),
+                final_path,
+                size,
+                duration_ms if prev_status == "running" else None,
+                speed,
+            ),
         )
+        conn.execute("DELETE FROM progress WHERE qid=?", (qid,))
+        conn.execute("DELETE FROM queue WHERE id=?", (qid,))
+        db_add_event(
+            qid,
+            "job_end",
+            {
+                "kind": kind,
+                "url": url,
+                "host": host or ("t.me" if kind.startswith("tg_") else None),
+                "outcome": status,
+                "bytes": size or 0,
+                "duration_ms": duration_ms,
+            },
+        )
+    PROGRESS.discard(qid)
+    return True
 
 
 def db_list(limit: int = 50) -> list[tuple[int, str, str, str, str]]:
-    with _connect() as conn:
-        cur = conn.execute(
-            "SELECT id, kind, payload, status, scheduled_at FROM queue ORDER BY id DESC LIMIT ?",
-            (int(limit),),
-        )
-        return list(cur.fetchall())
+    rows, _ = db_list_page(limit)
+    return [(r["id"], r["kind"], r["payload"], r["status"], r["scheduled_at"]) for r in rows]
 
 
 def db_purge_finished() -> int:
-    with _connect() as conn:
-        cur = conn.execute("DELETE FROM queue WHERE status IN ('done','error')")
-        return cur.rowcount
+    """Borra del historial los terminados (done/error/dead); los cancelados se conservan."""
+    with _tx() as conn:
+        cur = conn.execute("DELETE FROM queue_history WHERE status IN ('done','error','dead')")
+        n = cur.rowcount
+        cur = conn.execute("DELETE FROM queue WHERE status IN ('done','error','dead')")
+        return n + cur.rowcount
 
 
 def db_retry_errors() -> int:
-    with _connect() as conn:
+    """
+    Devuelve a queue (mismo id, estado 'queued') los trabajos con error o 'dead' del
+    historial, con el contador de intentos a cero (last_error se conserva).
+    """
+    now_iso = _iso_now()
+    with _tx() as conn:
+        # Ya habían vencido: vuelven como vencidos ahora (scheduled_at se conserva)
         cur = conn.execute(
-            "UPDATE queue SET status='queued', updated_at=? WHERE status='error'",
-            (_iso_now(),),
+            "INSERT INTO queue(id, kind, payload, status, scheduled_at, scheduled_ms, created_at, "
+            "updated_at, canon_key, last_error) SELECT id, kind, payload, 'queued', scheduled_at, "
+            "?, created_at, ?, canon_key, last_error FROM queue_history "
+            "WHERE status IN ('error','dead') ORDER BY id",
+            (_now_ms(), now_iso),
         )
-        return cur.rowcount
+        n = cur.rowcount
+        conn.execute("DELETE FROM queue_history WHERE status IN ('error','dead')")
+        cur = conn.execute(
+            "UPDATE queue SET status='queued', attempts=0, next_attempt_at=NULL, updated_at=? "
+            "WHERE status IN ('error','dead')",
+            (now_iso,),
+        )
+        return n + cur.rowcount
 
 
 def db_requeue_paused() -> int:
-    with _connect() as conn:
+    with _writer() as conn:
         cur = conn.execute(
             "UPDATE queue SET status='queued', updated_at=? WHERE status='paused'",
             (_iso_now(),),
@@ -174,81 +947,870 @@ def db_requeue_paused() -> int:
 
 def db_requeue_paused_reschedule_now() -> int:
     now_iso = _iso_now()
-    with _connect() as conn:
+    with _writer() as conn:
+        cur = conn.execute(
+            "UPDATE queue SET status='queued', scheduled_at=?, scheduled_ms=?, updated_at=? "
+            "WHERE status='paused'",
+            (now_iso, _now_ms(), now_iso),
+        )
+        return cur.rowcount
+
+
+def db_set_priority(qid: int, priority: int) -> bool:
+    """Fija la prioridad de un trabajo vivo (tiene efecto en el próximo despacho)."""
+    with _writer() as conn:
+        cur = conn.execute("UPDATE queue SET priority=? WHERE id=?", (int(priority), qid))
+        return cur.rowcount > 0
+
+
+def db_bump(qids: list[int]) -> int | None:
+    """
+    Pone los trabajos por delante de todo lo pendiente: prioridad = máxima + 1.
+    Devuelve la prioridad asignada o None si ninguno estaba en la cola.
+    """
+    if not qids:
+        return None
+    with _tx() as conn:
+        top = conn.execute(
+            "SELECT COALESCE(MAX(priority), 0) FROM queue WHERE status IN ('queued','paused')"
+        ).fetchone()[0]
+        marks = ",".join("?" * len(qids))
+        cur = conn.execute(
+            f"UPDATE queue SET priority=? WHERE id IN ({marks})",
+            (int(top) + 1, *[int(q) for q in qids]),
+        )
+        return int(top) + 1 if cur.rowcount else None
+
+
+# ---------- Leases (reclamo atómico de trabajos) ----------
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def lease_owner() -> str:
+    """Identificador del proceso actual como dueño de leases (host:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _busy_sites(conn: sqlite3.Connection) -> Counter[str]:
+    """Trabajos 'running' por sitio (de cualquier proceso; incluye los entregados a aria2)."""
+    busy: Counter[str] = Counter()
+    for host, n in conn.execute(
+        "SELECT host, COUNT(*) FROM queue WHERE status='running' AND backend<>'telegram' "
+        "GROUP BY host"
+    ):
+        site = site_of(host)
+        if site:
+            busy[site] += n
+    return busy
+
+
+def _pick_polite(
+    conn: sqlite3.Connection,
+    where: str,
+    params: list[Any],
+    backend: str,
+    n: int,
+    busy: Counter[str],
+) -> list[int]:
+    """
+    Hasta `n` ids de `backend` en orden de despacho sin pasar del cupo de ningún sitio;
+    a igual prioridad, primero los de sitios sin nada en curso. Actualiza `busy`.
+    """
+    polite = backend != "telegram"
+    cur = conn.execute(
+        f"SELECT id, host, priority FROM queue WHERE {where} AND backend=? "
+        "ORDER BY priority DESC, id ASC LIMIT ?",
+        [*params, backend, max(n, settings.HOST_SCAN_ROWS) if polite else n],
+    )
+    picks: list[int] = []
+    waiting: list[tuple[int, str]] = []  # sitio ya con trabajos: tras los libres
+    level = None
+
+    def drain() -> None:
+        for qid, site in waiting:
+            if len(picks) < n and busy[site] < host_limit(site):
+                picks.append(qid)
+                busy[site] += 1
+        waiting.clear()
+
+    for qid, host, priority in cur:
+        if priority != level:
+            drain()
+            level = priority
+        if len(picks) >= n:
+            break
+        site = site_of(host) if polite else ""
+        if not site:
+            picks.append(qid)
+        elif busy[site] >= host_limit(site):
+            continue
+        elif busy[site] == 0:
+            picks.append(qid)
+            busy[site] = 1
+        else:
+            waiting.append((qid, site))
+    drain()
+    return picks
+
+
+def db_claim_due(
+    limit: int | None = None,
+    *,
+    now: datetime | None = None,
+    ignore_schedule: bool = False,
+    owner: str | None = None,
+    lease_sec: float | None = None,
+    slots: dict[str, int] | None = None,
+) -> list[tuple[int, str, str]]:
+    """
+    Pasa atómicamente hasta `limit` elementos 'queued' (vencidos, o todos si
+    ignore_schedule) a 'running' con lease (owner, expiración). Dos llamadas
+    concurrentes nunca devuelven la misma fila. Se devuelven en orden de despacho:
+    prioridad descendente y, a igualdad, por id.
+    slots: cupo libre por backend ({"aria2": 1, ...}); sustituye a `limit`, cada
+    backend se reclama por separado en la misma transacción y se respeta además el
+    cupo por sitio (tgdl.utils.hosts), dando preferencia a los sitios ociosos.
+    """
+    owner = owner or lease_owner()
+    expires = _now_ms() + int((lease_sec or settings.LEASE_SEC) * 1000)
+    now_ms = _sched_ms(now) if now else _now_ms()
+    # El backoff de reintentos se respeta siempre, también con ignore_schedule
+    where = "status='queued' AND (next_attempt_at IS NULL OR next_attempt_at<=?)"
+    params: list[Any] = [now_ms]
+    if not ignore_schedule:
+        where += " AND scheduled_ms<=?"
+        params.append(now_ms)
+    # ext_id=NULL: un GID de un intento anterior no marca este como entregado a aria2
+    update = (
+        "UPDATE queue SET status='running', lease_owner=?, lease_expires_at=?, "
+        "updated_at=?, ext_id=NULL WHERE id IN ({}) RETURNING id, kind, payload, priority"
+    )
+    head = [owner, expires, _iso_now()]
+    rows: list[tuple[Any, ...]] = []
+    with _tx() as conn:
+        if slots is None:
+            sub = f"SELECT id FROM queue WHERE {where} ORDER BY priority DESC, id ASC LIMIT ?"
+            lim = -1 if limit is None else int(limit)
+            rows = conn.execute(update.format(sub), [*head, *params, lim]).fetchall()
+        else:
+            busy = _busy_sites(conn)
+            for backend, n in slots.items():
+                ids = _pick_polite(conn, where, params, backend, int(n), busy) if n > 0 else []
+                if ids:
+                    marks = ",".join("?" * len(ids))
+                    rows += conn.execute(update.format(marks), [*head, *ids]).fetchall()
+    rows.sort(key=lambda r: (-r[3], r[0]))
+    return [(r[0], r[1], r[2]) for r in rows]
+
+
+def db_renew_leases(owner: str | None = None, lease_sec: float | None = None) -> int:
+    """Extiende los leases de todos los trabajos 'running' de este dueño."""
+    expires = _now_ms() + int((lease_sec or settings.LEASE_SEC) * 1000)
+    with _writer() as conn:
         cur = conn.execute(
-            "UPDATE queue SET status='queued', scheduled_at=?, updated_at=? WHERE status='paused'",
-            (now_iso, now_iso),
+            "UPDATE queue SET lease_expires_at=? WHERE status='running' AND lease_owner=?",
+            (expires, owner or lease_owner()),
         )
         return cur.rowcount
 
 
+def db_sweep_expired_leases() -> int:
+    """Devuelve a 'queued' los 'running' con lease vencido (o sin lease: restos previos)."""
+    with _writer() as conn:
+        cur = conn.execute(
+            "UPDATE queue SET status='queued', lease_owner=NULL, lease_expires_at=NULL, updated_at=? "
+            "WHERE status='running' AND (lease_expires_at IS NULL OR lease_expires_at<?)",
+            (_iso_now(), _now_ms()),
+        )
+        return cur.rowcount
+
+
+def db_release_stale_leases(owner: str | None = None) -> int:
+    """
+    Al arrancar: libera los 'running' de procesos anteriores de esta misma máquina
+    sin esperar a que venza su lease (el proceso que los tenía ya no existe).
+    """
+    owner = owner or lease_owner()
+    host = owner.rsplit(":", 1)[0]
+    with _writer() as conn:
+        cur = conn.execute(
+            "UPDATE queue SET status='queued', lease_owner=NULL, lease_expires_at=NULL, updated_at=? "
+            "WHERE status='running' AND substr(lease_owner,1,?)=? AND lease_owner<>?",
+            (_iso_now(), len(host) + 1, f"{host}:", owner),
+        )
+        return cur.rowcount
+
+
+def db_adopt_handoffs(owner: str | None = None) -> list[tuple[int, str, int | None]]:
+    """
+    Al arrancar, antes de db_release_stale_leases: los 'running' ya entregados a aria2
+    (con ext_id) por procesos anteriores de este host siguen descargando allí; se
+    adoptan (lease a este proceso) en vez de volver a encolarlos y duplicar la descarga.
+    Devuelve (qid, gid, notify_chat_id) para reanudar su seguimiento.
+    """
+    owner = owner or lease_owner()
+    host = owner.rsplit(":", 1)[0]
+    expires = _now_ms() + int(settings.LEASE_SEC * 1000)
+    with _writer() as conn:
+        rows = conn.execute(
+            "UPDATE queue SET lease_owner=?, lease_expires_at=? "
+            "WHERE status='running' AND ext_id IS NOT NULL "
+            "AND substr(lease_owner,1,?)=? AND lease_owner<>? "
+            "RETURNING id, ext_id, notify_chat_id",
+            (owner, expires, len(host) + 1, f"{host}:", owner),
+        ).fetchall()
+    return sorted((r[0], r[1], r[2]) for r in rows)
+
+
+# ---------- Cupos por backend ----------
+def _limit_flag(backend: str) -> str:
+    return f"LIMIT_{backend.upper()}"
+
+
+def db_backend_limits() -> dict[str, int]:
+    """
+    Trabajos simultáneos por backend: BACKEND_LIMITS de Settings, salvo ajuste en
+    caliente en kv LIMIT_<BACKEND> (bot o panel). 0 = backend en pausa.
+    """
+    limits: dict[str, int] = {}
+    for b in BACKENDS:
+        default = int(settings.BACKEND_LIMITS.get(b, 1))
+        raw = db_get_flag(_limit_flag(b)) or ""
+        limits[b] = max(0, int(raw)) if raw.strip().isdigit() else default
+    return limits
+
+
+def db_count_handed_off() -> int:
+    """Trabajos 'running' entregados a aria2 y vigilados hasta que terminen."""
+    with _reader() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM queue WHERE status='running' AND ext_id IS NOT NULL"
+        ).fetchone()[0]
+
+
+def db_set_backend_limit(backend: str, limit: int | None) -> None:
+    """Ajusta el cupo de un backend; None vuelve al valor de Settings."""
+    if backend not in BACKENDS:
+        raise ValueError(f"backend desconocido: {backend}")
+    db_set_flag(_limit_flag(backend), "" if limit is None else str(max(0, int(limit))))
+
+
+def db_aimd_last() -> dict[str, Any] | None:
+    """Última pasada del ajuste AIMD del bot: cupos, muestras y decisiones recientes."""
+    raw = db_get_flag("AIMD_LAST")
+    return json.loads(raw) if raw else None
+
+
+def db_running_by_backend() -> dict[str, int]:
+    """
+    Trabajos 'running' que ocupan cupo, por backend (de cualquier proceso). Los ya
+    entregados a aria2 (con ext_id) no cuentan: ver db_count_handed_off.
+    """
+    with _reader() as conn:
+        rows = conn.execute(
+            "SELECT backend, COUNT(*) FROM queue WHERE status='running' AND ext_id IS NULL "
+            "GROUP BY backend"
+        ).fetchall()
+    counts = dict.fromkeys(BACKENDS, 0)
+    counts.update(rows)
+    return counts
+
+
 # ---------- Progreso ----------
+_PROGRESS_UPSERT = (
+    "INSERT INTO progress(qid,total,downloaded,updated_at,speed,eta_sec) "
+    "SELECT ?,?,?,?,?,? WHERE EXISTS (SELECT 1 FROM queue WHERE id=?) "
+    "ON CONFLICT(qid) DO UPDATE SET total=excluded.total, downloaded=excluded.downloaded, "
+    "updated_at=excluded.updated_at, speed=excluded.speed, eta_sec=excluded.eta_sec"
+)
+
+
+def _write_progress_rows(rows: list[ProgressRow]) -> None:
+    # Una sola transacción por lote; ignora qids ya borrados de la cola
+    with _tx() as conn:
+        conn.executemany(_PROGRESS_UPSERT, [(*r, r[0]) for r in rows])
+
+
+PROGRESS = ProgressBuffer(
+    _write_progress_rows,
+    interval=settings.PROGRESS_FLUSH_SEC,
+    guard=_writer,
+    ewma_sec=settings.PROGRESS_EWMA_SEC,
+)
+atexit.register(PROGRESS.close)
+
+
 def db_update_progress(qid: int, total: int | None, downloaded: int) -> None:
-    with _connect() as conn:
-        conn.execute(
-            "INSERT INTO progress(qid,total,downloaded,updated_at) "
-            "VALUES (?,?,?,?) "
-            "ON CONFLICT(qid) DO UPDATE SET total=excluded.total, downloaded=excluded.downloaded, updated_at=excluded.updated_at",
-            (qid, total if (total or 0) > 0 else None, downloaded, _iso_now()),
-        )
+    """Registra progreso en memoria; se persiste por lotes (ver PROGRESS_FLUSH_SEC)."""
+    PROGRESS.update(qid, total if (total or 0) > 0 else None, downloaded)
+
+
+def db_progress_rate(qid: int) -> tuple[float | None, int | None]:
+    """(velocidad B/s, ETA s) en memoria de un trabajo de este proceso, sin tocar la DB."""
+    return PROGRESS.rate(qid)
+
+
+def db_flush_progress() -> int:
+    return PROGRESS.flush()
 
 
 def db_clear_progress(qid: int) -> None:
-    with _connect() as conn:
+    PROGRESS.discard(qid)
+    with _writer() as conn:
         conn.execute("DELETE FROM progress WHERE qid=?", (qid,))
 
 
+# ---------- Feed de cambios (queue/progress) ----------
+Change = tuple[int, str, str, int]  # (seq, tbl, op, qid)
+
+
+def db_changes_head() -> int:
+    """Último seq emitido (0 si aún no hubo cambios)."""
+    with _reader() as conn:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='changes'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def db_changes_since(
+    seq: int, limit: int = 1000, tbl: str | None = None
+) -> tuple[list[Change], int, bool]:
+    """
+    Cambios con seq > `seq` (el último por fila), en orden de seq.
+    Devuelve (cambios, seq hasta el que se leyó, reset). reset=True si el
+    consumidor se quedó atrás de la poda (o la DB es otra): debe releer todo.
+    Con len(cambios) == limit puede haber más; basta volver a llamar con el seq devuelto.
+    """
+    with _reader() as conn:
+        head_row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='changes'").fetchone()
+        head = int(head_row[0]) if head_row else 0
+        floor = conn.execute("SELECT v FROM kv WHERE k='CHANGES_FLOOR'").fetchone()
+        if seq > head or seq < int(floor[0] if floor else 0):
+            return [], head, True
+        sql = "SELECT seq, tbl, op, qid FROM changes WHERE seq > ?"
+        params: list[Any] = [seq]
+        if tbl:
+            sql += " AND tbl = ?"
+            params.append(tbl)
+        sql += " ORDER BY seq LIMIT ?"
+        params.append(int(limit))
+        rows = [tuple(r) for r in conn.execute(sql, params).fetchall()]
+    last = head
+    if len(rows) >= limit:
+        # Cortado por limit: el siguiente lote empieza tras el último leído
+        last = rows[-1][0]
+    elif rows:
+        last = max(last, rows[-1][0])
+    return rows, last, False
+
+
+def db_prune_changes(keep: int | None = None) -> int:
+    """
+    Conserva solo los `keep` cambios más recientes. Los consumidores con un seq
+    anterior al corte (CHANGES_FLOOR) reciben reset=True en db_changes_since.
+    """
+    n = settings.CHANGES_KEEP if keep is None else keep
+    with _tx() as conn:
+        row = conn.execute(
+            "SELECT seq FROM changes ORDER BY seq DESC LIMIT 1 OFFSET ?", (max(0, n),)
+        ).fetchone()
+        if row is None:
+            return 0
+        cur = conn.execute("DELETE FROM changes WHERE seq <= ?", (row[0],))
+        conn.execute(
+            "INSERT INTO kv(k,v) VALUES('CHANGES_FLOOR',?) "
+            "ON CONFLICT(k) DO UPDATE SET v=excluded.v",
+            (str(row[0]),),
+        )
+        return cur.rowcount
+
+
 # ---------- Eventos (opcional, para auditoría y panel) ----------
+_ROLLUP_UPSERT = (
+    "INSERT INTO events_rollup(bucket, period, type, kind, host, outcome, n, bytes, duration_ms) "
+    "VALUES (?,?,?,?,?,?,1,?,?) "
+    "ON CONFLICT(bucket, period, type, kind, host, outcome) DO UPDATE SET "
+    "n=n+1, bytes=bytes+excluded.bytes, duration_ms=duration_ms+excluded.duration_ms"
+)
+
+
+def _event_host(payload: dict[str, Any]) -> str:
+    host = payload.get("host")
+    if not host and payload.get("url"):
+        try:
+            host = urlparse(str(payload["url"])).hostname
+        except ValueError:
+            host = None
+    return (host or "").lower()
+
+
 def db_add_event(qid: int | None, etype: str, payload: dict[str, Any]) -> int:
-    with _connect() as conn:
+    """
+    Inserta un evento y acumula su rollup horario/diario en la misma transacción.
+    Dimensiones leídas del payload: kind, host (o url), outcome, bytes, duration_ms.
+    """
+    now = datetime.now().astimezone()
+    dims = (
+        etype,
+        str(payload.get("kind") or ""),
+        _event_host(payload),
+        str(payload.get("outcome") or ""),
+        int(payload.get("bytes") or 0),
+        int(payload.get("duration_ms") or 0),
+    )
+    with _tx() as conn:
         cur = conn.execute(
             "INSERT INTO events(qid, ts, type, payload) VALUES (?,?,?,?)",
-            (qid, _iso_now(), etype, json.dumps(payload, ensure_ascii=False)),
+            (qid, now.isoformat(), etype, json.dumps(payload, ensure_ascii=False)),
+        )
+        conn.executemany(
+            _ROLLUP_UPSERT,
+            [
+                ("h", now.strftime("%Y-%m-%dT%H"), *dims),
+                ("d", now.strftime("%Y-%m-%d"), *dims),
+            ],
         )
         return int(cur.lastrowid)
 
 
+def db_rollup(bucket: str = "d", period: str | None = None) -> dict[str, dict[str, int]]:
+    """Totales por outcome de un periodo ('d': hoy por defecto; 'h': hora actual)."""
+    if period is None:
+        now = datetime.now().astimezone()
+        period = now.strftime("%Y-%m-%d" if bucket == "d" else "%Y-%m-%dT%H")
+    with _reader() as conn:
+        rows = conn.execute(
+            "SELECT outcome, SUM(n), SUM(bytes), SUM(duration_ms) FROM events_rollup "
+            "WHERE bucket=? AND period=? AND type='job_end' GROUP BY outcome",
+            (bucket, period),
+        ).fetchall()
+    return {r[0]: {"n": r[1], "bytes": r[2], "duration_ms": r[3]} for r in rows}
+
+
+def db_job_outcomes(since_id: int | None = None) -> tuple[dict[str, dict[str, int]], int]:
+    """
+    Terminados, fallidos y estrangulados (429/flood) por backend desde el evento
+    `since_id` (exclusive), y el último id visto para la siguiente llamada.
+    Sin `since_id` solo devuelve ese id (punto de partida, sin recorrer el histórico).
+    """
+    out = {b: {"done": 0, "failed": 0, "throttled": 0} for b in BACKENDS}
+    with _reader() as conn:
+        if since_id is None:
+            return out, conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        rows = conn.execute(
+            "SELECT id, type, json_extract(payload, '$.kind'), json_extract(payload, '$.url'), "
+            "json_extract(payload, '$.outcome'), json_extract(payload, '$.error') "
+            "FROM events WHERE id>? AND type IN ('job_end', 'job_fail') ORDER BY id",
+            (since_id,),
+        ).fetchall()
+    for _, etype, kind, url, outcome, error in rows:
+        c = out[backend_for(kind or "", {"url": url})]
+        if etype == "job_fail":
+            c["failed"] += 1
+            c["throttled"] += is_throttle(error)
+        elif outcome == "done":
+            c["done"] += 1
+    return out, (rows[-1][0] if rows else since_id)
+
+
+def db_events_prune_floor(max_age_days: int | None = None, max_rows: int | None = None) -> int:
+    """
+    Menor id de events que sobrevive a la retención (edad y tope de filas).
+    Los ids crecen con ts, así que ambos criterios se reducen a un corte por id.
+    """
+    age = settings.EVENTS_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    cap = settings.EVENTS_MAX_ROWS if max_rows is None else max_rows
+    floor = 0
+    with _reader() as conn:
+        if age > 0:
+            cutoff = (datetime.now().astimezone() - timedelta(days=age)).isoformat()
+            row = conn.execute("SELECT MIN(id) FROM events WHERE ts >= ?", (cutoff,)).fetchone()
+            if row[0] is None:
+                # Todo es más antiguo que el corte
+                row = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM events").fetchone()
+            floor = max(floor, int(row[0]))
+        if cap > 0:
+            row = conn.execute(
+                "SELECT id FROM events ORDER BY id DESC LIMIT 1 OFFSET ?", (cap - 1,)
+            ).fetchone()
+            if row is not None:
+                floor = max(floor, int(row[0]))
+    return floor
+
+
+def db_prune_events_batch(floor_id: int, batch: int | None = None) -> int:
+    """Borra hasta `batch` eventos con id < floor_id en una transacción corta."""
+    n = batch or settings.EVENTS_PRUNE_BATCH
+    with _tx() as conn:
+        cur = conn.execute(
+            "DELETE FROM events WHERE id IN (SELECT id FROM events WHERE id < ? ORDER BY id LIMIT ?)",
+            (floor_id, n),
+        )
+        return cur.rowcount
+
+
+def db_prune_rollups(hourly_days: int | None = None) -> int:
+    """Los rollups horarios caducan; los diarios se conservan."""
+    days = settings.ROLLUP_HOURLY_DAYS if hourly_days is None else hourly_days
+    cutoff = (datetime.now().astimezone() - timedelta(days=days)).strftime("%Y-%m-%dT%H")
+    with _tx() as conn:
+        cur = conn.execute("DELETE FROM events_rollup WHERE bucket='h' AND period < ?", (cutoff,))
+        return cur.rowcount
+
+
+def db_prune_events(
+    max_age_days: int | None = None, max_rows: int | None = None, batch: int | None = None
+) -> int:
+    """Retención completa de events por lotes (cada lote es su propia transacción)."""
+    floor = db_events_prune_floor(max_age_days, max_rows)
+    n = batch or settings.EVENTS_PRUNE_BATCH
+    total = 0
+    while True:
+        deleted = db_prune_events_batch(floor, n)
+        total += deleted
+        if deleted < n:
+            break
+    db_prune_rollups()
+    db_prune_changes()
+    return total
+
+
+# ---------- Mantenimiento (checkpoint, optimize, vacuum incremental) ----------
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def db_maintenance(
+    *,
+    truncate: bool = False,
+    vacuum: bool = False,
+    vacuum_pages: int | None = None,
+    convert: bool = False,
+) -> dict[str, Any]:
+    """
+    Mantenimiento de la DB fuera de transacción (toma el lock del escritor):
+    - checkpoint del WAL: PASSIVE (no bloquea) o TRUNCATE (deja el -wal a 0 bytes);
+    - PRAGMA optimize (ANALYZE solo de lo que lo necesite);
+    - vacuum=True: incremental_vacuum de hasta `vacuum_pages` páginas libres (0 = todas),
+      solo si la DB ya tiene auto_vacuum=INCREMENTAL.
+    - convert=True: una DB creada sin auto_vacuum=INCREMENTAL se convierte con un VACUUM
+      completo (reescribe todo el fichero; pensado para `tgdl.cli db-vacuum` con el bot
+      parado, nunca para la pasada programada).
+    Devuelve métricas (duración y bytes recuperados), que también quedan en el
+    evento 'db_maintenance' (rollups) y en kv MAINT_LAST.
+    """
+    db_file = Path(settings.DB_PATH)
+    wal_file = db_file.with_name(db_file.name + "-wal")
+    pages = settings.DB_VACUUM_PAGES if vacuum_pages is None else vacuum_pages
+    PROGRESS.flush()
+    t0 = time.perf_counter()
+    before = _file_size(db_file) + _file_size(wal_file)
+    freed = 0
+    converted = False
+    with _writer() as conn:
+        mode = "TRUNCATE" if truncate else "PASSIVE"
+        busy, wal_pages, ckpt_pages = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        conn.execute("PRAGMA optimize")
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        if vacuum or convert:
+            free0 = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if convert and not incremental:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+                converted = incremental = True
+            elif vacuum and incremental and free0:
+                # executescript avanza el pragma hasta el final (execute libera una sola página)
+                conn.executescript(f"PRAGMA incremental_vacuum({max(0, int(pages))});")
+            freed = free0 - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if freed or converted:
+                # Lo movido por el vacuum está en el WAL: se lleva al fichero principal
+                conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    after = _file_size(db_file) + _file_size(wal_file)
+    metrics = {
+        "mode": mode.lower(),
+        "busy": bool(busy),
+        "wal_pages": wal_pages,
+        "checkpointed_pages": ckpt_pages,
+        "pages_freed": freed,
+        "converted": converted,
+        "incremental": incremental,
+        "bytes": max(0, before - after),
+        "db_bytes": _file_size(db_file),
+        "wal_bytes": _file_size(wal_file),
+        "duration_ms": int((time.perf_counter() - t0) * 1000),
+    }
+    db_add_event(None, "db_maintenance", metrics)
+    db_set_flag("MAINT_LAST", json.dumps({"at": _iso_now(), **metrics}))
+    return metrics
+
+
+def db_maintenance_last() -> dict[str, Any] | None:
+    """Métricas de la última pasada de db_maintenance (de cualquier proceso)."""
+    raw = db_get_flag("MAINT_LAST")
+    return json.loads(raw) if raw else None
+
+
 # ---------- Migraciones y utilidades varias ----------
 def db_migrate_add_ext_id() -> None:
-    """Asegura que queue tenga columna ext_id (para GID de aria2 u otros ids externos)."""
-    with _connect() as conn:
-        cur = conn.execute("PRAGMA table_info(queue)")
-        cols = [r[1] for r in cur.fetchall()]
-        if "ext_id" not in cols:
-            conn.execute("ALTER TABLE queue ADD COLUMN ext_id TEXT")
+    """Compat: aplica las migraciones de columnas (incluye ext_id para GID de aria2)."""
+    with _writer() as conn:
+        _migrate(conn)
 
 
 def db_set_ext_id(qid: int, ext_id: str | None) -> None:
-    with _connect() as conn:
+    with _writer() as conn:
         conn.execute(
             "UPDATE queue SET ext_id=?, updated_at=? WHERE id=?", (ext_id, _iso_now(), qid)
         )
 
 
-def db_get_queue(limit: int = 200):
-    with _connect() as conn:
+def db_get_ext_id_kind(qid: int) -> tuple[str | None, str] | None:
+    """(ext_id, kind) de un elemento de la cola o None si no existe."""
+    with _reader() as conn:
+        row = conn.execute("SELECT ext_id, kind FROM queue WHERE id=?", (qid,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+
+def db_delete_item(qid: int) -> int:
+    with _tx() as conn:
+        cur = conn.execute("DELETE FROM queue WHERE id=?", (qid,))
+        n = cur.rowcount
+        cur = conn.execute("DELETE FROM queue_history WHERE id=?", (qid,))
+        return n + cur.rowcount
+
+
+def db_pull_forward_queued(when: datetime) -> int:
+    """Adelanta a `when` los elementos 'queued' programados para más tarde (modo 24/7)."""
+    when_ms = _sched_ms(when)
+    with _writer() as conn:
         cur = conn.execute(
-            "SELECT id, kind, payload, status, scheduled_at, ext_id FROM queue ORDER BY id DESC LIMIT ?",
-            (int(limit),),
+            "UPDATE queue SET scheduled_at=?, scheduled_ms=? "
+            "WHERE status='queued' AND scheduled_ms>?",
+            (when.astimezone().isoformat(), when_ms, when_ms),
         )
-        return list(cur.fetchall())
+        return cur.rowcount
+
+
+def db_get_queue(limit: int = 200):
+    rows, _ = db_list_page(limit)
+    return [
+        (r["id"], r["kind"], r["payload"], r["status"], r["scheduled_at"], r["ext_id"])
+        for r in rows
+    ]
 
 
 def db_get_progress_rows(limit: int = 100):
-    with _connect() as conn:
-        cur = conn.execute(
-            "SELECT qid,total,downloaded,updated_at FROM progress ORDER BY updated_at DESC LIMIT ?",
-            (int(limit),),
-        )
-        return [
-            {"qid": r[0], "total": r[1], "downloaded": r[2], "updated_at": r[3]}
-            for r in cur.fetchall()
-        ]
+    rows, _ = db_get_progress_page(limit)
+    return rows
+
+
+# ---------- Paginación (keyset) y conteos ----------
+_QUEUE_ROW_COLS = (
+    "id, kind, payload, status, scheduled_at, ext_id, url, suggested_name, notify_chat_id, host, "
+    "attempts, next_attempt_at, last_error, priority"
+)
+
+
+def _queue_row(r: Sequence[Any]) -> dict[str, Any]:
+    return {
+        "id": r[0],
+        "kind": r[1],
+        "payload": r[2],
+        "status": r[3],
+        "scheduled_at": r[4],
+        "ext_id": r[5],
+        "url": r[6],
+        "suggested_name": r[7],
+        "notify_chat_id": r[8],
+        "host": r[9],
+        "attempts": r[10],
+        "next_attempt_at": r[11],
+        "last_error": r[12],
+        "priority": r[13],
+    }
+
+
+def db_list_page(
+    limit: int = 50,
+    before_id: int | None = None,
+    status: str | None = None,
+    host: str | None = None,
+    chat_id: int | None = None,
+) -> tuple[list[dict[str, Any]], int | None]:
+    """
+    Página de la cola (más recientes primero) por keyset sobre id, sin OFFSET.
+    Devuelve (filas, cursor); el cursor se pasa como before_id para la página
+    siguiente y es None cuando no hay más. Cada fila trae url, suggested_name,
+    notify_chat_id y host (columnas generadas): no hace falta parsear payload.
+    """
+    where: list[str] = []
+    params: list[Any] = []
+    if before_id is not None:
+        where.append("id<?")
+        params.append(int(before_id))
+    if status:
+        where.append("status=?")
+        params.append(status)
+    if host:
+        where.append("host=?")
+        params.append(host.lower())
+    if chat_id is not None:
+        where.append("notify_chat_id=?")
+        params.append(int(chat_id))
+    sql = f"SELECT {_QUEUE_ROW_COLS} FROM queue"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(int(limit) + 1)
+    with _reader() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    more = len(rows) > limit
+    items = [_queue_row(r) for r in rows[:limit]]
+    return items, (items[-1]["id"] if more and items else None)
+
+
+def db_get_queue_rows(ids: list[int]) -> list[dict[str, Any]]:
+    """Filas de la cola por id (mismo formato que db_list_page); las ausentes se omiten."""
+    out: list[dict[str, Any]] = []
+    with _reader() as conn:
+        for i in range(0, len(ids), 500):
+            chunk = [int(x) for x in ids[i : i + 500]]
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT {_QUEUE_ROW_COLS} FROM queue WHERE id IN ({marks})", chunk
+            ).fetchall()
+            out.extend(_queue_row(r) for r in rows)
+    return out
+
+
+def db_history_page(
+    limit: int = 50,
+    before_id: int | None = None,
+    status: str | None = None,
+    host: str | None = None,
+    search: str | None = None,
+) -> tuple[list[dict[str, Any]], int | None]:
+    """Historial de terminados (más recientes primero), keyset sobre id como db_list_page."""
+    where: list[str] = []
+    params: list[Any] = []
+    if before_id is not None:
+        where.append("id<?")
+        params.append(int(before_id))
+    if status:
+        where.append("status=?")
+        params.append(status)
+    if host:
+        where.append("host=?")
+        params.append(host.lower())
+    if search:
+        where.append("(url LIKE ? OR final_path LIKE ?)")
+        params += [f"%{search}%"] * 2
+    sql = (
+        "SELECT id, kind, status, url, host, final_path, size_bytes, duration_ms, avg_speed, "
+        "created_at, finished_at FROM queue_history"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(int(limit) + 1)
+    cols = (
+        "id",
+        "kind",
+        "status",
+        "url",
+        "host",
+        "final_path",
+        "size_bytes",
+        "duration_ms",
+        "avg_speed",
+        "created_at",
+        "finished_at",
+    )
+    with _reader() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    more = len(rows) > limit
+    items = [dict(zip(cols, r, strict=True)) for r in rows[:limit]]
+    return items, (items[-1]["id"] if more and items else None)
+
+
+_PROGRESS_ROW_COLS = "qid, total, downloaded, updated_at, speed, eta_sec"
+
+
+def _progress_row(r: Sequence[Any]) -> dict[str, Any]:
+    return {
+        "qid": r[0],
+        "total": r[1],
+        "downloaded": r[2],
+        "updated_at": r[3],
+        "speed": r[4],
+        "eta_sec": r[5],
+    }
+
+
+def db_get_progress_page(
+    limit: int = 100, cursor: str | None = None
+) -> tuple[list[dict[str, Any]], str | None]:
+    """
+    Progreso por updated_at DESC con keyset (updated_at, qid).
+    El cursor es opaco ("updated_at|qid"); None = no hay más.
+    """
+    params: list[Any] = []
+    sql = f"SELECT {_PROGRESS_ROW_COLS} FROM progress"
+    if cursor:
+        ts, _, qid = cursor.rpartition("|")
+        sql += " WHERE (updated_at, qid) < (?, ?)"
+        params += [ts, int(qid)]
+    sql += " ORDER BY updated_at DESC, qid DESC LIMIT ?"
+    params.append(int(limit) + 1)
+    with _reader() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    more = len(rows) > limit
+    items = [_progress_row(r) for r in rows[:limit]]
+    nxt = f"{items[-1]['updated_at']}|{items[-1]['qid']}" if more and items else None
+    return items, nxt
+
+
+def db_get_progress_for(qids: list[int]) -> list[dict[str, Any]]:
+    """Progreso de los qids dados (mismo formato que db_get_progress_page)."""
+    out: list[dict[str, Any]] = []
+    with _reader() as conn:
+        for i in range(0, len(qids), 500):
+            chunk = [int(x) for x in qids[i : i + 500]]
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT {_PROGRESS_ROW_COLS} FROM progress WHERE qid IN ({marks})",
+                chunk,
+            ).fetchall()
+            out.extend(_progress_row(r) for r in rows)
+    return out
+
+
+def db_count_by_status(include_history: bool = True) -> dict[str, int]:
+    """Conteo por estado (solo índices por status, sin tocar payloads)."""
+    counts: dict[str, int] = {}
+    with _reader() as conn:
+        tables = ("queue", "queue_history") if include_history else ("queue",)
+        for table in tables:
+            for st, n in conn.execute(f"SELECT status, COUNT(*) FROM {table} GROUP BY status"):
+                counts[st] = counts.get(st, 0) + n
+    return counts
+
+
+def db_count_pending() -> int:
+    """Elementos aún por terminar (queued/running/paused): solo la tabla caliente."""
+    counts = db_count_by_status(include_history=False)
+    return sum(counts.get(st, 0) for st in ("queued", "running", "paused"))
 
 
 def db_clear_all() -> None:
-    with _connect() as conn:
+    """Vacía la cola por completo: vivos, progreso e histórico de terminados."""
+    PROGRESS.discard()
+    with _tx() as conn:
         conn.execute("DELETE FROM progress")
         conn.execute("DELETE FROM queue")
+        conn.execute("DELETE FROM queue_history")
         # opcional: limpiar flags, descomentando si lo deseas
         # conn.execute("DELETE FROM kv WHERE k IN ('PAUSED')")
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections.abc import Callable
+from contextlib import AbstractContextManager, nullcontext
+from datetime import datetime
+
+from tgdl.core.logging import logger
+
+# (qid, total, downloaded, updated_at_iso, speed_bps, eta_sec)
+ProgressRow = tuple[int, int | None, int, str, float | None, int | None]
+
+# Muestras más juntas que esto no actualizan la velocidad (ruido de callbacks por chunk)
+_MIN_SAMPLE_SEC = 0.5
+
+
+class ProgressBuffer:
+    """
+    Acumulador write-behind de progreso.
+    - Guarda solo el último valor por qid (los callbacks por chunk pisan el anterior).
+    - Un hilo daemon vuelca todas las filas sucias en UNA transacción cada `interval` s.
+    - interval <= 0 desactiva el buffer (escritura inmediata, como antes).
+    - `guard` (opcional) envuelve cada volcado; db.py pasa el lock del escritor para
+      que el orden de locks sea siempre escritor -> buffer (evita interbloqueos con
+      quien llama a flush() dentro de una transacción).
+    - Velocidad por qid como EWMA de muestras consecutivas (constante de tiempo
+      `ewma_sec`, ponderada por el tiempo transcurrido) y ETA = restante / velocidad.
+      Viven en memoria (`rate`) y se persisten con cada volcado.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[list[ProgressRow]], None],
+        interval: float = 1.0,
+        guard: Callable[[], AbstractContextManager] | None = None,
+        ewma_sec: float = 10.0,
+    ):
+        self._flush_fn = flush_fn
+        self._guard = guard or nullcontext
+        self.interval = float(interval)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: dict[int, ProgressRow] = {}
+        self.ewma_sec = max(0.001, float(ewma_sec))
+        # qid -> (t_monotónico, downloaded, velocidad EWMA) de la última muestra válida
+        self._rates: dict[int, tuple[float, int, float | None]] = {}
+        self._last: dict[int, ProgressRow] = {}  # último update por qid (ya volcado o no)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def update(
+        self, qid: int, total: int | None, downloaded: int, *, now: float | None = None
+    ) -> None:
+        qid, downloaded = int(qid), int(downloaded)
+        t = time.monotonic() if now is None else now
+        with self._lock:
+            speed = self._sample(qid, downloaded, t)
+            eta = None
+            if speed and total and total > downloaded:
+                eta = int((total - downloaded) / speed)
+            elif total and downloaded >= total:
+                eta = 0
+            row = (qid, total, downloaded, datetime.now().astimezone().isoformat(), speed, eta)
+            self._pending[qid] = row
+            self._last[qid] = row
+        if self.interval <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def _sample(self, qid: int, downloaded: int, t: float) -> float | None:
+        # Llamar con self._lock tomado
+        prev = self._rates.get(qid)
+        if prev is None or downloaded < prev[1]:
+            # Primera muestra o reinicio de la descarga: sin velocidad todavía
+            self._rates[qid] = (t, downloaded, None)
+            return None
+        t0, d0, ewma = prev
+        dt = t - t0
+        if dt < _MIN_SAMPLE_SEC:
+            return ewma
+        inst = (downloaded - d0) / dt
+        if ewma is None:
+            ewma = inst
+        else:
+            alpha = 1.0 - math.exp(-dt / self.ewma_sec)
+            ewma += alpha * (inst - ewma)
+        self._rates[qid] = (t, downloaded, ewma)
+        return ewma
+
+    def rate(self, qid: int) -> tuple[float | None, int | None]:
+        """(velocidad en B/s, ETA en s) del último update de qid; (None, None) si no hay."""
+        with self._lock:
+            row = self._last.get(int(qid))
+        return (row[4], row[5]) if row else (None, None)
+
+    def discard(self, qid: int | None = None) -> None:
+        """Olvida lo pendiente de un qid (o de todos si qid es None)."""
+        with self._lock:
+            if qid is None:
+                self._pending.clear()
+                self._rates.clear()
+                self._last.clear()
+            else:
+                self._pending.pop(int(qid), None)
+                self._rates.pop(int(qid), None)
+                self._last.pop(int(qid), None)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """Vuelca lo pendiente ahora. Devuelve cuántas filas se escribieron."""
+        if not self._pending:
+            return 0
+        with self._guard(), self._flush_lock:
+            with self._lock:
+                rows = list(self._pending.values())
+                self._pending.clear()
+            if not rows:
+                return 0
+            try:
+                self._flush_fn(rows)
+            except Exception as e:
+                logger.warning("progress flush failed rows=%d err=%r", len(rows), e)
+                # Re-encolar sin pisar valores más nuevos llegados durante el fallo
+                with self._lock:
+                    for r in rows:
+                        self._pending.setdefault(r[0], r)
+                return 0
+            return len(rows)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name="tgdl-progress-flush", daemon=True
+            )
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Detiene el hilo y vuelca lo que quede (apagado del proceso)."""
+        self._stop.set()
+        th = self._thread
+        if th is not None and th.is_alive() and th is not threading.current_thread():
+            th.join(timeout=max(1.0, self.interval * 2))
+        self._thread = None
+        self.flush()
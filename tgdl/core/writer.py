@@ -0,0 +1,198 @@
+"""
+Escritor único de la DB (vive en el proceso del bot).
+
+WAL solo admite un escritor: si bot, panel y servidor de control escriben cada uno
+por su lado, las ráfagas se bloquean entre sí (SQLITE_BUSY / esperas de hasta 30 s).
+Aquí todas las mutaciones pasan por un hilo que:
+- agrupa lo encolado (hasta DB_WRITE_BATCH) en UNA transacción BEGIN IMMEDIATE;
+- aísla cada mutación en un SAVEPOINT, así un fallo no tumba al resto del lote.
+
+Otros procesos (panel) envían sus mutaciones por HTTP local a `/db/{op}` del
+servidor de control con `remote_write`; si el bot no está arrancado, se aplican
+localmente como antes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any
+
+import httpx
+
+from tgdl.config.settings import settings
+from tgdl.core import db
+from tgdl.core.logging import logger
+
+_Job = tuple[Future, Callable[..., Any], tuple, dict]
+
+
+class WriterService:
+    def __init__(self, max_batch: int = 64):
+        self.max_batch = max(1, max_batch)
+        self._q: queue.SimpleQueue[_Job | None] = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        fut: Future = Future()
+        self._q.put((fut, fn, args, kwargs))
+        self._ensure_thread()
+        return fut
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Versión bloqueante de submit (hilos sync, p. ej. el servidor de control)."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="tgdl-db-writer", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            job = self._q.get()
+            if job is None:
+                return
+            batch = [job]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    nxt = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _run_batch(self, batch: list[_Job]) -> None:
+        done: list[tuple[Future, Any, BaseException | None]] = []
+        try:
+            with db._tx():
+                for fut, fn, args, kwargs in batch:
+                    if not fut.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with db._tx():
+                            done.append((fut, fn(*args, **kwargs), None))
+                    except Exception as e:
+                        done.append((fut, None, e))
+        except Exception as e:
+            # Falló el BEGIN/COMMIT: nada del lote quedó escrito
+            logger.warning("db writer batch failed n=%d err=%r", len(batch), e)
+            for fut, _, _, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for fut, res, err in done:
+            if err is None:
+                fut.set_result(res)
+            else:
+                fut.set_exception(err)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Aplica lo pendiente y detiene el hilo."""
+        th = self._thread
+        if th is None or not th.is_alive():
+            return
+        self._q.put(None)
+        if th is not threading.current_thread():
+            th.join(timeout=timeout)
+        self._thread = None
+
+
+WRITER = WriterService(max_batch=settings.DB_WRITE_BATCH)
+
+
+# ---------- Mutaciones remotas (panel -> bot) ----------
+def _op_db_add(
+    kind: str, payload: dict[str, Any], scheduled_at: str, force: bool = False, priority: int = 0
+) -> int:
+    return db.db_add(
+        kind, payload, datetime.fromisoformat(scheduled_at), force=force, priority=priority
+    )
+
+
+def _op_db_enqueue(
+    kind: str, payload: dict[str, Any], scheduled_at: str, force: bool = False, priority: int = 0
+) -> tuple[int, bool]:
+    return db.db_enqueue(
+        kind, payload, datetime.fromisoformat(scheduled_at), force=force, priority=priority
+    )
+
+
+def _op_db_add_many(
+    items: list[list[Any]], force: bool = False, priority: int = 0
+) -> list[tuple[int, bool]]:
+    # items: [[kind, payload, scheduled_at_iso], ...]
+    return db.db_add_many(
+        [(kind, payload, datetime.fromisoformat(sched)) for kind, payload, sched in items],
+        force=force,
+        priority=priority,
+    )
+
+
+# Lista blanca: solo estas operaciones se aceptan por /db/{op}
+WRITE_OPS: dict[str, Callable[..., Any]] = {
+    "db_add": _op_db_add,
+    "db_enqueue": _op_db_enqueue,
+    "db_add_many": _op_db_add_many,
+    "db_bump": db.db_bump,
+    "db_clear_all": db.db_clear_all,
+    "db_clear_progress": db.db_clear_progress,
+    "db_delete_item": db.db_delete_item,
+    "db_purge_finished": db.db_purge_finished,
+    "db_retry_errors": db.db_retry_errors,
+    "db_set_backend_limit": db.db_set_backend_limit,
+    "db_set_flag": db.db_set_flag,
+    "db_set_priority": db.db_set_priority,
+}
+
+
+def apply_op(op: str, args: list | None = None, kwargs: dict | None = None) -> Any:
+    """Ejecuta una operación de la lista blanca en el writer (lado del bot)."""
+    fn = WRITE_OPS.get(op)
+    if fn is None:
+        raise KeyError(op)
+    return WRITER.call(fn, *(args or []), **(kwargs or {}))
+
+
+def _encode(v: Any) -> Any:
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+async def remote_write(op: str, *args, base_url: str | None = None, **kwargs) -> Any:
+    """
+    Envía una mutación al writer del bot. Si el bot no responde (no arrancado),
+    la aplica localmente en un hilo. Un error de la propia operación se propaga.
+    """
+    body = {
+        "args": [_encode(a) for a in args],
+        "kwargs": {k: _encode(v) for k, v in kwargs.items()},
+    }
+    try:
+        async with httpx.AsyncClient(timeout=30.0) as cli:
+            r = await cli.post(
+                f"{base_url or settings.CONTROL_URL}/db/{op}",
+                json=body,
+                headers={"x-panel-token": settings.PANEL_TOKEN or ""},
+            )
+    except httpx.TransportError as e:
+        logger.warning("remote writer unavailable (%r); writing locally", e)
+        return await asyncio.to_thread(WRITE_OPS[op], *body["args"], **body["kwargs"])
+    data = r.json()
+    if not data.get("ok"):
+        raise RuntimeError(f"db op {op} failed: {data.get('error')}")
+    return data.get("result")
@@ -12,17 +12,26 @@ from fastapi.responses import HTMLResponse, JSONResponse
 
 from tgdl.config.settings import settings
 from tgdl.core.db import (
-    _connect,
-    db_add,
-    db_clear_all,
-    db_clear_progress,
+    db_aimd_last,
+    db_backend_limits,
+    db_changes_head,
+    db_changes_since,
+    db_count_by_status,
+    db_count_handed_off,
     db_get_flag,
+    db_get_progress_for,
+    db_get_progress_page,
     db_get_progress_rows,
-    db_get_queue,
+    db_get_queue_rows,
+    db_history_page,
+    db_list_page,
+    db_maintenance_last,
     db_migrate_add_ext_id,
-    db_purge_finished,
-    db_retry_errors,
+    db_rollup,
+    db_running_by_backend,
 )
+from tgdl.core.writer import remote_write
+from tgdl.utils.backends import BACKENDS
 
 app = FastAPI(title="TG Super Downloader Panel", version="0.2.0")
 
@@ -32,7 +41,7 @@ def auth(x_panel_token: Annotated[str | None, Header()] = None):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
-CONTROL_URL = "http://127.0.0.1:8765"
+CONTROL_URL = settings.CONTROL_URL
 
 
 @app.on_event("startup")
@@ -52,29 +61,106 @@ async def health():
 @app.get("/status")
 async def status(_: Annotated[None, Depends(auth)] = None):
     paused = db_get_flag("PAUSED", "0") == "1"
-    return {"paused": paused}
+    return {
+        "paused": paused,
+        "today": db_rollup("d"),
+        "limits": _limits(),
+        "aria2_handed_off": db_count_handed_off(),
+        "maintenance": db_maintenance_last(),
+    }
+
+
+def _limits() -> dict[str, dict[str, int]]:
+    running = db_running_by_backend()
+    return {b: {"limit": n, "running": running.get(b, 0)} for b, n in db_backend_limits().items()}
+
+
+@app.get("/limits")
+async def limits(_: Annotated[None, Depends(auth)] = None):
+    """Cupo de trabajos simultáneos y trabajos en curso por backend."""
+    return _limits()
+
+
+@app.get("/aimd")
+async def aimd(_: Annotated[None, Depends(auth)] = None):
+    """Ajuste automático de cupos: última muestra por backend y decisiones recientes."""
+    return {"enabled": settings.AIMD_ENABLED, "last": db_aimd_last()}
+
+
+@app.post("/limits/{backend}")
+async def set_limit(
+    backend: str, value: int | None = None, _: Annotated[None, Depends(auth)] = None
+):
+    """Ajusta en caliente el cupo de un backend; sin `value` vuelve al de Settings."""
+    if backend not in BACKENDS:
+        raise HTTPException(status_code=404, detail=f"Backend desconocido: {backend}")
+    if value is not None and value < 0:
+        raise HTTPException(status_code=400, detail="value debe ser >= 0")
+    await remote_write("db_set_backend_limit", backend, value)
+    return {"ok": True, "backend": backend, **_limits()[backend]}
+
+
+@app.get("/stats")
+async def stats(
+    bucket: str = "d",
+    period: str | None = None,
+    _: Annotated[None, Depends(auth)] = None,
+):
+    """Agregados de events_rollup: bucket 'd' (YYYY-MM-DD) u 'h' (YYYY-MM-DDTHH)."""
+    if bucket not in ("d", "h"):
+        raise HTTPException(status_code=400, detail="bucket debe ser 'd' u 'h'")
+    return {"bucket": bucket, "period": period, "outcomes": db_rollup(bucket, period)}
 
 
 @app.get("/queue")
-async def queue(_: Annotated[None, Depends(auth)] = None):
-    rows = []
-    for pid, kind, payload, status, sched, ext_id in db_get_queue():
-        rows.append(
-            {
-                "id": pid,
-                "kind": kind,
-                "payload": payload,
-                "status": status,
-                "scheduled_at": sched,
-                "ext_id": ext_id,
-            }
-        )
-    return {"rows": rows}
+async def queue(
+    limit: int = 200,
+    before: int | None = None,
+    status: str | None = None,
+    host: str | None = None,
+    chat: int | None = None,
+    _: Annotated[None, Depends(auth)] = None,
+):
+    """Cola paginada por keyset: pasar `next` como `before` para la página siguiente."""
+    rows, nxt = db_list_page(
+        limit=max(1, min(limit, 1000)),
+        before_id=before,
+        status=status,
+        host=host,
+        chat_id=chat,
+    )
+    return {"rows": rows, "next": nxt}
+
+
+@app.get("/history")
+async def history(
+    limit: int = 100,
+    before: int | None = None,
+    status: str | None = None,
+    host: str | None = None,
+    q: str | None = None,
+    _: Annotated[None, Depends(auth)] = None,
+):
+    """Trabajos terminados (queue_history), paginados igual que /queue; q busca en url/ruta."""
+    rows, nxt = db_history_page(
+        limit=max(1, min(limit, 1000)), before_id=before, status=status, host=host, search=q
+    )
+    return {"rows": rows, "next": nxt}
+
+
+@app.get("/queue/counts")
+async def queue_counts(_: Annotated[None, Depends(auth)] = None):
+    return {"counts": db_count_by_status()}
 
 
 @app.get("/progress")
-async def progress(_: Annotated[None, Depends(auth)] = None):
-    return {"rows": db_get_progress_rows()}
+async def progress(
+    limit: int = 100,
+    cursor: str | None = None,
+    _: Annotated[None, Depends(auth)] = None,
+):
+    rows, nxt = db_get_progress_page(limit=max(1, min(limit, 1000)), cursor=cursor)
+    return {"rows": rows, "next": nxt}
 
 
 @app.post("/pause")
@@ -100,13 +186,13 @@ async def run(_: Annotated[None, Depends(auth)] = None):
 
 @app.post("/retry")
 async def retry(_: Annotated[None, Depends(auth)] = None):
-    db_retry_errors()
+    await remote_write("db_retry_errors")
     return {"ok": True}
 
 
 @app.post("/purge")
 async def purge(_: Annotated[None, Depends(auth)] = None):
-    n = db_purge_finished()
+    n = await remote_write("db_purge_finished")
     return {"ok": True, "deleted": n}
 
 
@@ -118,7 +204,7 @@ async def clear(_: Annotated[None, Depends(auth)] = None):
             await cli.post(f"{CONTROL_URL}/pause")
     except Exception:
         pass
-    db_clear_all()
+    await remote_write("db_clear_all")
     return {"ok": True, "cleared": True}
 
 
@@ -158,28 +244,69 @@ def _next_schedule_datetime():
 @app.post("/enqueue")
 async def enqueue(data: dict, _: Annotated[None, Depends(auth)] = None):
     """
-    Encola enlaces desde el panel. Body: {"text": "url1\nurl2 ..."}
+    Encola enlaces desde el panel.
+    Body: {"text": "url1\nurl2 ...", "force": false, "priority": 0}
     Detecta t.me -> tg_link, otros -> url. Programa a la próxima hora.
+    Los duplicados (misma clave canónica) no se encolan salvo force=true.
+    Mayor prioridad se despacha antes.
     """
     text = (data or {}).get("text", "") or ""
+    force = bool((data or {}).get("force"))
+    try:
+        priority = int((data or {}).get("priority") or 0)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Prioridad inválida")
     if not text.strip():
         raise HTTPException(status_code=400, detail="Texto vacío")
 
     sched = _next_schedule_datetime()
     n_added = 0
+    existing: list[int] = []
 
     # 1) Links Telegram (t.me)
-    for u in _extract_tg_links(text):
-        db_add("tg_link", {"url": u}, sched)
-        n_added += 1
-
+    items = [("tg_link", {"url": u}) for u in _extract_tg_links(text)]
     # 2) URLs/magnets (excluye t.me)
-    urls = [u for u in _extract_urls(text) if not u.lower().startswith("https://t.me/")]
-    for u in urls:
-        db_add("url", {"url": u}, sched)
-        n_added += 1
+    items += [
+        ("url", {"url": u})
+        for u in _extract_urls(text)
+        if not u.lower().startswith("https://t.me/")
+    ]
+    # Un solo lote (una transacción) para todo lo pegado
+    sched_iso = sched.isoformat()
+    results = await remote_write(
+        "db_add_many",
+        [[kind, payload, sched_iso] for kind, payload in items],
+        force=force,
+        priority=priority,
+    )
+    for qid, created in results:
+        if created:
+            n_added += 1
+        else:
+            existing.append(qid)
+
+    return {
+        "ok": True,
+        "added": n_added,
+        "existing": existing,
+        "scheduled_at": sched.isoformat(),
+    }
+
 
-    return {"ok": True, "added": n_added, "scheduled_at": sched.isoformat()}
+@app.post("/priority/{qid}")
+async def set_priority(
+    qid: int, value: int | None = None, _: Annotated[None, Depends(auth)] = None
+):
+    """Cambia la prioridad de un trabajo vivo; sin `value` lo adelanta a todo (bump)."""
+    if value is None:
+        prio = await remote_write("db_bump", [qid])
+        ok = prio is not None
+    else:
+        ok = await remote_write("db_set_priority", qid, value)
+        prio = value
+    if not ok:
+        raise HTTPException(status_code=404, detail="No está en la cola")
+    return {"ok": True, "id": qid, "priority": prio}
 
 
 @app.post("/delete/{qid}")
@@ -199,69 +326,122 @@ async def delete_item(qid: int, _: Annotated[None, Depends(auth)] = None):
 
     # 2) limpiar progreso + 3) borrar fila
     try:
-        db_clear_progress(qid)
+        await remote_write("db_clear_progress", qid)
     except Exception:
         pass
     try:
-        with _connect() as conn:
-            conn.execute("DELETE FROM queue WHERE id=?", (qid,))
-            conn.commit()
+        await remote_write("db_delete_item", qid)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB delete error: {e!r}")
 
     return {"ok": True, "deleted": True, "id": qid}
 
 
-# ---------- WebSocket broadcast (poll DB) ----------
+# ---------- WebSocket broadcast (feed de cambios) ----------
 
 clients: set[WebSocket] = set()
+fresh: set[WebSocket] = set()  # conectados que aún no recibieron snapshot
+
+# Con más cambios que esto, un snapshot sale más barato que el delta
+DELTA_MAX = 500
+
+
+def _queue_item(r: dict) -> dict:
+    """Fila de la cola para el panel, con título amistoso."""
+    # url/suggested_name son columnas generadas: sin json.loads por fila
+    title = r["suggested_name"] or r["url"] or ""
+    # Fallback amigable
+    if not title:
+        payload = r["payload"]
+        title = (payload[:60] + "…") if payload else "-"
+    return {
+        "id": r["id"],
+        "kind": r["kind"],
+        "status": r["status"],
+        "scheduled_at": r["scheduled_at"],
+        "title": title,
+        "host": r["host"],
+        "attempts": r["attempts"],
+        "last_error": r["last_error"],
+        "priority": r["priority"],
+    }
+
+
+def _snapshot(paused: bool) -> dict:
+    # El seq se lee antes que las filas: un cambio intermedio llega luego repetido, no perdido
+    seq = db_changes_head()
+    rows, _ = db_list_page(100)
+    return {
+        "type": "snapshot",
+        "seq": seq,
+        "status": {"paused": paused},
+        "queue": [_queue_item(r) for r in rows],
+        "progress": db_get_progress_rows(100),
+    }
+
+
+def _delta(changes: list, seq: int, paused: bool) -> dict:
+    q_ids = [qid for _, tbl, op, qid in changes if tbl == "queue" and op != "D"]
+    p_ids = [qid for _, tbl, op, qid in changes if tbl == "progress" and op != "D"]
+    queue_rows = [_queue_item(r) for r in db_get_queue_rows(q_ids)]
+    progress_rows = db_get_progress_for(p_ids)
+    # Lo que ya no existe (borrado después del cambio) también se retira
+    alive_q = {r["id"] for r in queue_rows}
+    alive_p = {r["qid"] for r in progress_rows}
+    return {
+        "type": "delta",
+        "seq": seq,
+        "status": {"paused": paused},
+        "queue": queue_rows,
+        "queue_removed": [
+            qid for _, tbl, _, qid in changes if tbl == "queue" and qid not in alive_q
+        ],
+        "progress": progress_rows,
+        "progress_removed": [
+            qid for _, tbl, _, qid in changes if tbl == "progress" and qid not in alive_p
+        ],
+    }
+
+
+async def _send(targets: set[WebSocket], payload: dict) -> None:
+    dead = []
+    for ws in list(targets):
+        try:
+            await ws.send_json(payload)
+        except Exception:
+            dead.append(ws)
+    for ws in dead:
+        clients.discard(ws)
+        fresh.discard(ws)
 
 
 async def broadcaster():
+    seq: int | None = None
+    paused: bool | None = None
     while True:
-        if clients:
-            # Construimos una "queue" con título amistoso
-            q_rows = []
-            for pid, kind, payload, status, sched, _ in db_get_queue(100):
-                title = ""
-                try:
-                    import json as _json
-
-                    d = _json.loads(payload or "{}")
-                    title = d.get("suggested_name") or d.get("url") or ""
-                except Exception:
-                    pass
-                # Fallback amigable
-                if not title:
-                    title = (payload[:60] + "…") if payload else "-"
-                q_rows.append(
-                    {
-                        "id": pid,
-                        "kind": kind,
-                        "status": status,
-                        "scheduled_at": sched,
-                        "title": title,
-                    }
-                )
-
-            payload = {
-                "type": "snapshot",
-                "status": {"paused": (db_get_flag("PAUSED", "0") == "1")},
-                "queue": q_rows,
-                "progress": db_get_progress_rows(100),
-            }
-
-            dead = []
-            for ws in clients:
-                try:
-                    await ws.send_json(payload)
-                except Exception:
-                    dead.append(ws)
-            for ws in dead:
-                try:
-                    clients.remove(ws)
-                except Exception:
-                    pass
+        if not clients:
+            seq = None
+            await asyncio.sleep(1.0)
+            continue
+        now_paused = db_get_flag("PAUSED", "0") == "1"
+        changes, head, reset = (
+            db_changes_since(seq, DELTA_MAX) if seq is not None else ([], 0, True)
+        )
+        if reset or len(changes) >= DELTA_MAX:
+            snap = _snapshot(now_paused)
+            fresh.clear()
+            await _send(clients, snap)
+            seq = snap["seq"]
+        else:
+            if fresh:
+                targets = set(fresh)
+                fresh.difference_update(targets)
+                await _send(targets, _snapshot(now_paused))
+            # Sin cambios ni cambio de pausa: no se envía nada
+            if changes or now_paused != paused:
+                await _send(clients - fresh, _delta(changes, head, now_paused))
+            seq = head
+        paused = now_paused
         await asyncio.sleep(1.0)
 
 
@@ -273,6 +453,7 @@ async def _bg():
 @app.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
     await ws.accept()
+    fresh.add(ws)
     clients.add(ws)
     try:
         while True:
@@ -281,10 +462,8 @@ async def ws_endpoint(ws: WebSocket):
     except WebSocketDisconnect:
         pass
     finally:
-        try:
-            clients.remove(ws)
-        except Exception:
-            pass
+        clients.discard(ws)
+        fresh.discard(ws)
 
 
 # ---------- UI HTML ----------
@@ -378,8 +557,6 @@ HTML = """
               <option value="queued">Estado: queued</option>
               <option value="running">Estado: running</option>
               <option value="paused">Estado: paused</option>
-              <option value="done">Estado: done</option>
-              <option value="error">Estado: error</option>
             </select>
           </div>
           <div class="chip">
@@ -387,6 +564,8 @@ HTML = """
           </div>
           <div class="chip" style="display:flex;gap:6px;align-items:center">
             <input id="enqText" type="text" placeholder="Pega enlaces aquí (t.me, http, magnet)..." style="min-width:320px"/>
+            <label title="Descargar aunque ya esté en cola o descargado"><input id="enqForce" type="checkbox"/> forzar</label>
+            <label title="Mayor = se descarga antes">prio <input id="enqPrio" type="number" value="0" style="width:56px"/></label>
             <button class="btn ok" onclick="enqueueLinks()">➕ Añadir</button>
           </div>
         </div>
@@ -474,6 +653,7 @@ function badge(status){
   const s = String(status||'').toLowerCase();
   if(s==='done')   return '<span class="badge b-ok">done</span>';
   if(s==='error')  return '<span class="badge b-err">error</span>';
+  if(s==='dead')   return '<span class="badge b-err">dead</span>';
   if(s==='paused') return '<span class="badge b-paused">paused</span>';
   if(s==='queued') return '<span class="badge b-queued">queued</span>';
   if(s==='running')return '<span class="badge b-running">running</span>';
@@ -486,7 +666,6 @@ const sdiv   = document.getElementById('status');
 const fltStatus = document.getElementById('fltStatus');
 const fltQuery  = document.getElementById('fltQuery');
 
-const prev = new Map(); // qid -> {bytes,time}
 let lastSnap = null;
 
 function renderQueue(rows){
@@ -499,8 +678,9 @@ function renderQueue(rows){
       <td>${safeTitle.replace(/</g,'&lt;')}</td>
       <td class="nowrap">${r.kind}</td>
       <td class="nowrap"><span class="muted">${r.scheduled_at||'-'}</span></td>
-      <td>${badge(r.status)}</td>
+      <td>${badge(r.status)}${r.attempts ? ` <span class="muted" title="${String(r.last_error||'').replace(/"/g,'&quot;').replace(/</g,'&lt;')}">×${r.attempts}</span>` : ''}</td>
       <td style="display:flex;gap:6px;flex-wrap:wrap">
+        <button class="btn ghost" title="Prioridad ${r.priority||0}" onclick="bumpItem(${r.id})">⏫ Priorizar</button>
         <button class="btn red" onclick="cancelItem(${r.id})">❌ Cancelar</button>
         <button class="btn ghost" onclick="deleteItem(${r.id})">🗑️ Eliminar</button>
       </td>`;
@@ -513,16 +693,9 @@ function renderProgress(rows){
   rows.forEach(r=>{
     const tr=document.createElement('tr');
 
-    // velocidad/eta (cliente)
-    const now = performance.now()/1000;
-    const key = r.qid;
-    const prevEntry = prev.get(key);
-    let speed = null, eta = null;
-    if(prevEntry && now - prevEntry.time > 0.5 && r.downloaded > 0){
-      speed = (r.downloaded - prevEntry.bytes) / (now - prevEntry.time);
-      if(r.total>0 && speed>0) eta = (r.total - r.downloaded) / speed;
-    }
-    prev.set(key, {bytes: r.downloaded, time: now});
+    // velocidad (EWMA) y ETA vienen del servidor
+    const speed = r.speed || null;
+    const eta = (r.eta_sec !== null && r.eta_sec !== undefined) ? r.eta_sec : null;
 
     const pcent = (r.total>0) ? (r.downloaded/r.total*100) : 0;
     const barCls = 'bar';
@@ -533,7 +706,7 @@ function renderProgress(rows){
       <td class="nowrap">${fmt(r.downloaded)} / ${fmt(r.total)}</td>
       <td class="nowrap">${pct(r.downloaded,r.total)}</td>
       <td class="nowrap">${speed ? fmt(speed) + '/s' : '-'}</td>
-      <td class="nowrap">${eta ? (eta>86400 ? '>' : '') + new Date(eta*1000).toISOString().substr(11,8) : '-'}</td>
+      <td class="nowrap">${eta !== null ? (eta>86400 ? '>' : '') + new Date(Math.min(eta,86399)*1000).toISOString().substr(11,8) : '-'}</td>
       <td class="muted nowrap">${r.updated_at}</td>`;
     ptbody.appendChild(tr);
   })
@@ -564,11 +737,35 @@ function renderLastSnap(){
   if(lastSnap) renderSnap(lastSnap);
 }
 
+// Aplica un delta del feed de cambios sobre el último snapshot
+function applyDelta(d){
+  if(!lastSnap) return;
+  const q = new Map((lastSnap.queue||[]).map(r=>[r.id, r]));
+  (d.queue_removed||[]).forEach(id=>q.delete(id));
+  (d.queue||[]).forEach(r=>q.set(r.id, r));
+  const p = new Map((lastSnap.progress||[]).map(r=>[r.qid, r]));
+  (d.progress_removed||[]).forEach(id=>p.delete(id));
+  (d.progress||[]).forEach(r=>p.set(r.qid, r));
+  lastSnap = {
+    type: 'snapshot',
+    seq: d.seq,
+    status: d.status || lastSnap.status,
+    queue: [...q.values()].sort((a,b)=>b.id-a.id).slice(0,100),
+    progress: [...p.values()].sort((a,b)=>String(b.updated_at).localeCompare(String(a.updated_at))).slice(0,100),
+  };
+}
+
 function connectWS(){
   const proto = (location.protocol==='https:'?'wss':'ws');
   const ws = new WebSocket(`${proto}://${location.host}/ws`);
   ws.onopen = ()=>{ setInterval(()=>{ try{ ws.send('ping') }catch(e){} }, 10000); };
-  ws.onmessage = (ev)=>{ try{ lastSnap = JSON.parse(ev.data); renderSnap(lastSnap);}catch(e){} };
+  ws.onmessage = (ev)=>{
+    try{
+      const msg = JSON.parse(ev.data);
+      if(msg.type==='delta') applyDelta(msg); else lastSnap = msg;
+      if(lastSnap) renderSnap(lastSnap);
+    }catch(e){}
+  };
   ws.onclose = ()=>{ setTimeout(connectWS, 1500); };
 }
 connectWS();
@@ -583,20 +780,29 @@ async function enqueueLinks(){
   const el = document.getElementById('enqText');
   const text = (el.value || '').trim();
   if(!text){ toast('Nada que encolar'); return; }
+  const force = document.getElementById('enqForce').checked;
+  const priority = parseInt(document.getElementById('enqPrio').value || '0', 10) || 0;
   const r = await fetch('/enqueue',{
     method:'POST',
     headers:{'x-panel-token':token,'Content-Type':'application/json'},
-    body: JSON.stringify({text})
+    body: JSON.stringify({text, force, priority})
   });
   const j = await r.json().catch(()=>({}));
   if(j.ok){
-    toast(`Encolados: ${j.added} (para ${j.scheduled_at || ''})`);
+    const dups = (j.existing || []).length;
+    toast(`Encolados: ${j.added} (para ${j.scheduled_at || ''})` + (dups ? ` · ${dups} ya existían` : ''));
     el.value = '';
   }else{
     toast('Error al encolar');
   }
 }
 
+async function bumpItem(id){
+  const r = await fetch('/priority/'+id,{method:'POST',headers:{'x-panel-token':token}});
+  const j = await r.json().catch(()=>({}));
+  toast(j.ok ? `Prioridad #${id}: ${j.priority}` : ('Error: ' + (j.detail || j.error || '')));
+}
+
 async function deleteItem(id){
   if(!confirm(`Eliminar definitivamente el #${id}?`)) return;
   const r = await fetch('/delete/'+id,{method:'POST',headers:{'x-panel-token':token}});
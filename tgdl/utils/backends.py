@@ -0,0 +1,90 @@
+"""
+Backend que atenderá un trabajo y su política de reintentos.
+
+- telegram: tg_ref / tg_link / self_ref (Telethon).
+- resolver: URLs que hay que resolver antes de descargar (MediaFire, SourceForge).
+- ytdlp: URLs de YouTube.
+- aria2: el resto de URLs (directas, magnets, .torrent).
+La política base sale de RETRY_* y se puede ajustar por backend con RETRY_BACKENDS.
+Cada backend tiene su propio cupo de trabajos simultáneos (BACKEND_LIMITS).
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Any
+
+from tgdl.config.settings import settings
+
+BACKENDS = ("telegram", "ytdlp", "aria2", "resolver")
+
+# Mismos patrones que usa el worker para elegir yt-dlp
+_YTDLP_MARKERS = (
+    "youtube.com/watch",
+    "youtu.be/",
+    "youtube.com/playlist",
+    "youtube.com/shorts",
+    "youtube.com/channel/",
+    "youtube.com/@",
+    "youtube.com/c/",
+)
+_RESOLVER_MARKERS = ("mediafire.com/file/", "sourceforge.net/")
+_TG_KINDS = ("tg_ref", "tg_link", "self_ref")
+
+
+def backend_for(kind: str, payload: dict[str, Any]) -> str:
+    # Mismo orden de decisión que el worker (un .torrent siempre va a aria2)
+    if kind in _TG_KINDS:
+        return "telegram"
+    low = str(payload.get("url") or "").lower()
+    if low.endswith(".torrent"):
+        return "aria2"
+    if any(m in low for m in _RESOLVER_MARKERS):
+        return "resolver"
+    if any(m in low for m in _YTDLP_MARKERS):
+        return "ytdlp"
+    return "aria2"
+
+
+def backend_sql(kind: str = "kind", url: str = "url") -> str:
+    """
+    backend_for como expresión SQL (columna generada queue.backend). LIKE ya ignora
+    mayúsculas ASCII, como el .lower() de arriba.
+    """
+
+    def any_like(markers: tuple[str, ...]) -> str:
+        return " OR ".join(f"{url} LIKE '%{m}%'" for m in markers)
+
+    kinds = ", ".join(f"'{k}'" for k in _TG_KINDS)
+    return (
+        f"CASE WHEN {kind} IN ({kinds}) THEN 'telegram' "
+        f"WHEN {url} LIKE '%.torrent' THEN 'aria2' "
+        f"WHEN {any_like(_RESOLVER_MARKERS)} THEN 'resolver' "
+        f"WHEN {any_like(_YTDLP_MARKERS)} THEN 'ytdlp' "
+        "ELSE 'aria2' END"
+    )
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int
+    base_sec: float
+    max_sec: float
+    jitter: float  # fracción: 0.25 => ±25 %
+
+    def delay_sec(self, attempt: int, rnd: float | None = None) -> float:
+        """Espera antes del reintento tras `attempt` fallos (1 = primer fallo)."""
+        base = min(self.max_sec, self.base_sec * (2 ** max(0, attempt - 1)))
+        r = random.random() if rnd is None else rnd
+        return max(0.0, base * (1 + self.jitter * (2 * r - 1)))
+
+
+def retry_policy(backend: str) -> RetryPolicy:
+    over = settings.RETRY_BACKENDS.get(backend, {})
+    return RetryPolicy(
+        max_attempts=int(over.get("max_attempts", settings.RETRY_MAX_ATTEMPTS)),
+        base_sec=float(over.get("base_sec", settings.RETRY_BASE_SEC)),
+        max_sec=float(over.get("max_sec", settings.RETRY_MAX_SEC)),
+        jitter=float(over.get("jitter", settings.RETRY_JITTER)),
+    )
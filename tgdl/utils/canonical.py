@@ -0,0 +1,126 @@
+"""
+Clave canónica de un trabajo para deduplicar al encolar.
+
+- YouTube: id de vídeo ("yt:<id>") o de lista ("ytpl:<list>") si se pidió la lista.
+- Magnet: infohash BTIH en hex minúsculas ("btih:<hash>"), ignora trackers y nombre.
+- Telegram: chat + mensaje ("tg:<chat>:<mid>"), venga de t.me o de un reenvío.
+- HTTP(S): host sin www, sin puerto por defecto, path sin "/" final, query ordenada
+  y sin parámetros de tracking ("url:<host><path>?<query>").
+Devuelve None cuando no hay nada razonable que comparar (p. ej. medios reenviados).
+"""
+
+from __future__ import annotations
+
+import base64
+import re
+from typing import Any
+from urllib.parse import parse_qsl, unquote, urlencode, urlparse
+
+_YT_HOSTS = {
+    "youtube.com",
+    "m.youtube.com",
+    "music.youtube.com",
+    "youtube-nocookie.com",
+}
+_YT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_YT_PATH_RE = re.compile(r"^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})")
+_BTIH_RE = re.compile(r"urn:btih:([A-Za-z0-9]+)", re.IGNORECASE)
+_TG_RE = re.compile(r"^/(c/)?([A-Za-z0-9_]+)/(?:\d+/)?(\d+)/?$")
+
+# Parámetros que no cambian el recurso descargado
+_TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "si", "feature", "ref_src"}
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _host(netloc_host: str | None) -> str:
+    h = (netloc_host or "").lower().rstrip(".")
+    return h[4:] if h.startswith("www.") else h
+
+
+def youtube_key(url: str, allow_playlist: bool = False) -> str | None:
+    u = urlparse(url)
+    host = _host(u.hostname)
+    q = dict(parse_qsl(u.query))
+    vid = None
+    if host == "youtu.be":
+        vid = u.path.strip("/").split("/")[0] or None
+    elif host in _YT_HOSTS:
+        if u.path == "/watch":
+            vid = q.get("v")
+        else:
+            m = _YT_PATH_RE.match(u.path)
+            vid = m.group(1) if m else None
+    else:
+        return None
+    lst = q.get("list")
+    if lst and (allow_playlist or not vid):
+        return f"ytpl:{lst}"
+    if vid and _YT_ID_RE.match(vid):
+        return f"yt:{vid}"
+    return None
+
+
+def magnet_key(uri: str) -> str | None:
+    m = _BTIH_RE.search(unquote(uri))
+    if not m:
+        return None
+    h = m.group(1)
+    if len(h) == 32:
+        # BTIH en base32 (v1 antiguo) -> hex
+        try:
+            h = base64.b32decode(h.upper()).hex()
+        except ValueError:
+            return None
+    return f"btih:{h.lower()}" if len(h) == 40 else None
+
+
+def telegram_key(url: str) -> str | None:
+    u = urlparse(url)
+    if _host(u.hostname) not in ("t.me", "telegram.me"):
+        return None
+    m = _TG_RE.match(u.path)
+    if not m:
+        return None
+    chat = f"-100{m.group(2)}" if m.group(1) else m.group(2).lower()
+    return f"tg:{chat}:{int(m.group(3))}"
+
+
+def http_key(url: str) -> str | None:
+    u = urlparse(url)
+    scheme = (u.scheme or "").lower()
+    if scheme not in _DEFAULT_PORTS or not u.hostname:
+        return None
+    host = _host(u.hostname)
+    if u.port and u.port != _DEFAULT_PORTS[scheme]:
+        host = f"{host}:{u.port}"
+    path = re.sub(r"/{2,}", "/", u.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    params = sorted(
+        (k, v)
+        for k, v in parse_qsl(u.query, keep_blank_values=True)
+        if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith("utm_")
+    )
+    query = urlencode(params)
+    return f"url:{host}{path}" + (f"?{query}" if query else "")
+
+
+def canonical_url(url: str, allow_playlist: bool = False) -> str | None:
+    url = (url or "").strip()
+    if not url:
+        return None
+    if url.lower().startswith("magnet:"):
+        return magnet_key(url)
+    return youtube_key(url, allow_playlist) or telegram_key(url) or http_key(url)
+
+
+def canonical_key(kind: str, payload: dict[str, Any]) -> str | None:
+    """Clave de deduplicación para (kind, payload) tal como se encola en `queue`."""
+    if kind == "tg_ref":
+        chat_id, mid = payload.get("chat_id"), payload.get("message_id")
+        if chat_id is None or mid is None:
+            return None
+        return f"tg:{str(chat_id).lower()}:{int(mid)}"
+    if kind in ("url", "tg_link"):
+        return canonical_url(str(payload.get("url") or ""), bool(payload.get("allow_playlist")))
+    return None
@@ -0,0 +1,43 @@
+"""
+Cortesía por sitio: cuántos trabajos pueden ir a la vez contra un mismo dominio.
+
+El límite se aplica al dominio registrable (download1.mediafire.com y
+www.mediafire.com cuentan juntos), compartido por resolvers, aria2 y yt-dlp.
+Por defecto HOST_LIMIT; se ajusta por dominio con HOST_LIMITS.
+Los trabajos de Telegram (Telethon) no cuentan: no van contra ningún host web.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+
+from tgdl.config.settings import settings
+
+# Segundos niveles habituales bajo un ccTLD (example.co.uk, example.com.ar, …)
+_SECOND_LEVEL = {"ac", "co", "com", "edu", "gob", "gov", "net", "or", "org"}
+# Dominios distintos que sirven al mismo sitio
+_ALIASES = {"youtu.be": "youtube.com", "googlevideo.com": "youtube.com"}
+
+
+def site_of(host: str | None) -> str:
+    """Dominio registrable de un host ('' si no hay host)."""
+    h = (host or "").strip().lower().rsplit("@", 1)[-1]
+    if h.startswith("["):  # IPv6 literal con puerto: [::1]:8080
+        return h[1 : h.find("]")] if "]" in h else h
+    h = h.split(":", 1)[0].rstrip(".")
+    if not h:
+        return ""
+    try:
+        ipaddress.ip_address(h)
+        return h
+    except ValueError:
+        pass
+    labels = h.split(".")
+    n = 3 if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL else 2
+    site = ".".join(labels[-n:])
+    return _ALIASES.get(site, site)
+
+
+def host_limit(site: str) -> int:
+    """Trabajos simultáneos permitidos contra `site` (0 = no arrancar nuevos)."""
+    return int(settings.HOST_LIMITS.get(site, settings.HOST_LIMIT))